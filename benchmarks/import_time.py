@@ -0,0 +1,78 @@
+"""Benchmark of the time it takes to import modev (and of the heavy libraries that are imported with it).
+
+Each measurement runs in a fresh python process. The script fails (exit code 1) if importing modev takes longer than a
+maximum time, or if it imports any of the heavy libraries that should only be imported when they are used.
+
+Usage:
+    python benchmarks/import_time.py [--statement "import modev"] [--n-runs 5] [--max-seconds 0.2]
+
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# Libraries that "import modev" should not import (they are imported on first use).
+heavy_modules = ['pandas', 'numpy', 'sklearn', 'scipy', 'plotly', 'pkg_resources', 'tqdm']
+
+_measure_script = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'modules': sorted(set(name.split('.')[0] for name in sys.modules))}}))
+"""
+
+
+def measure_import_time(statement='import modev', n_runs=5):
+    """Measure the time to run an import statement in fresh python processes.
+
+    Parameters
+    ----------
+    statement : str
+        Statement to run (e.g. "import modev").
+    n_runs : int
+        Number of measurements (each in a new process).
+
+    Returns
+    -------
+    times : list
+        Seconds taken by each run.
+    modules : list
+        Top-level modules imported after running the statement (in the last run).
+
+    """
+    times = []
+    modules = []
+    for _ in range(n_runs):
+        output = subprocess.run([sys.executable, '-c', _measure_script.format(statement=statement)], check=True,
+                                capture_output=True, text=True).stdout
+        measurement = json.loads(output.strip().splitlines()[-1])
+        times.append(measurement['elapsed'])
+        modules = measurement['modules']
+    return times, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--statement', default='import modev', help="Import statement to benchmark.")
+    parser.add_argument('--n-runs', type=int, default=5, help="Number of measurements.")
+    parser.add_argument('--max-seconds', type=float, default=0.2, help="Maximum accepted (best) import time.")
+    args = parser.parse_args()
+
+    times, modules = measure_import_time(args.statement, args.n_runs)
+    imported_heavy_modules = [module for module in heavy_modules if module in modules]
+    print(f"{args.statement!r}: best {min(times):.3f} s, median {sorted(times)[len(times) // 2]:.3f} s "
+          f"({args.n_runs} runs).")
+    failed = False
+    if min(times) > args.max_seconds:
+        print(f"Import time is larger than {args.max_seconds} s.")
+        failed = True
+    if args.statement == 'import modev' and len(imported_heavy_modules) > 0:
+        print(f"Heavy modules imported: {imported_heavy_modules}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
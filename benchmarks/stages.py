@@ -0,0 +1,341 @@
+"""Benchmark of each stage of the pipeline on synthetic data of growing size.
+
+Synthetic labelled datasets are generated (with a given number of rows, columns and cardinality of categorical columns
+and labels), and each stage is timed separately, with approaches.DummyPredictor as the only approach (so that the cost
+of modev itself is isolated from the cost of models):
+* Stages that depend on the size of the data (run for each number of rows, columns and cardinality):
+    * load: etl.load_local_file (on a csv file written beforehand).
+    * k_fold_split, repeated_k_fold_split, temporal_window_split: validation splitters.
+    * run_experiment: execution.run_experiment (overhead of running a small grid of dummy predictors on all folds).
+    * run_experiment_lean: the same, in lean execution mode.
+    * evaluate: evaluation.evaluate_predictions.
+* Stages that depend on the number of models (run for each number of models):
+    * grid_search: initialisation of exploration.GridSearch.
+    * model_selection: selection.model_selection.
+    * plot_results: plotting.metrics_vs_folds (without showing or saving the figure).
+
+For each stage, the best time of a few repeats and the peak of memory allocated (measured with tracemalloc, in a
+separate run) are reported and saved in a json file, which can be compared with a previous one to detect regressions.
+
+Usage:
+    python benchmarks/stages.py --sizes 10000 100000 --output benchmark.json
+    python benchmarks/stages.py --sizes 10000 100000 --compare benchmark.json --tolerance 0.2
+
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import modev
+from modev import approaches
+from modev import default_pars
+from modev import etl
+from modev import evaluation
+from modev import execution
+from modev import exploration
+from modev import plotting
+from modev import selection
+from modev import validation
+
+target = 'label'
+time_column = 'time'
+data_stages = ['load', 'k_fold_split', 'repeated_k_fold_split', 'temporal_window_split', 'run_experiment',
+               'run_experiment_lean', 'evaluate']
+models_stages = ['grid_search', 'model_selection', 'plot_results']
+metrics = ['accuracy', 'precision', 'recall']
+
+
+def make_synthetic_data(n_rows, n_columns, cardinality, random_state=default_pars.random_state):
+    """Generate a synthetic labelled dataset.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of rows.
+    n_columns : int
+        Number of predictor columns (half of them numerical and half categorical).
+    cardinality : int
+        Number of different values of categorical columns and of the label.
+    random_state : int
+        Random state.
+
+    Returns
+    -------
+    data : pd.DataFrame
+        Data with columns 'time' (sorted integers), 'label', 'numerical_*' and 'categorical_*'.
+
+    """
+    random_generator = np.random.default_rng(random_state)
+    values = np.array([f'value_{i}' for i in range(cardinality)])
+    columns = {time_column: np.arange(n_rows), target: values[random_generator.integers(cardinality, size=n_rows)]}
+    for i in range(n_columns):
+        if i % 2 == 0:
+            columns[f'numerical_{i}'] = random_generator.random(n_rows)
+        else:
+            columns[f'categorical_{i}'] = values[random_generator.integers(cardinality, size=n_rows)]
+    data = pd.DataFrame(columns)
+    return data
+
+
+def make_synthetic_results(n_models, n_folds, random_state=default_pars.random_state):
+    """Generate synthetic results of an experiment (as returned by execution.run_experiment).
+
+    Parameters
+    ----------
+    n_models : int
+        Number of models (combinations of approach and parameters).
+    n_folds : int
+        Number of folds.
+    random_state : int
+        Random state.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        Results with one row per model and fold.
+
+    """
+    random_generator = np.random.default_rng(random_state)
+    n_rows = n_models * n_folds
+    ids = np.repeat(np.arange(n_models), n_folds)
+    results = pd.DataFrame({default_pars.pars_key: [{'dummy_prediction': int(i)} for i in ids],
+                            default_pars.approach_key: 'dummy_predictor',
+                            default_pars.id_key: ids,
+                            default_pars.fold_key: np.tile(np.arange(n_folds), n_models),
+                            default_pars.executed_key: True})
+    for metric in metrics:
+        results[metric] = random_generator.random(n_rows)
+    return results
+
+
+def measure(function, repeats=3, memory=True):
+    """Measure the time and the peak of memory allocated by a function.
+
+    Parameters
+    ----------
+    function : function
+        Function to run (without arguments).
+    repeats : int
+        Number of times the function is timed (the best time is returned).
+    memory : bool
+        True to run the function once more with tracemalloc, to measure the peak of allocated memory.
+
+    Returns
+    -------
+    measurement : dict
+        Best time (in seconds) and peak of allocated memory (in bytes, or None if 'memory' is False).
+
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    peak_memory = None
+    if memory:
+        # Tracing allocations slows down the function, so memory is measured in a separate (untimed) run.
+        tracemalloc.start()
+        function()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    measurement = {'time': min(times), 'peak_memory': peak_memory}
+    return measurement
+
+
+def _get_data_stages(data, data_file, n_folds):
+    train_indexes, test_indexes = validation.k_fold_playground_n_tests_split(data, playground_n_folds=n_folds,
+                                                                             labels=None, positional=True)
+    approaches_function = {'dummy_predictor': approaches.DummyPredictor}
+    approaches_pars = {'dummy_predictor': {'dummy_prediction': [f'value_{i}' for i in range(4)]}}
+    execution_results = {default_pars.truth_key: data[target].to_numpy(),
+                         default_pars.prediction_key: np.roll(data[target].to_numpy(), 1)}
+    return {
+        'load': lambda: etl.load_local_file(data_file),
+        'k_fold_split': lambda: validation.k_fold_playground_n_tests_split(data, playground_n_folds=n_folds,
+                                                                           labels=None),
+        'repeated_k_fold_split': lambda: validation.repeated_k_fold_playground_n_tests_split(
+            data, playground_n_folds=n_folds, labels=None),
+        'temporal_window_split': lambda: validation.temporal_window_playground_n_tests_split(
+            data, time_column, min_n_train_examples=len(data) // (n_folds + 1), dev_n_sets=n_folds),
+        'run_experiment': lambda: execution.run_experiment(
+            data, train_indexes, test_indexes, execution.execute_model, {'target': target},
+            evaluation.evaluate_predictions, {'metrics': ['accuracy']}, exploration.GridSearch, approaches_function,
+            approaches_pars),
+        'run_experiment_lean': lambda: execution.run_experiment(
+            data, train_indexes, test_indexes, execution.execute_model, {'target': target},
+            evaluation.evaluate_predictions, {'metrics': ['accuracy']}, exploration.GridSearch, approaches_function,
+            approaches_pars, lean=True),
+        'evaluate': lambda: evaluation.evaluate_predictions(execution_results, metrics, average='micro'),
+    }
+
+
+def _get_models_stages(n_models, n_folds):
+    results = make_synthetic_results(n_models, n_folds)
+    approaches_pars = {'dummy_predictor': {'dummy_prediction': list(range(n_models))}}
+    return {
+        'grid_search': lambda: exploration.GridSearch(approaches_pars, list(range(n_folds))).initialise_results(),
+        'model_selection': lambda: selection.model_selection(results, main_metric=metrics[0]),
+        'plot_results': lambda: plotting.metrics_vs_folds(results, metrics, plot_file=None, show=False),
+    }
+
+
+def run_benchmarks(sizes, n_columns_list, cardinalities, n_models_list, n_folds=default_pars.validation_dev_n_sets,
+                   stages=None, repeats=3, memory=True):
+    """Run benchmarks of all stages for all combinations of sizes.
+
+    Parameters
+    ----------
+    sizes : list
+        Numbers of rows of synthetic datasets.
+    n_columns_list : list
+        Numbers of predictor columns of synthetic datasets.
+    cardinalities : list
+        Cardinalities of categorical columns (and labels) of synthetic datasets.
+    n_models_list : list
+        Numbers of models (for stages that depend on the number of models instead of the size of the data).
+    n_folds : int
+        Number of folds.
+    stages : list or None
+        Stages to benchmark; None to benchmark all of them.
+    repeats : int
+        Number of times each stage is timed.
+    memory : bool
+        True to measure the peak of allocated memory of each stage.
+
+    Returns
+    -------
+    benchmarks : list
+        One dictionary per stage and configuration, with the configuration, time and peak memory.
+
+    """
+    if stages is None:
+        stages = data_stages + models_stages
+    benchmarks = []
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        for n_rows in sizes:
+            for n_columns in n_columns_list:
+                for cardinality in cardinalities:
+                    if not any(stage in data_stages for stage in stages):
+                        continue
+                    data = make_synthetic_data(n_rows, n_columns, cardinality)
+                    data_file = os.path.join(temporary_dir, 'data.csv')
+                    if 'load' in stages:
+                        data.to_csv(data_file, index=False)
+                    configuration = {'n_rows': n_rows, 'n_columns': n_columns, 'cardinality': cardinality}
+                    for stage, function in _get_data_stages(data, data_file, n_folds).items():
+                        if stage in stages:
+                            benchmarks.append(_run_stage(stage, function, configuration, repeats, memory))
+    for n_models in n_models_list:
+        if not any(stage in models_stages for stage in stages):
+            continue
+        configuration = {'n_models': n_models, 'n_folds': n_folds}
+        for stage, function in _get_models_stages(n_models, n_folds).items():
+            if stage in stages:
+                benchmarks.append(_run_stage(stage, function, configuration, repeats, memory))
+    return benchmarks
+
+
+def _run_stage(stage, function, configuration, repeats, memory):
+    benchmark = dict(stage=stage, **configuration, **measure(function, repeats=repeats, memory=memory))
+    message = f"{stage} {configuration}: {benchmark['time']:.4f} s"
+    if benchmark['peak_memory'] is not None:
+        message += f", peak memory {benchmark['peak_memory'] / 2 ** 20:.1f} MB"
+    print(message, flush=True)
+    return benchmark
+
+
+def _get_configuration_key(benchmark):
+    return tuple(sorted((name, value) for name, value in benchmark.items() if name not in ['time', 'peak_memory']))
+
+
+def compare_benchmarks(benchmarks, baseline, tolerance=0.2, min_time=0.01):
+    """Compare benchmarks with those of a baseline (e.g. of a previous version).
+
+    Parameters
+    ----------
+    benchmarks : list
+        Benchmarks (as returned by run_benchmarks).
+    baseline : list
+        Benchmarks of baseline.
+    tolerance : float
+        Maximum accepted relative increase of time or peak memory (e.g. 0.2 means 20% slower).
+    min_time : float
+        Stages that took less than this number of seconds in the baseline are not considered regressions when they are
+        slower (since timings of very fast stages are dominated by noise).
+
+    Returns
+    -------
+    comparison : pd.DataFrame
+        Time and peak memory of each benchmark found in the baseline, their ratios, and whether it is a regression.
+
+    """
+    baseline = {_get_configuration_key(benchmark): benchmark for benchmark in baseline}
+    rows = []
+    for benchmark in benchmarks:
+        key = _get_configuration_key(benchmark)
+        if key not in baseline:
+            continue
+        row = dict(key)
+        regression = False
+        for quantity in ['time', 'peak_memory']:
+            if benchmark[quantity] is not None and baseline[key][quantity]:
+                row[f'{quantity}_ratio'] = benchmark[quantity] / baseline[key][quantity]
+                if quantity == 'time' and baseline[key][quantity] < min_time:
+                    continue
+                regression |= row[f'{quantity}_ratio'] > 1 + tolerance
+        row['regression'] = regression
+        rows.append(row)
+    comparison = pd.DataFrame(rows)
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7],
+                        help="Numbers of rows of synthetic datasets.")
+    parser.add_argument('--n-columns', type=int, nargs='+', default=[10], help="Numbers of predictor columns.")
+    parser.add_argument('--cardinalities', type=int, nargs='+', default=[10],
+                        help="Cardinalities of categorical columns and labels.")
+    parser.add_argument('--n-models', type=int, nargs='+', default=[100, 1000, 10000], help="Numbers of models.")
+    parser.add_argument('--n-folds', type=int, default=default_pars.validation_dev_n_sets, help="Number of folds.")
+    parser.add_argument('--stages', nargs='+', choices=data_stages + models_stages, help="Stages to benchmark.")
+    parser.add_argument('--repeats', type=int, default=3, help="Number of times each stage is timed.")
+    parser.add_argument('--no-memory', action='store_true', help="Do not measure peak memory.")
+    parser.add_argument('--output', help="Json file where benchmarks will be saved.")
+    parser.add_argument('--compare', help="Json file of baseline benchmarks to compare with.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Maximum accepted relative increase.")
+    parser.add_argument('--log-level', default='error', help="Logging level of modev (e.g. 'info').")
+    args = parser.parse_args()
+    logging.basicConfig()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    benchmarks = run_benchmarks(args.sizes, args.n_columns, args.cardinalities, args.n_models, n_folds=args.n_folds,
+                                stages=args.stages, repeats=args.repeats, memory=not args.no_memory)
+    if args.output is not None:
+        metadata = {'modev_version': modev.__version__, 'python_version': platform.python_version(),
+                    'pandas_version': pd.__version__, 'numpy_version': np.__version__,
+                    'platform': platform.platform(), 'date': datetime.datetime.now().isoformat()}
+        with open(args.output, 'w') as output_file:
+            json.dump({'metadata': metadata, 'benchmarks': benchmarks}, output_file, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['benchmarks']
+        comparison = compare_benchmarks(benchmarks, baseline, tolerance=args.tolerance)
+        print(comparison.to_string(index=False))
+        if len(comparison) > 0 and comparison['regression'].any():
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
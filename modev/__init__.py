@@ -1,15 +1,27 @@
-import modev.approaches
-import modev.common
-import modev.default_pars
-import modev.etl
-import modev.evaluation
-import modev.execution
-import modev.exploration
-from modev.pipeline import Pipeline
-import modev.plotting
-import modev.selection
-import modev.utils
-import modev.templates
-import modev.validation
-from modev._version import __version__
+"""Model Development for Data Science Projects.
+
+Submodules (and the heavy libraries they depend on, e.g. sklearn, scipy or plotly) are only imported when they are first
+accessed (e.g. modev.Pipeline or modev.validation), so that "import modev" is fast.
+
+"""
+import importlib
+
 __author__ = "Pablo Rosado"
+
+_submodules = ['approaches', 'batch', 'caching', 'cli', 'common', 'default_pars', 'distributed', 'etl', 'evaluation',
+               'execution', 'exploration', 'expressions', 'pipeline', 'plotting', 'preprocessing', 'scheduling',
+               'selection', 'storage', 'templates', 'utils', 'validation']
+# Attributes of modev that are defined in submodules.
+_attributes = {'Pipeline': 'pipeline', 'PipelineBatch': 'batch', '__version__': '_version'}
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f'{__name__}.{name}')
+    if name in _attributes:
+        return getattr(importlib.import_module(f'{__name__}.{_attributes[name]}'), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules) | set(_attributes))
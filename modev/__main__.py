@@ -0,0 +1,5 @@
+import sys
+
+from modev.cli import main
+
+sys.exit(main())
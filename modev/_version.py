@@ -1,3 +1,12 @@
-import pkg_resources
-# Load version given in setup.py.
-__version__ = pkg_resources.require("modev")[0].version
+# Load version given in setup.py (from the metadata of the installed package, which is much faster than pkg_resources).
+try:
+    from importlib import metadata
+except ImportError:
+    # Python < 3.8.
+    import pkg_resources
+    __version__ = pkg_resources.require("modev")[0].version
+else:
+    try:
+        __version__ = metadata.version("modev")
+    except metadata.PackageNotFoundError:
+        __version__ = "unknown"
@@ -7,6 +7,9 @@ from modev import default_pars
 
 
 class DummyPredictor:
+    # This approach reads no predictors (so they are not copied for each execution).
+    required_columns = []
+
     def __init__(self, dummy_prediction):
         """Predict always the same (a fixed prediction).
 
@@ -61,6 +64,9 @@ class DummyPredictor:
 
 
 class RandomChoicePredictor:
+    # This approach only reads the target of the train set.
+    required_columns = []
+
     def __init__(self, random_state=default_pars.random_state):
         """Predict a random value of the target column from the train set.
 
@@ -0,0 +1,156 @@
+"""Functions related to running many experiments (e.g. different templates) on the same data.
+
+Experiments with identical load inputs share the same data (loaded only once, and kept in memory only once), and those
+that also have identical validation inputs share the same split of data into train/dev/test sets (generated only once)
+and, if they have identical preprocessing inputs, the same preprocessed folds.
+Executions of all experiments can run in parallel in a single pool of processes, while each experiment keeps its own
+results (and its own results file or store, if any).
+
+"""
+import concurrent.futures
+import logging
+import time
+
+from modev import caching
+from modev import default_pars
+from modev import execution
+from modev import pipeline
+
+
+def _get_inputs_hash(function, pars):
+    return caching.get_hash([function, pars])
+
+
+def group_experiments(pipelines):
+    """Group experiments that share the same data and, within them, those that share the same split of data.
+
+    Parameters
+    ----------
+    pipelines : dict
+        Pipeline of each experiment, identified by its name.
+
+    Returns
+    -------
+    groups : dict
+        For each group of experiments with the same load inputs (identified by a hash of those inputs), a dictionary
+        that, for each group of experiments with the same validation inputs (identified by a hash of those inputs),
+        contains the list of names of those experiments.
+
+    """
+    groups = {}
+    for name, pipe in pipelines.items():
+        load_hash = _get_inputs_hash(pipe.load_function, pipe.load_pars)
+        validation_hash = _get_inputs_hash(pipe.validation_function, pipe.validation_pars)
+        groups.setdefault(load_hash, {}).setdefault(validation_hash, []).append(name)
+    return groups
+
+
+class PipelineBatch:
+    def __init__(self, experiments, n_jobs=default_pars.scheduling_pars_n_jobs, time_budget=None):
+        """Batch of model development pipelines, that share data and splits of data whenever possible.
+
+        Parameters
+        ----------
+        experiments : dict or list
+            Experiments, either as a dictionary of name and experiment, or as a list of experiments (that will be named
+            'experiment_0', 'experiment_1', ...). Each experiment is a dictionary of inputs of Pipeline (e.g.
+            templates.experiment_01.experiment).
+        n_jobs : int
+            Number of executions to run in parallel, in a single pool of processes shared by all experiments (if n_jobs
+            is 1, experiments are run one after another, each of them as specified by its own inputs).
+        time_budget : float or None
+            Maximum number of seconds to spend running executions of all experiments (counted from the moment
+            get_results is called); None for no limit (other than the time budget of each experiment, if any).
+
+        Methods
+        -------
+        get_data
+            Load data of all experiments (once for each group of experiments with the same load inputs).
+        get_indexes
+            Split data of all experiments (once for each group of experiments with the same load and validation
+            inputs).
+        get_results
+            Run executions of all experiments.
+        get_selected_models
+            Select models of each experiment.
+        run
+            Run all the above.
+
+        Examples
+        --------
+        To run the template experiments (and the default one), loading data and splitting it into folds only once
+        for experiments that share the same inputs:
+        >>> batch = PipelineBatch({'default': {}, 'experiment_01': templates.experiment_01.experiment,
+        ...                        'experiment_02': templates.experiment_02.experiment}, n_jobs=4)
+        >>> rankings = batch.run()
+        To access the pipeline of one of the experiments:
+        >>> batch.pipelines['experiment_01'].get_results()
+
+        """
+        if isinstance(experiments, (list, tuple)):
+            experiments = {f'experiment_{i}': experiment for i, experiment in enumerate(experiments)}
+        self.pipelines = {name: pipeline.Pipeline(**experiment) for name, experiment in experiments.items()}
+        self.n_jobs = n_jobs
+        self.time_budget = time_budget
+        self.groups = group_experiments(self.pipelines)
+
+    def get_data(self, reload=False):
+        for split_groups in self.groups.values():
+            names = [name for split_group in split_groups.values() for name in split_group]
+            data = self.pipelines[names[0]].get_data(reload=reload)
+            logging.info("Sharing data among experiments: %s", names)
+            for name in names[1:]:
+                self.pipelines[name].data = data
+        return {name: pipe.data for name, pipe in self.pipelines.items()}
+
+    def get_indexes(self, reload=False):
+        for split_groups in self.groups.values():
+            for names in split_groups.values():
+                first = self.pipelines[names[0]]
+                first.get_indexes(reload=reload)
+                preprocessors = {}
+                for name in names:
+                    pipe = self.pipelines[name]
+                    pipe.train_indexes, pipe.test_indexes = first.train_indexes, first.test_indexes
+                    pipe.split_hash = first.split_hash
+                    if pipe.preprocessor is not None:
+                        # Experiments with the same split and preprocessing also share preprocessed folds.
+                        preprocessor_hash = caching.get_hash([pipe.preprocessor.get_description(),
+                                                              pipe.preprocessor.target])
+                        pipe.preprocessor = preprocessors.setdefault(preprocessor_hash, pipe.preprocessor)
+                        pipe.preprocessor.clear()
+        return {name: (pipe.train_indexes, pipe.test_indexes) for name, pipe in self.pipelines.items()}
+
+    def get_results(self, reload=False):
+        deadline = None if self.time_budget is None else time.time() + self.time_budget
+        if self.n_jobs <= 1:
+            for pipe in self.pipelines.values():
+                pipe.get_results(reload=reload, deadline=deadline)
+        else:
+            # All processes of the pool receive the payload of all experiments (that share data and indexes) once, and
+            # each experiment sends its executions to the pool from a separate thread.
+            payloads = {name: pipe.get_execution_payload() for name, pipe in self.pipelines.items()}
+            with execution.create_process_pool(payloads, self.n_jobs) as pool, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=len(self.pipelines)) as threads:
+                futures = [threads.submit(pipe.get_results, reload=reload, pool=pool, pool_payload_name=name,
+                                          deadline=deadline)
+                           for name, pipe in self.pipelines.items()]
+                for future in futures:
+                    future.result()
+        return {name: pipe.results for name, pipe in self.pipelines.items()}
+
+    def get_selected_models(self, reload=False):
+        return {name: pipe.get_selected_models(reload=reload) for name, pipe in self.pipelines.items()}
+
+    def run(self, reload=False):
+        self.get_data(reload)
+
+        self.get_indexes(reload)
+
+        self.get_results(reload)
+
+        rankings = self.get_selected_models(reload)
+
+        logging.info('Batch of %i experiments executed successfully', len(self.pipelines))
+
+        return rankings
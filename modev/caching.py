@@ -0,0 +1,437 @@
+"""Functions related to caching intermediate results of the pipeline (e.g. splits of data into train/dev/test sets).
+
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+
+from modev import common
+from modev import default_pars
+
+# Separator of set name and fold in the names of arrays stored in split cache files (e.g. 'train__0').
+_split_array_separator = '__'
+
+
+def _hash_values(values):
+    # Vectorised hash of an array of values of any type (including objects), combined into one hash.
+    return hashlib.sha1(pd.util.hash_array(np.asarray(values)).view(np.uint8)).hexdigest()
+
+
+def _get_code_representation(code):
+    # Bytecode, names and constants of a code object (including the code objects of nested functions). Constant sets
+    # (e.g. of "x in {'a', 'b'}") are sorted, since their order depends on the session.
+    constants = [_get_code_representation(constant) if isinstance(constant, types.CodeType) else
+                 str(sorted(repr(element) for element in constant)) if isinstance(constant, frozenset) else
+                 repr(constant) for constant in code.co_consts]
+    return f"{code.co_code.hex()}|{','.join(code.co_names)}|{';'.join(constants)}"
+
+
+def _get_function_representation(function):
+    # Code of a function, and values that it captures (in its closure) or uses as defaults. Classes are represented by
+    # name, since methods capture their own class (e.g. to call super()).
+    captured = list(function.__defaults__ or [])
+    for cell in function.__closure__ or []:
+        try:
+            captured.append(cell.cell_contents)
+        except ValueError:
+            # Empty cell (e.g. of a variable that is not assigned yet).
+            captured.append(None)
+    captured = [f'{value.__module__}.{value.__qualname__}' if isinstance(value, type) else
+                'self' if value is function else get_canonical_representation(value) for value in captured]
+    return f"{_get_code_representation(function.__code__)}|{';'.join(captured)}"
+
+
+def _get_definition_hash(value):
+    # Hash of the definition of a function or a class that cannot be identified by its name (a lambda, or a function or
+    # class defined inside a function), or None if it has no code (e.g. if it is implemented in C).
+    if isinstance(value, type):
+        members = []
+        for name, member in sorted(vars(value).items()):
+            if name in ('__dict__', '__doc__', '__module__', '__qualname__', '__weakref__'):
+                continue
+            member = getattr(member, '__func__', getattr(member, 'fget', member))
+            if isinstance(member, types.FunctionType):
+                members.append(f'{name}: {_get_function_representation(member)}')
+            else:
+                members.append(f'{name}: {get_canonical_representation(member)}')
+        bases = [get_canonical_representation(base) for base in value.__bases__]
+        representation = f"{';'.join(bases)}|{';'.join(members)}"
+    else:
+        function = getattr(value, '__func__', value)
+        if not isinstance(function, types.FunctionType):
+            return None
+        representation = _get_function_representation(function)
+    return hashlib.sha1(representation.encode()).hexdigest()
+
+
+def get_canonical_representation(value):
+    """Get a representation of a value that does not depend on the session (e.g. on memory addresses or on the order
+    of keys in a dictionary).
+
+    Functions and classes are represented by their full name, except lambdas and functions or classes defined inside
+    functions (that can have the same name but different code), which are also represented by a hash of their code.
+    Objects without a representation of their own are represented by their class and either their parameters (as
+    returned by their 'get_params' method) or their attributes.
+
+    Parameters
+    ----------
+    value : object
+        Any value (e.g. a parameter of a function).
+
+    Returns
+    -------
+    representation : str
+        Canonical representation of the value.
+
+    """
+    if isinstance(value, dict):
+        items = sorted((str(key), get_canonical_representation(value[key])) for key in value)
+        return '{' + ', '.join(f'{key}: {item}' for key, item in items) + '}'
+    elif isinstance(value, (list, tuple)):
+        return '[' + ', '.join(get_canonical_representation(element) for element in value) + ']'
+    elif isinstance(value, (np.ndarray, pd.Series, pd.Index)):
+        return f'array({len(value)}, {_hash_values(value)})'
+    elif callable(value) and hasattr(value, '__qualname__'):
+        # Functions and classes are represented by their full name (and version, if they have one).
+        name = f"{getattr(value, '__module__', '')}.{value.__qualname__}"
+        if '<lambda>' in name or '<locals>' in name:
+            definition_hash = _get_definition_hash(value)
+            if definition_hash is None:
+                logging.warning("%s cannot be identified by its name or its code; its hash may be shared by other "
+                                "functions.", name)
+            else:
+                name = f'{name}#{definition_hash}'
+        version = getattr(value, '__version__', None)
+        return name if version is None else f'{name}=={version}'
+    elif type(value).__repr__ is object.__repr__:
+        # The default representation of objects contains their memory address, so objects are represented by their
+        # class and their parameters (e.g. of scikit-learn estimators) or, otherwise, their attributes.
+        name = get_canonical_representation(type(value))
+        if callable(getattr(value, 'get_params', None)):
+            return f'{name}({get_canonical_representation(value.get_params())})'
+        elif hasattr(value, '__dict__'):
+            return f'{name}({get_canonical_representation(vars(value))})'
+        logging.warning("Object %r has no canonical representation; its hash will differ between sessions.", value)
+    return repr(value)
+
+
+def get_hash(value):
+    return hashlib.sha1(get_canonical_representation(value).encode()).hexdigest()
+
+
+def get_approach_identity(approach_function):
+    """Get the identity of an approach, given by its full name and its version.
+
+    The version is taken from the '__version__' attribute of the approach or, if it does not exist, from the package
+    where the approach is defined (e.g. the version of scikit-learn for its models).
+
+    Parameters
+    ----------
+    approach_function : class or function
+        Approach.
+
+    Returns
+    -------
+    identity : str
+        Identity of the approach.
+
+    """
+    identity = get_canonical_representation(approach_function)
+    if getattr(approach_function, '__version__', None) is None:
+        package = sys.modules.get(getattr(approach_function, '__module__', '').split('.')[0])
+        package_version = getattr(package, '__version__', None)
+        if package_version is not None:
+            identity = f'{identity}=={package_version}'
+    return identity
+
+
+def get_fold_hashes(train_indexes, test_indexes):
+    """Get a hash of the indexes of each fold.
+
+    Parameters
+    ----------
+    train_indexes : dict
+        Indexes to use for training on the different folds.
+    test_indexes : dict
+        Indexes to use for evaluating (either dev or test) on the different folds.
+
+    Returns
+    -------
+    fold_hashes : dict
+        Hash of the train and test indexes of each fold.
+
+    """
+    fold_hashes = {}
+    for fold in test_indexes:
+        # In test mode, there is only one train set (the playground) for all test sets.
+        fold_train_indexes = train_indexes[0] if len(train_indexes) == 1 else train_indexes[fold]
+        fold_hash = []
+        for indexes, fold_indexes in [(train_indexes, fold_train_indexes), (test_indexes, test_indexes[fold])]:
+            description = getattr(indexes, 'description', None)
+            if description is not None:
+                # Folds that are generated on demand are identified by their description (without generating them).
+                fold_hash.append(f'{description}: {fold}')
+            else:
+                kind = 'positions' if isinstance(fold_indexes, common.Positions) else 'labels'
+                fold_hash.append(f'{kind}: {_hash_values(fold_indexes)}')
+        fold_hashes[fold] = hashlib.sha1(' | '.join(fold_hash).encode()).hexdigest()
+    return fold_hashes
+
+
+def get_execution_keys(pars_folds, approaches_function, fold_hashes, settings):
+    """Get a key for each execution (an approach with certain parameters on a certain fold), given by a hash of
+    everything that determines its results.
+
+    The key of an execution depends on the approach name, the approach identity (see get_approach_identity), its
+    parameters, the indexes of the fold, and any other settings that affect results (e.g. the execution and evaluation
+    functions and their parameters). It does not depend on the position of the execution in the grid of parameters,
+    so results can be reused after editing the grid, or in a different experiment.
+
+    Parameters
+    ----------
+    pars_folds : pd.DataFrame
+        Executions (with one row per approach, parameters and fold).
+    approaches_function : dict
+        Approaches (e.g. classes), for each approach name.
+    fold_hashes : dict
+        Hash of the indexes of each fold (see get_fold_hashes).
+    settings : object
+        Any other settings that affect results.
+
+    Returns
+    -------
+    keys : list
+        Key of each execution.
+
+    """
+    settings_hash = get_hash(settings)
+    approaches_identity = {name: get_approach_identity(approaches_function[name]) for name in approaches_function}
+    pars_hashes = {}
+    keys = []
+    for approach_name, pars, fold in zip(pars_folds[default_pars.approach_key], pars_folds[default_pars.pars_key],
+                                         pars_folds[default_pars.fold_key]):
+        pars_representation = get_canonical_representation(pars)
+        if pars_representation not in pars_hashes:
+            pars_hashes[pars_representation] = hashlib.sha1(pars_representation.encode()).hexdigest()
+        key = f'{approach_name} | {approaches_identity.get(approach_name)} | {pars_hashes[pars_representation]} | ' \
+              f'{fold_hashes[fold]} | {settings_hash}'
+        keys.append(hashlib.sha1(key.encode()).hexdigest())
+    return keys
+
+
+def get_data_fingerprint(data, n_sample_rows=default_pars.caching_pars_n_sample_rows):
+    """Get a fast fingerprint of a dataframe.
+
+    The fingerprint takes into account the shape, column names and types, the full index, and the values of a sample of
+    rows (evenly spaced along the data). It is not a full hash of the data, but it is fast to compute even on large
+    dataframes, and it changes whenever rows are added, removed, reordered or reindexed.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data.
+    n_sample_rows : int
+        Maximum number of rows whose values are included in the fingerprint.
+
+    Returns
+    -------
+    fingerprint : str
+        Fingerprint of the data.
+
+    """
+    step = max(1, len(data) // n_sample_rows)
+    sample = data.iloc[::step]
+    fingerprint = hashlib.sha1()
+    fingerprint.update(repr((data.shape, list(data.columns), [str(dtype) for dtype in data.dtypes])).encode())
+    fingerprint.update(_hash_values(data.index).encode())
+    fingerprint.update(pd.util.hash_pandas_object(sample, index=False).to_numpy().view(np.uint8))
+    return fingerprint.hexdigest()
+
+
+def get_indexes_hash(train_indexes, test_indexes):
+    """Get a hash of the content of a split of data into train and test sets.
+
+    Parameters
+    ----------
+    train_indexes : dict
+        Indexes to use for training on the different folds.
+    test_indexes : dict
+        Indexes to use for evaluating (either dev or test) on the different folds.
+
+    Returns
+    -------
+    indexes_hash : str
+        Hash of all indexes.
+
+    """
+    indexes_hash = hashlib.sha1()
+    for set_name, indexes in [(default_pars.train_key, train_indexes), (default_pars.test_key, test_indexes)]:
+        description = getattr(indexes, 'description', None)
+        if description is not None:
+            # Folds that are generated on demand are identified by their description.
+            indexes_hash.update(f'{set_name}: {description}'.encode())
+            continue
+        for fold, fold_indexes in indexes.items():
+            kind = 'positions' if isinstance(fold_indexes, common.Positions) else 'labels'
+            indexes_hash.update(f'{set_name}_{fold}_{kind}'.encode())
+            indexes_hash.update(_hash_values(fold_indexes).encode())
+    return indexes_hash.hexdigest()
+
+
+def get_split_cache_file(split_cache_dir, data, validation_function, validation_pars):
+    key = get_hash([get_data_fingerprint(data), validation_function, validation_pars])
+    return os.path.join(split_cache_dir, f'split_{key}.npz')
+
+
+def _get_files_stats(value):
+    # Path, size and modification time of files referred to by a value (e.g. the 'data_file' argument of a load
+    # function), so that cached data is not used after those files change.
+    if isinstance(value, dict):
+        return [_get_files_stats(value[key]) for key in sorted(value, key=str)]
+    elif isinstance(value, (list, tuple)):
+        return [_get_files_stats(element) for element in value]
+    elif isinstance(value, str) and os.path.isfile(value):
+        stats = os.stat(value)
+        return [os.path.abspath(value), stats.st_size, stats.st_mtime_ns]
+    return None
+
+
+def get_data_cache_file(data_cache_dir, load_function, load_pars):
+    key = get_hash([load_function, load_pars, _get_files_stats(load_pars)])
+    return os.path.join(data_cache_dir, f'data_{key}.pkl')
+
+
+def save_data(data_cache_file, data):
+    """Save data (as returned by a load function) in a pickle file, that is faster to load than the original data.
+
+    Parameters
+    ----------
+    data_cache_file : str
+        Path to data cache file.
+    data : pd.DataFrame
+        Data.
+
+    """
+    data_cache_dir = os.path.dirname(data_cache_file)
+    if data_cache_dir != '' and not os.path.isdir(data_cache_dir):
+        logging.info("Creating folder for data cache: %s", data_cache_dir)
+        os.makedirs(data_cache_dir)
+    # Write to a temporary file first, so that other processes never read a partially written file.
+    temporary_file = data_cache_file + f'.{os.getpid()}.tmp'
+    pd.to_pickle(data, temporary_file)
+    os.replace(temporary_file, data_cache_file)
+
+
+def load_data(data_cache_file):
+    return pd.read_pickle(data_cache_file)
+
+
+def save_split(split_cache_file, train_indexes, test_indexes):
+    """Save a split of data into train and test sets in a compressed (.npz) file.
+
+    Parameters
+    ----------
+    split_cache_file : str
+        Path to split cache file.
+    train_indexes : dict
+        Indexes to use for training on the different folds.
+    test_indexes : dict
+        Indexes to use for evaluating (either dev or test) on the different folds.
+
+    Returns
+    -------
+    saved : bool
+        True if split was saved; False if it could not be saved (e.g. because folds are generated on demand).
+
+    """
+    if not (isinstance(train_indexes, dict) and isinstance(test_indexes, dict)):
+        logging.info("Split is not cached, since its folds are generated on demand.")
+        return False
+    arrays = {}
+    # Populations of complements of positions are saved once (since they are usually shared by several folds).
+    populations = {}
+    for set_name, indexes in [(default_pars.train_key, train_indexes), (default_pars.test_key, test_indexes)]:
+        for fold, fold_indexes in indexes.items():
+            if isinstance(fold_indexes, common.ComplementPositions):
+                population = populations.setdefault(id(fold_indexes.population_bits), len(populations))
+                arrays[_split_array_separator.join(['population', str(population), 'bits'])] = \
+                    fold_indexes.population_bits
+                arrays[_split_array_separator.join([set_name, str(fold), 'complement_population'])] = \
+                    np.array([population, fold_indexes.population_size], dtype=np.int64)
+                kind, fold_array = 'complement', fold_indexes.excluded.get_positions()
+            else:
+                kind = 'positions' if isinstance(fold_indexes, common.Positions) else 'labels'
+                fold_array = np.asarray(fold_indexes)
+            if fold_array.dtype == object:
+                logging.info("Split is not cached, since indexes are not numeric.")
+                return False
+            arrays[_split_array_separator.join([set_name, str(fold), kind])] = fold_array
+    split_cache_dir = os.path.dirname(split_cache_file)
+    if split_cache_dir != '' and not os.path.isdir(split_cache_dir):
+        logging.info("Creating folder for split cache: %s", split_cache_dir)
+        os.makedirs(split_cache_dir)
+    # Write to a temporary file first, so that other processes never read a partially written file.
+    temporary_file = split_cache_file + f'.{os.getpid()}.tmp.npz'
+    np.savez_compressed(temporary_file, **arrays)
+    os.replace(temporary_file, split_cache_file)
+    return True
+
+
+def load_split(split_cache_file):
+    """Load a split of data into train and test sets from a split cache file (as saved by save_split).
+
+    Parameters
+    ----------
+    split_cache_file : str
+        Path to split cache file.
+
+    Returns
+    -------
+    train_indexes : dict
+        Indexes to use for training on the different folds.
+    test_indexes : dict
+        Indexes to use for evaluating (either dev or test) on the different folds.
+
+    """
+    indexes = {default_pars.train_key: {}, default_pars.test_key: {}}
+    with np.load(split_cache_file, allow_pickle=False) as arrays:
+        names = [name.split(_split_array_separator) for name in arrays.files]
+        populations = {int(population): arrays[_split_array_separator.join([set_name, population, kind])]
+                       for set_name, population, kind in names if set_name == 'population'}
+        for set_name, fold, kind in names:
+            if set_name == 'population' or kind == 'complement_population':
+                continue
+            fold_indexes = arrays[_split_array_separator.join([set_name, fold, kind])]
+            if kind == 'positions':
+                fold_indexes = common.Positions(fold_indexes)
+            elif kind == 'complement':
+                population, population_size = arrays[_split_array_separator.join(
+                    [set_name, fold, 'complement_population'])].tolist()
+                fold_indexes = common.ComplementPositions(populations[population], population_size,
+                                                          common.Positions(fold_indexes))
+            indexes[set_name][int(fold)] = fold_indexes
+    return indexes[default_pars.train_key], indexes[default_pars.test_key]
+
+
+def _get_results_metadata_file(results_file):
+    return results_file + '.meta.json'
+
+
+def save_results_metadata(results_file, metadata):
+    with open(_get_results_metadata_file(results_file), 'w') as output:
+        json.dump(metadata, output, indent=2, sort_keys=True)
+
+
+def load_results_metadata(results_file):
+    metadata_file = _get_results_metadata_file(results_file)
+    if not os.path.isfile(metadata_file):
+        return {}
+    with open(metadata_file) as input_file:
+        metadata = json.load(input_file)
+    return metadata
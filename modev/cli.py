@@ -0,0 +1,163 @@
+"""Command line interface of modev.
+
+Usage (see "modev --help"):
+    modev run <experiment_file> [<experiment_file> ...]  Run experiments defined in python files.
+    modev worker <database>  Run pending executions of experiments published in a database (see distributed).
+
+Exit codes of "modev run": 0 if all executions were run, 1 if the run failed, and 3 if executions were left because
+the time budget was exhausted (they will be run by running the same command again with --resume).
+
+"""
+import argparse
+import cProfile
+import logging
+import os
+import sys
+
+from modev import batch
+from modev import default_pars
+from modev import distributed
+from modev import storage
+from modev import utils
+
+# Exit code of "modev run" when some executions were not run because the time budget was exhausted.
+exit_code_incomplete = 3
+
+
+def _load_experiments(experiment_files, variable):
+    experiments = {}
+    for experiment_file in experiment_files:
+        name = os.path.splitext(os.path.basename(experiment_file))[0]
+        if name in experiments:
+            name = f'{name}_{len(experiments)}'
+        module_name = f'modev_experiment_{len(experiments)}'
+        module = utils.import_file_as_module(experiment_file, module_name=module_name)
+        # Register module, so that approaches defined in it can be pickled (e.g. to run them in forked processes).
+        sys.modules[module_name] = module
+        if not hasattr(module, variable):
+            raise ValueError(f"Experiment file {experiment_file} does not define variable {variable!r}.")
+        experiments[name] = dict(getattr(module, variable))
+    return experiments
+
+
+def _add_run_options(experiments, args):
+    # Options given in the command line override those given in experiment files.
+    for name, experiment in experiments.items():
+        if args.results_store is not None:
+            experiment['results_store'] = args.results_store
+            experiment['experiment_name'] = name
+        if args.results_dir is not None:
+            experiment['results_file'] = os.path.join(args.results_dir, f'{name}.csv')
+        for option in ['data_cache_dir', 'split_cache_dir']:
+            if getattr(args, option) is not None:
+                experiment[option] = getattr(args, option)
+        if args.lean:
+            experiment['lean_execution'] = True
+    return experiments
+
+
+def _run_batch(pipeline_batch, resume):
+    pipeline_batch.get_data()
+    pipeline_batch.get_indexes()
+    # Unless resuming, results of previous runs (in results files or store) are ignored (and overwritten).
+    pipeline_batch.get_results(reload=not resume)
+    # Models can only be selected for experiments with results (e.g. not if the time budget was exhausted before).
+    rankings = {name: pipe.get_selected_models(reload=True) for name, pipe in pipeline_batch.pipelines.items()
+                if pipe.results[default_pars.executed_key].astype(bool).any()}
+    return rankings
+
+
+def _run(args):
+    experiments = _add_run_options(_load_experiments(args.experiment_files, args.variable), args)
+    if args.results_dir is not None:
+        os.makedirs(args.results_dir, exist_ok=True)
+    pipeline_batch = batch.PipelineBatch(experiments, n_jobs=args.n_jobs, time_budget=args.time_budget)
+    if args.profile is None:
+        rankings = _run_batch(pipeline_batch, args.resume)
+    else:
+        # Only the main thread of the current process is profiled (so, if n_jobs > 1, executions are not profiled).
+        profile = cProfile.Profile()
+        rankings = profile.runcall(_run_batch, pipeline_batch, args.resume)
+        profile.dump_stats(args.profile)
+        logging.info("Profile saved in %s (inspect it with: python -m pstats %s).", args.profile, args.profile)
+    n_left = sum((~pipe.results[default_pars.executed_key].astype(bool)).sum()
+                 for pipe in pipeline_batch.pipelines.values())
+    for name, ranking in rankings.items():
+        if args.results_dir is not None:
+            ranking.to_csv(os.path.join(args.results_dir, f'{name}_ranking.csv'))
+        if len(ranking) > 0:
+            logging.info("Best model of experiment %r: %s", name, ranking.iloc[0].to_dict())
+    if n_left > 0:
+        logging.warning("%i executions were not run (resume with --resume).", n_left)
+        return exit_code_incomplete
+    return 0
+
+
+def _worker(args):
+    results_store = storage.SQLiteResultsStore(args.database, lease=args.lease)
+    distributed.run_worker(results_store, experiment=args.experiment, poll_interval=args.poll_interval,
+                           idle_timeout=args.idle_timeout, max_tasks=args.max_tasks)
+    return 0
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='modev', description="Model Development for Data Science Projects.")
+    parser.add_argument('--log-level', default='INFO', help="Logging level (e.g. DEBUG, INFO, WARNING).")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run = subparsers.add_parser('run', help="Run experiments defined in python files.",
+                                epilog="Exit codes: 0 if all executions were run, 1 if the run failed, and 3 if "
+                                       "executions were left because the time budget was exhausted.")
+    run.add_argument('experiment_files', nargs='+',
+                     help="Python files that define an experiment (a dictionary of inputs of modev.Pipeline, e.g. "
+                          "{'validation_inputs': {...}, 'approaches_inputs': [...]}). Experiments with the same data "
+                          "(and splits) share them.")
+    run.add_argument('--variable', default='experiment', help="Name of the experiment variable in experiment files.")
+    run.add_argument('--n-jobs', type=int, default=default_pars.scheduling_pars_n_jobs,
+                     help="Number of executions to run in parallel (in a pool of processes shared by all experiments).")
+    run.add_argument('--results-store', default=None,
+                     help="Path to SQLite database where results are stored (each experiment is named after its file).")
+    run.add_argument('--results-dir', default=None,
+                     help="Folder where results (<experiment>.csv) and rankings (<experiment>_ranking.csv) are saved.")
+    run.add_argument('--resume', action='store_true',
+                     help="Reuse results of a previous (e.g. interrupted) run, saved in results store or results dir; "
+                          "otherwise, they are ignored and overwritten.")
+    run.add_argument('--data-cache-dir', default=None, help="Folder where loaded data is cached.")
+    run.add_argument('--split-cache-dir', default=None, help="Folder where splits of data are cached.")
+    run.add_argument('--lean', action='store_true',
+                     help="Minimise the time spent by modev on each execution (for large grids of fast approaches).")
+    run.add_argument('--time-budget', type=float, default=None,
+                     help="Maximum number of seconds to spend running executions; executions left can be run later "
+                          "with --resume.")
+    run.add_argument('--profile', default=None,
+                     help="File where a profile (cProfile) of the run is saved.")
+    run.set_defaults(function=_run)
+
+    worker = subparsers.add_parser('worker', help="Run pending executions of experiments published in a database.")
+    worker.add_argument('database', help="Path to SQLite database of results (shared with the coordinator).")
+    worker.add_argument('--experiment', default=None, help="Only run executions of this experiment.")
+    worker.add_argument('--lease', type=float, default=default_pars.storage_pars_lease,
+                        help="Seconds after which the claim of an execution expires, if the worker stops sending "
+                             "heartbeats (e.g. because it crashed).")
+    worker.add_argument('--poll-interval', type=float, default=default_pars.distributed_pars_poll_interval,
+                        help="Seconds to wait before checking again for pending executions, when there are none.")
+    worker.add_argument('--idle-timeout', type=float, default=default_pars.distributed_pars_idle_timeout,
+                        help="Stop after this number of seconds without pending executions (by default, never stop).")
+    worker.add_argument('--max-tasks', type=int, default=None, help="Stop after running this number of executions.")
+    worker.set_defaults(function=_worker)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.getLogger().setLevel(args.log_level.upper())
+    try:
+        return args.function(args)
+    except KeyboardInterrupt:
+        logging.error("Interrupted.")
+        return 130
+    except Exception:
+        logging.exception("Command %r failed.", args.command)
+        return 1
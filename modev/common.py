@@ -1,35 +1,137 @@
 """Common functions that are designed for modev.
 
 """
+import numpy as np
+
 from modev import default_pars
 
 approach_key = default_pars.approach_key
 dev_key = default_pars.dev_key
+elapsed_key = default_pars.elapsed_key
 executed_key = default_pars.executed_key
 fold_key = default_pars.fold_key
 id_key = default_pars.id_key
+key_key = default_pars.key_key
 pars_key = default_pars.pars_key
 playground_key = default_pars.playground_key
+predicted_cost_key = default_pars.predicted_cost_key
+status_key = default_pars.status_key
 test_key = default_pars.test_key
 train_key = default_pars.train_key
 
+# Columns of results that are not metrics.
+non_metrics_columns = [pars_key, approach_key, id_key, fold_key, executed_key, key_key, elapsed_key, predicted_cost_key,
+                       status_key]
+
 
 def get_metrics_from_results(results):
-    non_metrics_columns = [pars_key, approach_key, id_key, fold_key, executed_key]
     metrics = [col for col in results.columns if col not in non_metrics_columns]
     return metrics
 
 
+class Positions:
+    def __init__(self, positions):
+        """Integer positions of rows in the data (instead of labels of the data index).
+
+        Selecting rows by position (with data.iloc) avoids looking up labels in the index of the data. Positions are
+        stored with the smallest integer type that can hold them.
+
+        Parameters
+        ----------
+        positions : np.array
+            Integer positions of rows.
+
+        Methods
+        -------
+        get_positions
+            Return an array of integer positions.
+
+        """
+        positions = np.asarray(positions)
+        if positions.dtype != np.int32:
+            dtype = np.int32 if (len(positions) == 0 or positions.max() < np.iinfo(np.int32).max) else np.int64
+            positions = positions.astype(dtype, copy=False)
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __array__(self, dtype=None, copy=None):
+        positions = self.get_positions()
+        return positions if dtype is None else positions.astype(dtype)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(n_rows={len(self)})"
+
+    def get_positions(self):
+        return self.positions
+
+
+class ComplementPositions(Positions):
+    def __init__(self, population_bits, population_size, excluded):
+        """Integer positions of all rows in a population except some excluded rows (e.g. a train set that contains all
+        rows of the playground except those in the dev set).
+
+        The population is stored as a packed bitmask (one bit per row of the data) that can be shared by several
+        instances, so that, e.g., k overlapping train sets take about as much memory as one bit per row of the data.
+
+        Parameters
+        ----------
+        population_bits : np.array
+            Packed bitmask (as returned by np.packbits) of rows in the population.
+        population_size : int
+            Number of rows in the population.
+        excluded : Positions
+            Positions of rows of the population that are excluded.
+
+        """
+        self.population_bits = population_bits
+        self.population_size = population_size
+        self.excluded = excluded
+
+    def __len__(self):
+        return self.population_size - len(self.excluded)
+
+    def get_positions(self):
+        mask = np.unpackbits(self.population_bits).view(bool)
+        mask[self.excluded.get_positions()] = False
+        positions = np.flatnonzero(mask)
+        return positions.astype(np.int32) if len(mask) < np.iinfo(np.int32).max else positions
+
+
+def select_rows(data, indexes, columns=None):
+    # Indexes can either be integer positions of rows or labels of the data index. If columns are given, only those
+    # columns are selected (and copied).
+    if isinstance(indexes, Positions):
+        if columns is None:
+            selected_rows = data.iloc[indexes.get_positions()]
+        else:
+            selected_rows = data.iloc[indexes.get_positions(), [data.columns.get_loc(column) for column in columns]]
+    else:
+        selected_rows = data.loc[indexes] if columns is None else data.loc[indexes, list(columns)]
+    return selected_rows
+
+
 def get_train_and_test_sets(data, train_indexes, test_indexes, fold):
     # TODO: Instead of this, in test_mode, repeat playground so that train and test sets have the same number of keys.
     if len(train_indexes) == 1:
-        train_set = data.loc[train_indexes[0]]
+        train_set = select_rows(data, train_indexes[0])
     else:
-        train_set = data.loc[train_indexes[fold]]
-    test_set = data.loc[test_indexes[fold]]
+        train_set = select_rows(data, train_indexes[fold])
+    test_set = select_rows(data, test_indexes[fold])
     return train_set, test_set
 
 
+def get_required_columns(approach_function, approach_inputs=None):
+    # Columns that an approach reads, declared either in its inputs or as an attribute of the approach (None if not
+    # declared, in which case the approach receives all columns).
+    if approach_inputs is not None and default_pars.required_columns_key in approach_inputs:
+        columns = approach_inputs[default_pars.required_columns_key]
+    else:
+        columns = getattr(approach_function, default_pars.required_columns_key, None)
+    return None if columns is None else list(columns)
+
+
 def separate_predictors_and_target(data_set, target_col):
     data_set_x = data_set.drop(columns=target_col)
     data_set_y = data_set[target_col].values
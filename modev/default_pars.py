@@ -1,7 +1,7 @@
 """Default values for modev parameters.
 
 """
-import pkg_resources
+import os
 
 ########################################################################################################################
 
@@ -10,27 +10,118 @@ import pkg_resources
 approach_key = 'approach'
 approach_name_key = 'approach_name'
 dev_key = 'dev'
-example_data_path = pkg_resources.resource_filename(__name__, 'data/example_labeled_data.csv')
+elapsed_key = 'elapsed'
+example_data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'example_labeled_data.csv')
 executed_key = 'executed'
 fixed_pars_key = 'fixed_pars'
 fold_key = 'fold'
 function_key = 'function'
 id_key = 'id'
+key_key = 'key'
+# Key of execution results that contains accumulated statistics of predictions (instead of truth and predictions).
+metrics_accumulator_key = 'metrics_accumulator'
 pars_key = 'pars'
 playground_key = 'playground'
+predicted_cost_key = 'predicted_cost'
 prediction_key = 'prediction'
 random_state = None
+# Name of the attribute (of an approach) or key (of approaches inputs) with the list of columns an approach reads.
+required_columns_key = 'required_columns'
 save_every = 10
+split_hash_key = 'split_hash'
+status_key = 'status'
 test_key = 'test'
 train_key = 'train'
 truth_key = 'truth'
 
 
+########################################################################################################################
+
+# Default values for caching.
+
+caching_pars_n_sample_rows = 100000
+
+
+########################################################################################################################
+
+# Default values for storage of results.
+
+storage_pars_experiment = 'default'
+# Seconds after which a claim of an execution (by a process that may have crashed) expires.
+storage_pars_lease = 3600
+storage_pars_timeout = 60
+storage_table = 'results'
+
+
+########################################################################################################################
+
+# Default values for limits of executions (that, if given, are run in separate processes).
+
+execution_pars_memory_limit = None
+execution_pars_timeout = None
+# Possible status of executions run in separate processes.
+status_error = 'error'
+status_memory_limit = 'memory_limit'
+status_ok = 'ok'
+status_timeout = 'timeout'
+
+########################################################################################################################
+
+# Default values for lean execution (of large grids of fast models, where bookkeeping is done in batches).
+
+execution_pars_lean = False
+# Seconds between consecutive updates of progress and of results (in lean execution).
+execution_pars_progress_interval = 1.0
+# Number of passes over the train set of each fold, when approaches are fitted in chunks (out of core).
+execution_pars_n_epochs = 1
+# Number of examples predicted at a time (None to predict all examples of a test set at once).
+execution_pars_predict_batch_size = None
+# Maximum number of executions in flight at the same time, for approaches with asynchronous 'fit' or 'predict' methods.
+execution_pars_async_concurrency = 16
+
+########################################################################################################################
+
+# Default values for preprocessing stage (fitted once per fold, and cached).
+
+# Maximum memory (in bytes) of cached preprocessed folds (None for no limit), and folder where folds are spilled when it
+# is exceeded (None for a temporary folder).
+preprocessing_pars_cache_dir = None
+preprocessing_pars_memory_budget = None
+
+
+########################################################################################################################
+
+# Default values for scheduling of executions (in parallel, or by workers of a queue).
+
+# Number of executions run in parallel by the current process (in separate processes).
+scheduling_pars_n_jobs = 1
+# Cost of executions when there is no information to estimate it.
+scheduling_pars_default_cost = 1.0
+
+
+########################################################################################################################
+
+# Default values for distributed execution (with a queue of executions, run by workers started separately).
+
+distributed_pars_idle_timeout = None
+distributed_pars_payload_dir = None
+distributed_pars_poll_interval = 1.0
+distributed_pars_timeout = None
+# Executor of the executions of an experiment: 'local' (in the current process) or 'queue' (by workers).
+executor = 'local'
+payload_file_key = 'payload_file'
+
+
 ########################################################################################################################
 
 # Default values for data load stage.
 
+# Number of rows per chunk, when data is read in chunks (e.g. because it does not fit in memory).
+etl_pars_chunk_size = 100000
+etl_pars_columns = None
 etl_pars_header_nrows = 1
+# Whether to load only the columns that approaches require (if all approaches declare them).
+etl_pars_project_columns = False
 etl_pars_sample_nrows = None
 etl_pars_selection = None
 
@@ -44,12 +135,18 @@ validation_pars_test_n_sets = 2
 # Default validation pars for k-fold cross-validation:
 validation_pars_labels = None
 validation_pars_playground_n_folds = 4
+validation_pars_positional = False
+# Default validation pars for repeated k-fold (or Monte Carlo) cross-validation:
+validation_pars_dev_fraction = None
+validation_pars_n_repeats = 10
 validation_pars_return_original_indexes = True
 validation_pars_shuffle = True
 validation_pars_test_mode = False
 # Default validation pars for temporal-fold cross-validation:
 validation_min_n_train_examples = 10
 validation_dev_n_sets = 4
+validation_pars_gap = None
+validation_pars_train_window = None
 
 
 ########################################################################################################################
@@ -63,6 +160,8 @@ exploration_pars_fixed_pars = None
 
 # Default values for evaluation stage.
 
+# Maximum number of bins of histograms of scores, when predictions are evaluated in chunks (for metrics at k).
+evaluation_pars_max_bins = 10000
 evaluation_pars_num_predictions = None
 
 
@@ -74,6 +173,19 @@ selection_pars_aggregation_method = 'mean'
 selection_pars_condition = None
 selection_pars_combined_results_condition = None
 selection_pars_results_condition = None
+# Default selection pars for multi-objective (pareto front) model selection:
+selection_pars_directions = None
+selection_crowding_distance_key = 'crowding_distance'
+selection_front_key = 'front'
+selection_rank_key = 'rank'
+# Default selection pars for model selection based on paired statistical tests across folds:
+selection_pars_alpha = 0.05
+selection_pars_correction = 'holm'
+selection_pars_drop_dominated = False
+selection_pars_test = 'ttest'
+selection_dominated_key = 'dominated'
+selection_p_value_key = 'p_value'
+selection_p_value_adjusted_key = 'p_value_adjusted'
 
 
 ########################################################################################################################
@@ -82,7 +194,13 @@ selection_pars_results_condition = None
 
 plotting_pars_added_cols_hover = None
 plotting_pars_height = 500
+plotting_pars_mode = 'lines'
 plotting_pars_plot_file = None
 plotting_pars_show = True
 plotting_pars_title = None
 plotting_pars_width = 950
+# Default plotting pars for plots of many models (in a single figure):
+plotting_pars_height_per_metric = 350
+plotting_pars_quantiles = [0.1, 0.5, 0.9]
+plotting_pars_show_all = True
+plotting_pars_top_n = 10
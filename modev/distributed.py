@@ -0,0 +1,272 @@
+"""Functions related to the distributed execution of experiments, with a queue of executions stored in a database (see
+storage), that are run by workers started separately (possibly on other hosts that share a filesystem).
+
+A coordinator (a pipeline with executor='queue') adds the executions of its grid to the database as pending, and
+publishes everything that workers need to run them (data, indexes of folds, approaches, and execution and evaluation
+inputs) in a payload file next to the database. Each worker (started with "modev worker <database>") claims pending
+executions one by one, extends its claim periodically while running it (heartbeat) and writes its results. If a worker
+crashes, its claim expires after the lease and the execution is claimed by another worker.
+
+Note: Approaches and functions are stored by reference, so they must be importable by workers (i.e. they cannot be
+defined in the main script of the coordinator).
+Note: The payload is pickled, and loading it runs arbitrary code, so workers must trust whoever can write the payload
+file. Payload files are only readable and writable by their owner, and workers refuse to load payload files that are
+not owned by their own user, or that other users can modify.
+
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+
+from modev import default_pars
+from modev import execution
+from modev import storage
+from modev import utils
+
+tqdm_auto = utils.lazy_import('tqdm.auto')
+
+payload_file_key = default_pars.payload_file_key
+
+
+def get_payload_file(results_store, payload_dir=default_pars.distributed_pars_payload_dir):
+    if payload_dir is None:
+        payload_dir = os.path.abspath(results_store.path) + '.payloads'
+    experiment_hash = hashlib.sha1(results_store.experiment.encode()).hexdigest()
+    return os.path.join(payload_dir, f'{experiment_hash}.pkl')
+
+
+def publish_experiment(results_store, payload, payload_dir=default_pars.distributed_pars_payload_dir):
+    """Store everything that workers need to run the executions of an experiment, and make it available to them.
+
+    The payload is pickled into a file that only its owner can read and write, and that workers load (which runs
+    arbitrary code), so workers must be run by the same user as the coordinator, and the payload folder must not be
+    writable by untrusted users.
+
+    Parameters
+    ----------
+    results_store : storage.SQLiteResultsStore
+        Store of results of the experiment.
+    payload : dict
+        Inputs of execution.execute_and_evaluate (except fold, approach function and approach pars), and
+        'approaches_function' (dictionary of approach name and approach function).
+    payload_dir : str or None
+        Folder where payload file will be stored (it must be accessible by workers); None to store it next to the
+        database.
+
+    Returns
+    -------
+    payload_file : str
+        Path to payload file.
+
+    """
+    payload_file = get_payload_file(results_store, payload_dir=payload_dir)
+    os.makedirs(os.path.dirname(payload_file), mode=0o700, exist_ok=True)
+    # Write to a temporary file first, so that workers never read a partially written payload. The file is created
+    # readable and writable only by its owner.
+    temporary_file = f'{payload_file}.{os.getpid()}.tmp'
+    if os.path.exists(temporary_file):
+        os.remove(temporary_file)
+    with os.fdopen(os.open(temporary_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as output:
+        pickle.dump(payload, output, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_file, payload_file)
+    results_store.set_experiment_info({payload_file_key: payload_file})
+    return payload_file
+
+
+def wait_for_results(results_store, keys, poll_interval=default_pars.distributed_pars_poll_interval,
+                     timeout=default_pars.distributed_pars_timeout):
+    """Wait until all executions with the given keys have been executed (by workers).
+
+    Parameters
+    ----------
+    results_store : storage.SQLiteResultsStore
+        Store of results of the experiment.
+    keys : list
+        Execution keys.
+    poll_interval : float
+        Seconds between consecutive checks of the number of pending executions.
+    timeout : float or None
+        Maximum number of seconds to wait; None to wait until all executions have been executed.
+
+    Returns
+    -------
+    n_pending : int
+        Number of executions that are still pending (only larger than zero if timeout was reached).
+
+    """
+    start = time.time()
+    n_pending = results_store.count_pending(keys)
+    with tqdm_auto.tqdm(total=len(keys), initial=len(keys) - n_pending) as progress:
+        while n_pending > 0:
+            if timeout is not None and time.time() - start > timeout:
+                logging.warning("Timeout reached with %i executions still pending.", n_pending)
+                break
+            time.sleep(poll_interval)
+            n_pending_new = results_store.count_pending(keys)
+            progress.update(n_pending - n_pending_new)
+            n_pending = n_pending_new
+    return n_pending
+
+
+class QueueExecutor:
+    def __init__(self, results_store, payload, payload_dir=default_pars.distributed_pars_payload_dir,
+                 poll_interval=default_pars.distributed_pars_poll_interval,
+                 timeout=default_pars.distributed_pars_timeout):
+        """Executor that lets workers (started separately) run the pending executions of an experiment.
+
+        The payload is pickled into a file that workers load, which runs arbitrary code, so workers must trust the
+        payload folder (see publish_experiment).
+
+        Parameters
+        ----------
+        results_store : storage.SQLiteResultsStore
+            Store of results of the experiment (where pending executions have been added).
+        payload : dict
+            Everything that workers need to run executions (see publish_experiment).
+        payload_dir : str or None
+            Folder where payload file will be stored (see publish_experiment).
+        poll_interval : float
+            Seconds between consecutive checks of the number of pending executions.
+        timeout : float or None
+            Maximum number of seconds to wait for workers; None to wait until all executions have been executed.
+
+        """
+        self.results_store = results_store
+        self.payload = payload
+        self.payload_dir = payload_dir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def __call__(self, keys):
+        # Remove pending executions that are not part of the current grid (e.g. from a previous version of the grid,
+        # that would otherwise be run with the current payload).
+        n_removed = self.results_store.remove_pending(keys)
+        if n_removed > 0:
+            logging.info("Removed %i pending executions that are not part of the current experiment.", n_removed)
+        payload_file = publish_experiment(self.results_store, self.payload, payload_dir=self.payload_dir)
+        logging.info("Experiment %r published; start workers with: modev worker %s", self.results_store.experiment,
+                     self.results_store.path)
+        logging.debug("Payload file: %s", payload_file)
+        return wait_for_results(self.results_store, keys, poll_interval=self.poll_interval, timeout=self.timeout)
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, results_store, key, worker):
+        super().__init__(daemon=True)
+        self.results_store = results_store
+        self.key = key
+        self.worker = worker
+        self.stopped = threading.Event()
+
+    def run(self):
+        # Extend the claim a few times per lease, so that it does not expire while the execution is running.
+        while not self.stopped.wait(self.results_store.lease / 3):
+            if not self.results_store.heartbeat(self.key, self.worker):
+                logging.warning("Claim of execution %s was lost (it may be executed by another worker).", self.key)
+                break
+        self.results_store.close()
+
+    def __enter__(self):
+        if self.results_store.lease is not None:
+            self.start()
+        return self
+
+    def __exit__(self, *_args):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+
+def _check_payload_file(input_file, payload_file):
+    # Loading a pickled payload runs arbitrary code, so only payloads that no other user can have written are loaded.
+    stats = os.fstat(input_file.fileno())
+    if hasattr(os, 'getuid') and stats.st_uid != os.getuid():
+        raise PermissionError(f"Payload file {payload_file} is not owned by the user of this worker.")
+    if stats.st_mode & 0o022:
+        raise PermissionError(f"Payload file {payload_file} can be modified by other users.")
+
+
+def _load_payload(results_store, payloads):
+    payload_file = results_store.get_experiment_info()[payload_file_key]
+    # Reload payload only if it changed (e.g. if the coordinator published a new version of the experiment).
+    version = (payload_file, os.path.getmtime(payload_file))
+    if payloads.get(results_store.experiment, (None, None))[0] != version:
+        with open(payload_file, 'rb') as input_file:
+            _check_payload_file(input_file, payload_file)
+            payloads[results_store.experiment] = (version, pickle.load(input_file))
+    return payloads[results_store.experiment][1]
+
+
+def run_worker(results_store, experiment=None, poll_interval=default_pars.distributed_pars_poll_interval,
+               idle_timeout=default_pars.distributed_pars_idle_timeout, max_tasks=None):
+    """Run pending executions of experiments published in a database (until stopped).
+
+    Parameters
+    ----------
+    results_store : str or storage.SQLiteResultsStore
+        Path to database (or store of results).
+    experiment : str or None
+        Name of experiment whose executions will be run; None to run executions of any published experiment.
+    poll_interval : float
+        Seconds to wait before checking again for pending executions, when there are none.
+    idle_timeout : float or None
+        Stop after this number of seconds without pending executions; None to never stop.
+    max_tasks : int or None
+        Stop after running this number of executions; None to never stop.
+
+    Returns
+    -------
+    n_executed : int
+        Number of executions run by this worker.
+
+    """
+    if isinstance(results_store, str):
+        results_store = storage.SQLiteResultsStore(results_store)
+    worker = storage.get_worker_name()
+    payloads = {}
+    n_executed = 0
+    idle_since = time.time()
+    logging.info("Worker %s started.", worker)
+    while (max_tasks is None) or (n_executed < max_tasks):
+        published = [name for name, info in results_store.get_experiments_info().items() if payload_file_key in info]
+        if experiment is not None:
+            published = [name for name in published if name == experiment]
+        claimed = results_store.claim_next(worker, experiments=published)
+        if claimed is None:
+            if (idle_timeout is not None) and (time.time() - idle_since > idle_timeout):
+                break
+            time.sleep(poll_interval)
+            continue
+        experiment_store = results_store.for_experiment(claimed[0])
+        key = claimed[1]
+        result = experiment_store.read(keys=[key])
+        # A payload that cannot be loaded (e.g. because it is not trusted) stops the worker, instead of being recorded
+        # as a failed execution.
+        payload = _load_payload(experiment_store, payloads)
+        start = time.perf_counter()
+        try:
+            with _Heartbeat(experiment_store, key, worker):
+                # If the coordinator set limits of time or memory, the execution runs in a separate process.
+                evaluation_results, elapsed, status = execution.run_execution(
+                    payload, result[default_pars.fold_key].iloc[0], result[default_pars.approach_key].iloc[0],
+                    result[default_pars.pars_key].iloc[0])
+        except Exception:
+            # Record the execution as failed (as when it runs under limits), so that it is not claimed again forever.
+            logging.exception("Execution %s of experiment %r failed.", key, claimed[0])
+            evaluation_results, elapsed, status = None, time.perf_counter() - start, default_pars.status_error
+        if evaluation_results is not None:
+            for metric in evaluation_results:
+                result[metric] = evaluation_results[metric]
+        result[default_pars.elapsed_key] = elapsed
+        if status is not None:
+            result[default_pars.status_key] = status
+        result[default_pars.executed_key] = True
+        experiment_store.add_results(result)
+        experiment_store.close()
+        n_executed += 1
+        idle_since = time.time()
+    logging.info("Worker %s finished after running %i executions.", worker, n_executed)
+    return n_executed
@@ -6,16 +6,18 @@ import os
 import pickle
 import random
 
+import numpy as np
 import pandas as pd
 
 from modev import default_pars
+from modev import expressions
 from modev import utils
 
 
 def apply_selection_to_data(data, selection):
-    sel = eval(selection)
+    sel = expressions.evaluate_condition(data, selection)
     selected_data = data[sel].copy()
-    logging.info("Applying selection: %i rows (of %i) selected.", len(data), len(selected_data))
+    logging.info("Applying selection: %i rows (of %i) selected.", len(selected_data), len(data))
     return selected_data
 
 
@@ -36,7 +38,8 @@ def sample_from_big_file(data_file, sample_nrows, random_state=default_pars.rand
 
 
 def load_local_file(data_file, selection=default_pars.etl_pars_selection,
-                    sample_nrows=default_pars.etl_pars_sample_nrows, random_state=default_pars.random_state, **kwargs):
+                    sample_nrows=default_pars.etl_pars_sample_nrows, random_state=default_pars.random_state,
+                    columns=default_pars.etl_pars_columns, **kwargs):
     """Load local (.csv) file.
 
     This function uses pandas.read_csv() function and accepts all its arguments. But it also has some added arguments.
@@ -48,10 +51,14 @@ def load_local_file(data_file, selection=default_pars.etl_pars_selection,
     selection : str or None
         Selection to perform on the data. For example, if selection is "(data['height'] > 3) & (data['width'] < 2)",
         that selection will be evaluated and applied to the data; None to apply no selection.
+        See expressions.compile_condition for the syntax accepted in selections.
     sample_nrows : int or None
         Number of random rows to sample from the data (without repeating rows); None to load all rows.
     random_state : int
         Random state (relevant only when sampling from data, i.e. when 'sample_nrows' is not None).
+    columns : list or None
+        Columns to load (other columns in the file are not read, except those needed by 'selection' or 'index_col');
+        columns that are not in the file are ignored. None to load all columns.
 
     Returns
     -------
@@ -63,16 +70,130 @@ def load_local_file(data_file, selection=default_pars.etl_pars_selection,
         logging.error("Data file not found: %s", data_file)
     # Get default args for pd.read_csv.
     usable_kwargs = utils.get_usable_args_for_function(pd.read_csv, kwargs)
+    if columns is not None:
+        needed_columns = set(columns)
+        if selection is not None:
+            needed_columns |= expressions.compile_condition(selection).columns
+        index_col = usable_kwargs.get('index_col')
+        if isinstance(index_col, (str, list, tuple)):
+            needed_columns |= {index_col} if isinstance(index_col, str) else set(index_col)
+        # A callable (unlike a list of names) does not fail on columns that are not in the file.
+        usable_kwargs['usecols'] = needed_columns.__contains__
     logging.info("Loading data from file %s", data_file)
     data = pd.read_csv(data_file, **usable_kwargs)
     if selection is not None:
         # Create a new dataframe (copy) that fulfils selection, while keeping the original indexes (no reset).
         data = apply_selection_to_data(data, selection)
+    if columns is not None and not set(data.columns) <= set(columns):
+        # Drop columns that were only needed for the selection.
+        data = data[[column for column in data.columns if column in columns]]
     if sample_nrows is not None:
         data = data.sample(sample_nrows, random_state=random_state)
     return data
 
 
+class ChunkedData:
+    def __init__(self, data_file, chunk_size=default_pars.etl_pars_chunk_size, index_columns=None,
+                 columns=default_pars.etl_pars_columns, **kwargs):
+        """Data in a local (.csv) file that is read in chunks (e.g. because it does not fit in memory).
+
+        Only the 'index_columns' are kept in memory (to split data into folds, e.g. a time column, or labels to
+        stratify folds); all other columns are read chunk by chunk whenever they are needed. Rows are identified by
+        their position in the file (the data has a range index), so that fold membership is computed from positions.
+
+        An instance can be used as load function (in load inputs), and its data can be executed with
+        execution.execute_model_out_of_core.
+
+        Parameters
+        ----------
+        data_file : str
+            Path to local (.csv) file.
+        chunk_size : int
+            Number of rows per chunk (which bounds the memory used when reading the data).
+        index_columns : list or None
+            Columns kept in memory (and given to the validation function); None to keep no column in memory.
+        columns : list or None
+            Columns that can be read (other columns in the file are never read); None to read all columns.
+        kwargs : dict
+            Other arguments of pandas.read_csv (except 'index_col', 'usecols' and 'chunksize').
+
+        Methods
+        -------
+        get_index_data
+            Return a dataframe with the index columns (and a range index with one element per row of the data).
+        iter_chunks
+            Iterate over chunks of data (read from the file).
+        get_unique
+            Return the sorted unique values of a column.
+
+        """
+        self.data_file = data_file
+        self.chunk_size = chunk_size
+        self.index_columns = [] if index_columns is None else list(index_columns)
+        self.read_kwargs = utils.get_usable_args_for_function(pd.read_csv, kwargs)
+        for argument in ['index_col', 'usecols', 'chunksize']:
+            if argument in self.read_kwargs:
+                raise ValueError(f"Argument {argument!r} cannot be used when reading data in chunks.")
+        if not os.path.isfile(data_file):
+            logging.error("Data file not found: %s", data_file)
+        header = pd.read_csv(data_file, nrows=0, **self.read_kwargs)
+        self.columns = [column for column in header.columns if columns is None or column in columns]
+        self._unique = {}
+        self.index_data = self._read_index_data()
+
+    def __len__(self):
+        return len(self.index_data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.data_file!r}, n_rows={len(self)}, chunk_size={self.chunk_size})"
+
+    def _read_chunks(self, columns):
+        # If no column is needed (e.g. to count rows), read only the first column.
+        usecols = [0] if len(columns) == 0 else set(columns).__contains__
+        return pd.read_csv(self.data_file, usecols=usecols, chunksize=self.chunk_size, **self.read_kwargs)
+
+    def _read_index_data(self):
+        logging.info("Reading index columns %s from file %s", self.index_columns, self.data_file)
+        parts = [chunk[self.index_columns] for chunk in self._read_chunks(self.index_columns)]
+        if len(parts) == 0:
+            return pd.DataFrame(columns=self.index_columns)
+        return pd.concat(parts, ignore_index=True)
+
+    def get_index_data(self):
+        return self.index_data
+
+    def iter_chunks(self, columns=None):
+        """Iterate over chunks of data, in the order of the file.
+
+        Parameters
+        ----------
+        columns : list or None
+            Columns to read; None to read all columns.
+
+        Yields
+        ------
+        chunk : pd.DataFrame
+            Chunk of data, whose index contains the positions of its rows in the data.
+
+        """
+        columns = self.columns if columns is None else [column for column in self.columns if column in columns]
+        start = 0
+        for chunk in self._read_chunks(columns):
+            chunk = chunk[columns]
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+
+    def get_unique(self, column):
+        if column not in self._unique:
+            if column in self.index_columns:
+                values = self.index_data[column].unique()
+            else:
+                values = pd.unique(pd.concat([chunk[column].drop_duplicates() for chunk in self.iter_chunks([column])]))
+            self._unique[column] = np.sort(values)
+        return self._unique[column]
+
+
 def save_model(model, model_file):
     models_dir = os.path.dirname(model_file)
     if not os.path.isdir(models_dir):
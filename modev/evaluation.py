@@ -1,11 +1,17 @@
 """Functions related to evaluation metrics.
 
 """
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+import collections
+import logging
+
+import numpy as np
+import pandas as pd
 
 from modev import default_pars
 from modev import utils
 
+sklearn_metrics = utils.lazy_import('sklearn.metrics')
+
 # List of kwargs accepted by precision and recall functions from sklearn, and accuracy.
 precision_recall_f1_kwargs = ['labels', 'pos_label', 'average', 'sample_weight', 'zero_division']
 accuracy_kwargs = ['normalize', 'sample_weight']
@@ -36,7 +42,8 @@ def evaluate_predictions(execution_results, metrics, **kwargs):
     Parameters
     ----------
     execution_results : dict
-        Execution results as returned by execution inputs function. It must contain a 'truth' and a 'prediction' key.
+        Execution results as returned by execution inputs function. It must contain either a 'truth' and a
+        'prediction' key, or a 'metrics_accumulator' key (with a MetricsAccumulator).
     metrics : list
         Metrics to use for evaluation. Implemented methods include:
          * 'precision': usual precision in classification problems.
@@ -55,23 +62,29 @@ def evaluate_predictions(execution_results, metrics, **kwargs):
         Results of evaluation. Each element in the dictionary corresponds to one of the metrics.
 
     """
+    if default_pars.metrics_accumulator_key in execution_results:
+        # Predictions were evaluated in chunks (e.g. by execution.execute_model_out_of_core).
+        return execution_results[default_pars.metrics_accumulator_key].get_metrics(metrics, **kwargs)
     raw_true, raw_pred = execution_results[default_pars.truth_key], execution_results[default_pars.prediction_key]
     true, pred = prepare_true_and_pred(raw_true, raw_pred)
 
     results = {}
     for metric in metrics:
         if metric == 'accuracy':
-            usable_kwargs = utils.get_usable_args_for_function(accuracy_score, kwargs, accuracy_kwargs)
-            results[metric] = accuracy_score(true, pred, **usable_kwargs)
+            usable_kwargs = utils.get_usable_args_for_function(sklearn_metrics.accuracy_score, kwargs, accuracy_kwargs)
+            results[metric] = sklearn_metrics.accuracy_score(true, pred, **usable_kwargs)
         elif metric == 'precision':
-            usable_kwargs = utils.get_usable_args_for_function(precision_score, kwargs, precision_recall_f1_kwargs)
-            results[metric] = precision_score(true, pred, **usable_kwargs)
+            usable_kwargs = utils.get_usable_args_for_function(sklearn_metrics.precision_score, kwargs,
+                                                               precision_recall_f1_kwargs)
+            results[metric] = sklearn_metrics.precision_score(true, pred, **usable_kwargs)
         elif metric == 'recall':
-            usable_kwargs = utils.get_usable_args_for_function(recall_score, kwargs, precision_recall_f1_kwargs)
-            results[metric] = recall_score(true, pred, **usable_kwargs)
+            usable_kwargs = utils.get_usable_args_for_function(sklearn_metrics.recall_score, kwargs,
+                                                               precision_recall_f1_kwargs)
+            results[metric] = sklearn_metrics.recall_score(true, pred, **usable_kwargs)
         elif metric == 'f1':
-            usable_kwargs = utils.get_usable_args_for_function(f1_score, kwargs, precision_recall_f1_kwargs)
-            results[metric] = f1_score(true, pred, **usable_kwargs)
+            usable_kwargs = utils.get_usable_args_for_function(sklearn_metrics.f1_score, kwargs,
+                                                               precision_recall_f1_kwargs)
+            results[metric] = sklearn_metrics.f1_score(true, pred, **usable_kwargs)
         elif metric.startswith(('precision_at_', 'recall_at', 'threshold_at_')):
             # Get metrics at k or metrics at k percent (either precision, recall, or threshold).
             k = get_k_from_metric_name(metric, len(pred))
@@ -86,6 +99,214 @@ def evaluate_predictions(execution_results, metrics, **kwargs):
     return results
 
 
+def _divide(numerator, denominator, zero_division):
+    # Element-wise division, that returns zero_division where the denominator is zero (as in sklearn metrics).
+    numerator, denominator = np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float)
+    zero_division = 0.0 if zero_division == 'warn' else float(zero_division)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator == 0, zero_division, numerator / np.where(denominator == 0, 1, denominator))
+
+
+def _is_metric_at_k(metric):
+    return metric.startswith(('precision_at_', 'recall_at', 'threshold_at_'))
+
+
+class MetricsAccumulator:
+    def __init__(self, metrics=None, max_bins=default_pars.evaluation_pars_max_bins):
+        """Statistics of true and predicted values, accumulated chunk by chunk, from which metrics are computed without
+        keeping all predictions in memory.
+
+        For metrics on labels (accuracy, precision, recall and f1), the count of each pair of true and predicted values
+        is accumulated (from which those metrics are computed exactly). For metrics at k (see metrics_at_k), predictions
+        are scores (e.g. probabilities), and a histogram of scores (with the number of examples and of positive
+        examples with each score) is accumulated. The histogram is exact while it has at most 'max_bins' distinct
+        scores; beyond that, adjacent scores are merged into bins of similar size, and metrics at k are interpolated
+        within the bin that contains the k-th example. If there are no accumulated predictions, metrics are NaN.
+
+        Accumulators (e.g. of different chunks, or computed by different workers) can be merged, and the result is the
+        same as if all predictions had been accumulated by one of them.
+
+        Parameters
+        ----------
+        metrics : list or None
+            Metrics that will be computed (which determine whether predictions are treated as labels, as scores, or
+            both); None to accumulate statistics for all metrics.
+        max_bins : int
+            Maximum number of bins of the histogram of scores.
+
+        Methods
+        -------
+        update
+            Add the true and predicted values of a chunk.
+        merge
+            Add the statistics of another accumulator.
+        get_metrics
+            Return the value of each metric (see evaluate_predictions).
+
+        """
+        self.max_bins = max_bins
+        self.track_labels = metrics is None or any(not _is_metric_at_k(metric) for metric in metrics)
+        self.track_scores = metrics is None or any(_is_metric_at_k(metric) for metric in metrics)
+        self.confusion = collections.Counter()
+        # Histogram of scores: distinct scores (or upper edges of bins), and number of examples and positive examples.
+        self.scores = np.array([], dtype=float)
+        self.scores_total = np.array([], dtype=float)
+        self.scores_positive = np.array([], dtype=float)
+
+    def update(self, true, pred):
+        """Add the true and predicted values of a chunk.
+
+        Parameters
+        ----------
+        true : np.array
+            Ground truth of the chunk.
+        pred : np.array
+            Predictions of the chunk.
+
+        Returns
+        -------
+        None
+
+        """
+        true, pred = np.asarray(true), np.asarray(pred)
+        if self.track_scores and pred.dtype.kind in 'fiub':
+            scores, inverse = np.unique(pred.astype(float), return_inverse=True)
+            self._add_scores(scores, np.bincount(inverse, minlength=len(scores)),
+                             np.bincount(inverse, weights=true.astype(bool), minlength=len(scores)))
+        if self.track_labels:
+            pairs = pd.DataFrame({'true': true, 'pred': pred}).value_counts(sort=False, dropna=False)
+            for pair, count in pairs.items():
+                self.confusion[pair] += int(count)
+
+    def _add_scores(self, scores, totals, positives):
+        scores = np.concatenate([self.scores, scores])
+        self.scores, inverse = np.unique(scores, return_inverse=True)
+        self.scores_total = np.bincount(inverse, weights=np.concatenate([self.scores_total, totals]))
+        self.scores_positive = np.bincount(inverse, weights=np.concatenate([self.scores_positive, positives]))
+        if len(self.scores) > 2 * self.max_bins:
+            self._compress()
+
+    def _compress(self):
+        # Merge adjacent scores into max_bins bins with similar number of examples, each represented by its highest
+        # score (so that the threshold at k is never lower than the exact one).
+        cumulative = np.cumsum(self.scores_total)
+        bins = np.minimum((cumulative - self.scores_total) * self.max_bins // cumulative[-1], self.max_bins - 1)
+        bins = bins.astype(int)
+        self.scores = np.maximum.reduceat(self.scores, np.flatnonzero(np.diff(bins, prepend=-1)))
+        self.scores_total = np.bincount(bins, weights=self.scores_total)[np.unique(bins)]
+        self.scores_positive = np.bincount(bins, weights=self.scores_positive)[np.unique(bins)]
+
+    def merge(self, other):
+        """Add the statistics of another accumulator (e.g. of predictions of other chunks, or of another worker).
+
+        Parameters
+        ----------
+        other : MetricsAccumulator
+            Accumulator to merge into this one.
+
+        Returns
+        -------
+        self : MetricsAccumulator
+            This accumulator (after merging).
+
+        """
+        self.confusion.update(other.confusion)
+        if len(other.scores) > 0:
+            self._add_scores(other.scores, other.scores_total, other.scores_positive)
+        return self
+
+    def _get_metric_at_k(self, metric):
+        # Scores sorted from highest to lowest, and number of examples (and of positive examples) above each of them.
+        scores, totals, positives = self.scores[::-1], self.scores_total[::-1], self.scores_positive[::-1]
+        cumulative_totals, cumulative_positives = np.cumsum(totals), np.cumsum(positives)
+        k = get_k_from_metric_name(metric, int(cumulative_totals[-1]))
+        # Bin that contains the k-th example, and positive examples among the top k (interpolated within that bin).
+        i = min(int(np.searchsorted(cumulative_totals, k)), len(scores) - 1)
+        positives_at_k = cumulative_positives[i] - positives[i] * (cumulative_totals[i] - k) / totals[i]
+        results = {'precision': positives_at_k / k, 'recall': positives_at_k / cumulative_positives[-1],
+                   'threshold': scores[i]}
+        return float(results[metric.split('_at_')[0]])
+
+    def _get_labels(self):
+        return sorted({true for true, _ in self.confusion} | {pred for _, pred in self.confusion})
+
+    def _get_counts(self, labels):
+        # True positives, false positives and false negatives (and support) of each label.
+        index = {label: i for i, label in enumerate(labels)}
+        true_positives, predicted, support = np.zeros((3, len(labels)))
+        for (true, pred), count in self.confusion.items():
+            if true == pred and true in index:
+                true_positives[index[true]] += count
+            if pred in index:
+                predicted[index[pred]] += count
+            if true in index:
+                support[index[true]] += count
+        return true_positives, predicted - true_positives, support - true_positives, support
+
+    def _get_precision_recall_f1(self, metric, labels=None, pos_label=1, average='binary', zero_division='warn'):
+        present_labels = self._get_labels()
+        if average == 'binary':
+            if len(present_labels) > 2:
+                raise ValueError(f"Target is multiclass but average='binary'; choose another average for {metric}.")
+            labels = [pos_label]
+        elif labels is None:
+            labels = present_labels
+        true_positives, false_positives, false_negatives, support = self._get_counts(labels)
+        if average == 'micro':
+            true_positives, false_positives, false_negatives = [np.sum(counts) for counts in
+                                                                [true_positives, false_positives, false_negatives]]
+        if metric == 'precision':
+            values = _divide(true_positives, true_positives + false_positives, zero_division)
+        elif metric == 'recall':
+            values = _divide(true_positives, true_positives + false_negatives, zero_division)
+        else:
+            values = _divide(2 * true_positives, 2 * true_positives + false_positives + false_negatives, zero_division)
+        if average == 'weighted':
+            if np.sum(support) == 0:
+                return float(_divide(0, 0, zero_division))
+            return float(np.average(values, weights=support))
+        return float(np.mean(values))
+
+    def get_metrics(self, metrics, **kwargs):
+        """Return the value of each metric, computed from the accumulated counts.
+
+        Parameters
+        ----------
+        metrics : list
+            Metrics to compute (see evaluate_predictions): 'accuracy', 'precision', 'recall' and 'f1' (if predictions
+            are labels), or metrics at k (if predictions are scores).
+        kwargs : dict
+            Arguments of the metrics (as accepted by the equivalent sklearn metrics), e.g. 'average' or 'pos_label'.
+
+        Returns
+        -------
+        results : dict
+            Value of each of the metrics.
+
+        """
+        if kwargs.get('sample_weight') is not None:
+            raise ValueError("Argument 'sample_weight' is not supported for metrics accumulated in chunks.")
+        results = {}
+        for metric in metrics:
+            if metric in ['accuracy', 'precision', 'recall', 'f1'] and len(self.confusion) == 0 or \
+                    _is_metric_at_k(metric) and len(self.scores) == 0:
+                # There are no accumulated predictions (e.g. the test set is empty).
+                results[metric] = np.nan
+            elif metric == 'accuracy':
+                n_correct = sum(count for (true, pred), count in self.confusion.items() if true == pred)
+                n_total = sum(self.confusion.values())
+                results[metric] = float(n_correct / n_total) if kwargs.get('normalize', True) else float(n_correct)
+            elif metric in ['precision', 'recall', 'f1']:
+                usable_kwargs = {key: kwargs[key] for key in kwargs
+                                 if key in ['labels', 'pos_label', 'average', 'zero_division']}
+                results[metric] = self._get_precision_recall_f1(metric, **usable_kwargs)
+            elif _is_metric_at_k(metric):
+                results[metric] = self._get_metric_at_k(metric)
+            else:
+                logging.error("Metric %s cannot be computed from predictions accumulated in chunks.", metric)
+        return results
+
+
 def metrics_at_k(raw_true, raw_pred, k):
     """Calculate metrics at k (e.g. precision@k).
 
@@ -1,24 +1,59 @@
 """Functions related to the execution of the pipeline.
 
 """
+import ast
+import asyncio
+import collections
+import concurrent.futures
+import inspect
+import logging
+import multiprocessing
 import os
+import time
+import traceback
 
 import numpy as np
 import pandas as pd
-from tqdm.auto import tqdm
 
+from modev import caching
 from modev import common
 from modev import default_pars
+from modev import etl
+from modev import evaluation
+from modev import scheduling
+from modev import utils
+
+try:
+    import resource
+except ImportError:
+    # Memory limits are not available on this platform (e.g. Windows).
+    resource = None
+
+tqdm_auto = utils.lazy_import('tqdm.auto')
 
 approach_key = default_pars.approach_key
 dev_key = default_pars.dev_key
+elapsed_key = default_pars.elapsed_key
 fold_key = default_pars.fold_key
 function_key = default_pars.function_key
+id_key = default_pars.id_key
+key_key = default_pars.key_key
 pars_key = default_pars.pars_key
 playground_key = default_pars.playground_key
+predicted_cost_key = default_pars.predicted_cost_key
+status_key = default_pars.status_key
 test_key = default_pars.test_key
 train_key = default_pars.train_key
 
+# Seconds spent by the framework within executions run in the current process (creating approaches, and selecting the
+# rows of train and test sets), which OverheadReport counts as framework time instead of time of executions.
+_framework_time_in_executions = 0.0
+
+
+def _add_framework_time(start):
+    global _framework_time_in_executions
+    _framework_time_in_executions += time.perf_counter() - start
+
 
 def _get_approaches_functions_from_grid(approaches_grid):
     approaches_functions = {app_name: approaches_grid[app_name][function_key] for app_name in approaches_grid}
@@ -32,57 +67,800 @@ def _add_metrics_to_pars_folds(i, pars_folds, results):
         pars_folds.loc[i, metric] = results[metric]
 
 
+def _reuse_previous_results(pars_folds, previous_results):
+    # Take executed rows of previous results that have an execution key (and, for repeated keys, take the last one).
+    previous_results = [results[results[default_pars.executed_key].astype(bool)] for results in previous_results
+                        if key_key in results.columns]
+    if len(previous_results) == 0:
+        return np.zeros(len(pars_folds), dtype=bool)
+    previous = pd.concat(previous_results, ignore_index=True).drop_duplicates(subset=key_key, keep='last')
+    previous = previous.set_index(key_key).reindex(pars_folds[key_key])
+    # Only reuse results for executions that are not already executed.
+    reused = previous[default_pars.executed_key].notnull().to_numpy() & \
+        ~pars_folds[default_pars.executed_key].astype(bool).to_numpy()
+    if not reused.any():
+        return reused
+    previous_columns = common.get_metrics_from_results(previous.reset_index())
+    previous_columns += [column for column in [elapsed_key, status_key] if column in previous.columns]
+    for metric in previous_columns:
+        if metric not in pars_folds.columns:
+            pars_folds[metric] = None if metric == status_key else np.nan
+        pars_folds.loc[reused, metric] = previous.loc[reused, metric].to_numpy()
+    pars_folds.loc[reused, default_pars.executed_key] = True
+    logging.info("Reusing previous results of %i executions.", reused.sum())
+    return reused
+
+
+def execute_and_evaluate(data, train_indexes, test_indexes, fold, approach_function, approach_pars, execution_function,
+                         execution_pars, evaluation_function, evaluation_pars, preprocessor=None, columns=None):
+    """Execute an approach (with certain parameters) on a fold, and evaluate its predictions.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data, as returned by load inputs function.
+    train_indexes : dict
+        Indexes of train sets (or playground sets) of all folds.
+    test_indexes : dict
+        Indexes of dev sets (or test sets) of all folds.
+    fold : int
+        Fold to execute.
+    approach_function : class
+        Approach (usually, a class with 'fit' and 'predict' methods).
+    approach_pars : dict
+        Parameters of the approach.
+    execution_function : function
+        Execution function (see execute_model).
+    execution_pars : dict
+        Parameters of the execution function.
+    evaluation_function : function
+        Evaluation function (see evaluation.evaluate_predictions).
+    evaluation_pars : dict
+        Parameters of the evaluation function (its 'metrics' are also given to the execution function, if it accepts
+        that argument).
+    preprocessor : preprocessing.FoldPreprocessor or None
+        Preprocessing of the data of each fold (whose output is given to the execution function as 'fold_data');
+        None to not preprocess data.
+    columns : list or None
+        Columns required by the approach (given to the execution function as 'columns', if it accepts that argument,
+        and there is no preprocessing); None to give all columns to the approach.
+
+    Returns
+    -------
+    evaluation_results : dict
+        Value of each of the metrics.
+
+    """
+    start = time.perf_counter()
+    model = approach_function(**approach_pars)
+    _add_framework_time(start)
+
+    # Fit and predict with approach (on the preprocessed data of this fold, if there is preprocessing).
+    fold_train_indexes, fold_test_indexes, execution_pars = _prepare_execution(
+        data, train_indexes, test_indexes, fold, execution_function, execution_pars, evaluation_pars, preprocessor,
+        columns)
+    execution_results = execution_function(model, data, fold_train_indexes, fold_test_indexes, **execution_pars)
+
+    # Evaluate predictions.
+    evaluation_results = evaluation_function(execution_results, **evaluation_pars)
+    return evaluation_results
+
+
+def _prepare_execution(data, train_indexes, test_indexes, fold, execution_function, execution_pars, evaluation_pars,
+                       preprocessor, columns):
+    # Indexes of train and test sets of the fold, and parameters of the execution function (including preprocessed
+    # data of the fold, or columns required by the approach, and the metrics that will be evaluated).
+    # TODO: In test_mode, repeat playground so that train and test sets always have the same number of keys. Then
+    #  remove the following condition.
+    if len(train_indexes) == 1:
+        fold_train_indexes = train_indexes[0]
+    else:
+        fold_train_indexes = train_indexes[fold]
+    fold_test_indexes = test_indexes[fold]
+    if preprocessor is not None:
+        if not utils.function_accepts_argument(execution_function, 'fold_data'):
+            raise ValueError("To use preprocessing, the execution function must accept argument 'fold_data'.")
+        fold_data = preprocessor.get_fold_data(fold, data, fold_train_indexes, fold_test_indexes)
+        execution_pars = dict(execution_pars, fold_data=fold_data)
+    elif columns is not None and utils.function_accepts_argument(execution_function, 'columns'):
+        execution_pars = dict(execution_pars, columns=columns)
+    if 'metrics' in evaluation_pars and 'metrics' not in execution_pars and \
+            utils.function_accepts_argument(execution_function, 'metrics'):
+        execution_pars = dict(execution_pars, metrics=evaluation_pars['metrics'])
+    return fold_train_indexes, fold_test_indexes, execution_pars
+
+
+def is_async_approach(approach_function):
+    """Return True if an approach has an asynchronous 'fit' or 'predict' method (defined with 'async def'), e.g. a
+    client of a remote model server.
+
+    Parameters
+    ----------
+    approach_function : class
+        Approach.
+
+    Returns
+    -------
+    is_async : bool
+        True if the approach is asynchronous.
+
+    """
+    return any(inspect.iscoroutinefunction(getattr(approach_function, method, None)) for method in ['fit', 'predict'])
+
+
+async def execute_and_evaluate_async(data, train_indexes, test_indexes, fold, approach_function, approach_pars,
+                                     execution_function, execution_pars, evaluation_function, evaluation_pars,
+                                     preprocessor=None, columns=None, session=None):
+    """Execute an asynchronous approach (with certain parameters) on a fold, and evaluate its predictions.
+
+    This is the asynchronous version of execute_and_evaluate (see its documentation for all other parameters). If the
+    execution function is execute_model, execute_model_async is used instead.
+
+    Parameters
+    ----------
+    session : object or None
+        Session of the approach (as returned by its 'create_session' method, e.g. a connection to a model server),
+        that is given to the approach as argument 'session'; None if the approach has no session.
+
+    Returns
+    -------
+    evaluation_results : dict
+        Value of each of the metrics.
+
+    """
+    if session is not None:
+        approach_pars = dict(approach_pars, session=session)
+    model = approach_function(**approach_pars)
+
+    if execution_function is execute_model:
+        execution_function = execute_model_async
+    fold_train_indexes, fold_test_indexes, execution_pars = _prepare_execution(
+        data, train_indexes, test_indexes, fold, execution_function, execution_pars, evaluation_pars, preprocessor,
+        columns)
+    execution_results = execution_function(model, data, fold_train_indexes, fold_test_indexes, **execution_pars)
+    if inspect.isawaitable(execution_results):
+        execution_results = await execution_results
+
+    # Evaluate predictions.
+    evaluation_results = evaluation_function(execution_results, **evaluation_pars)
+    return evaluation_results
+
+
+def _get_virtual_memory_size():
+    # Size (in bytes) of the virtual memory of the current process (only available on Linux; otherwise, zero).
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _run_with_limits(connection, function, arguments, memory_limit):
+    # Run function in a child process and send its output (and status) through connection.
+    status, output, message = default_pars.status_ok, None, None
+    try:
+        if memory_limit is not None:
+            limit = _get_virtual_memory_size() + int(memory_limit)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        output = function(*arguments)
+    except MemoryError:
+        status, message = default_pars.status_memory_limit, traceback.format_exc()
+    except Exception:
+        status, message = default_pars.status_error, traceback.format_exc()
+    try:
+        connection.send((status, output, message))
+    except Exception:
+        connection.send((default_pars.status_error, None, traceback.format_exc()))
+    connection.close()
+
+
+def execute_with_limits(function, arguments, timeout=default_pars.execution_pars_timeout,
+                        memory_limit=default_pars.execution_pars_memory_limit):
+    """Run a function in a child process, with a limit on time and memory, so that if it hangs, crashes or uses too
+    much memory, the current process is not affected.
+
+    Parameters
+    ----------
+    function : function
+        Function to run (e.g. execute_and_evaluate).
+    arguments : tuple
+        Arguments of the function.
+    timeout : float or None
+        Maximum number of seconds the function can run (after that, the child process is killed); None for no limit.
+    memory_limit : int or None
+        Maximum memory (in bytes) that the function can allocate, on top of the memory already used by the current
+        process (e.g. by the data); None for no limit. It is applied as a limit of the virtual memory of the child
+        process (RLIMIT_AS), so it is only available on Unix.
+
+    Returns
+    -------
+    output : object or None
+        Output of the function; None if it did not finish successfully.
+    elapsed : float
+        Seconds that the function took to run (or until it was stopped).
+    status : str
+        'ok' if the function finished successfully, 'timeout' if it exceeded the time limit, 'memory_limit' if it
+        exceeded the memory limit, and 'error' if it raised an exception (or the child process crashed).
+
+    """
+    if memory_limit is not None and resource is None:
+        raise ValueError("Memory limits are not available on this platform.")
+    # Child processes are forked if possible, so that data does not need to be copied into them.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_with_limits, args=(sender, function, arguments, memory_limit))
+    start = time.perf_counter()
+    process.start()
+    sender.close()
+    status, output, message = default_pars.status_timeout, None, f"Execution exceeded the time limit of {timeout} s."
+    if receiver.poll(timeout):
+        try:
+            status, output, message = receiver.recv()
+        except EOFError:
+            # The child process died without sending anything (e.g. killed by the system for using too much memory).
+            status = default_pars.status_error if memory_limit is None else default_pars.status_memory_limit
+            message = "Execution process died unexpectedly."
+    elapsed = time.perf_counter() - start
+    if process.is_alive():
+        process.kill()
+    process.join()
+    receiver.close()
+    if status != default_pars.status_ok:
+        logging.warning("Execution finished with status '%s' after %.3g s: %s", status, elapsed, message)
+    return output, elapsed, status
+
+
+def _record_execution(i, pars_folds, evaluation_results, elapsed, status, leaderboard, results_store):
+    # Ensure metrics columns exist in pars_folds and write results (and elapsed time and status) for these parameters
+    # and fold. Executions that did not finish successfully are recorded without metrics.
+    if evaluation_results is not None:
+        _add_metrics_to_pars_folds(i, pars_folds, evaluation_results)
+    _add_metrics_to_pars_folds(i, pars_folds, {elapsed_key: elapsed})
+    if status is not None:
+        if status_key not in pars_folds.columns:
+            pars_folds[status_key] = None
+        pars_folds.loc[i, status_key] = status
+    if leaderboard is not None and evaluation_results is not None:
+        leaderboard.update(pars_folds.at[i, id_key], pars_folds.at[i, approach_key], pars_folds.at[i, pars_key],
+                           evaluation_results)
+
+    # Mark current row as executed.
+    pars_folds.loc[i, default_pars.executed_key] = True
+    if results_store is not None:
+        results_store.add_results(pars_folds.loc[[i]])
+
+
+# Inputs of executions (of one or more experiments, identified by a name), given once to each of the processes that run
+# executions in parallel.
+_process_payloads = {}
+
+
+def _initialise_process(payloads):
+    _process_payloads.update(payloads)
+
+
+def create_process_pool(payloads, n_jobs):
+    """Create a pool of processes that can run executions of one or more experiments in parallel.
+
+    Parameters
+    ----------
+    payloads : dict
+        Payload (see run_execution) of each experiment, identified by a name.
+    n_jobs : int
+        Number of processes.
+
+    Returns
+    -------
+    pool : concurrent.futures.ProcessPoolExecutor
+        Pool of processes, where each process has received all payloads (only once, when it started).
+
+    """
+    return concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs, initializer=_initialise_process,
+                                                  initargs=(payloads,))
+
+
+def _get_execution_arguments(payload, fold, approach_name, approach_pars):
+    # Arguments of execute_and_evaluate (or execute_and_evaluate_async) for an execution.
+    return (payload['data'], payload['train_indexes'], payload['test_indexes'], fold,
+            payload['approaches_function'][approach_name], approach_pars, payload['execution_function'],
+            payload['execution_pars'], payload['evaluation_function'], payload['evaluation_pars'],
+            payload.get('preprocessor'), payload.get('approaches_columns', {}).get(approach_name))
+
+
+def run_execution(payload, fold, approach_name, approach_pars):
+    """Run an execution (in a separate process, if there are limits of time or memory), see execute_and_evaluate and
+    execute_with_limits.
+
+    Parameters
+    ----------
+    payload : dict
+        Inputs of execute_and_evaluate (except fold, approach function and approach pars, and with 'preprocessor'
+        being optional), 'approaches_function' (dictionary of approach name and approach function), and, optionally,
+        'approaches_columns' (dictionary of approach name and required columns) and limits 'timeout' and
+        'memory_limit'.
+    fold : int
+        Fold to execute.
+    approach_name : str
+        Name of approach.
+    approach_pars : dict
+        Parameters of the approach.
+
+    Returns
+    -------
+    evaluation_results : dict or None
+        Value of each of the metrics; None if the execution did not finish successfully.
+    elapsed : float
+        Seconds that the execution took.
+    status : str or None
+        Status of the execution (see execute_with_limits); None if it was not run in a separate process.
+
+    """
+    arguments = _get_execution_arguments(payload, fold, approach_name, approach_pars)
+    timeout = payload.get('timeout')
+    memory_limit = payload.get('memory_limit')
+    if timeout is None and memory_limit is None:
+        start = time.perf_counter()
+        evaluation_results = execute_and_evaluate(*arguments)
+        return evaluation_results, time.perf_counter() - start, None
+    return execute_with_limits(execute_and_evaluate, arguments, timeout=timeout, memory_limit=memory_limit)
+
+
+def _execute_in_process(payload_name, fold, approach_name, approach_pars):
+    return run_execution(_process_payloads[payload_name], fold, approach_name, approach_pars)
+
+
+def _sort_by_predicted_cost(points, pars_folds, cost_hints):
+    # Estimate (or re-estimate, given the executions timed so far) the cost of pending executions, and sort them from
+    # the most to the least costly.
+    indexes = [i for i, _ in points]
+    costs = scheduling.estimate_costs(pars_folds.loc[indexes], history=pars_folds, cost_hints=cost_hints)
+    pars_folds.loc[indexes, predicted_cost_key] = costs
+    return collections.deque(points[j] for j in scheduling.get_schedule(costs))
+
+
+def _run_in_parallel(points, pars_folds, n_jobs, payload, cost_hints, leaderboard, results_store, results_file,
+                     save_every, pool=None, payload_name=None, deadline=None):
+    # If no pool is given, create one for this experiment only.
+    own_pool = pool is None
+    if own_pool:
+        pool = create_process_pool({payload_name: payload}, n_jobs)
+    try:
+        _run_in_pool(points, pars_folds, n_jobs, pool, payload_name, cost_hints, leaderboard, results_store,
+                     results_file, save_every, deadline)
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+
+def _is_past(deadline):
+    return deadline is not None and time.time() >= deadline
+
+
+def _run_in_pool(points, pars_folds, n_jobs, pool, payload_name, cost_hints, leaderboard, results_store, results_file,
+                 save_every, deadline):
+    pending = _sort_by_predicted_cost(points, pars_folds, cost_hints)
+    n_timed = pars_folds[elapsed_key].notnull().sum() if elapsed_key in pars_folds.columns else 0
+    n_finished = 0
+    running = {}
+    with tqdm_auto.tqdm(total=len(pending)) as progress:
+        while len(pending) > 0 or len(running) > 0:
+            if len(pending) > 0 and _is_past(deadline):
+                # Do not start new executions (but wait for those that are running).
+                logging.warning("Time budget exhausted with %i executions left.", len(pending))
+                pending.clear()
+            # Keep as many executions running as processes (so that the order of the rest can still change).
+            while len(pending) > 0 and len(running) < n_jobs:
+                i, row = pending.popleft()
+                # If results are stored in a shared store, skip executions that other workers have claimed.
+                if results_store is not None and not results_store.claim(row[key_key]):
+                    progress.update()
+                    continue
+                running[pool.submit(_execute_in_process, payload_name, row[fold_key], row[approach_key],
+                                    row[pars_key])] = i
+            if len(running) == 0:
+                continue
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                evaluation_results, elapsed, status = future.result()
+                _record_execution(i, pars_folds, evaluation_results, elapsed, status, leaderboard, results_store)
+                progress.update()
+                n_finished += 1
+                # Optionally save temporary results to file.
+                if results_file is not None and (n_finished % save_every == 0):
+                    pars_folds.to_csv(results_file, index=False)
+            # Improve predictions of costs every time the number of timed executions doubles.
+            n_timed_now = pars_folds[elapsed_key].notnull().sum()
+            if len(pending) > 0 and n_timed_now >= max(2 * n_timed, n_jobs):
+                pending = _sort_by_predicted_cost(list(pending), pars_folds, cost_hints)
+                n_timed = n_timed_now
+
+
+class OverheadReport:
+    def __init__(self):
+        """Accumulated time spent by the framework (bookkeeping of executions, creating approaches, and selecting the
+        rows of train and test sets) compared to the time spent running executions (fitting and predicting with
+        approaches, and evaluating predictions). Executions run in separate processes (with limits of time or memory)
+        are entirely counted as time of executions.
+
+        Methods
+        -------
+        add
+            Add the times of a loop of executions.
+        get_report
+            Return total and per-execution times of framework and executions.
+
+        """
+        self.n_executions = 0
+        self.total_time = 0.0
+        self.model_time = 0.0
+
+    def add(self, n_executions, total_time, model_time):
+        self.n_executions += int(n_executions)
+        self.total_time += total_time
+        self.model_time += model_time
+
+    def get_report(self):
+        """Return total and per-execution times of framework and executions.
+
+        Returns
+        -------
+        report : dict
+            Number of executions, total time (in seconds), time spent running executions ('model_time'), time spent by
+            the framework ('framework_time', i.e. the rest), the latter two per execution, and the fraction of the total
+            time spent by the framework.
+
+        """
+        framework_time = max(self.total_time - self.model_time, 0.0)
+        n_executions = max(self.n_executions, 1)
+        report = {'n_executions': self.n_executions, 'total_time': self.total_time, 'model_time': self.model_time,
+                  'framework_time': framework_time, 'model_time_per_execution': self.model_time / n_executions,
+                  'framework_time_per_execution': framework_time / n_executions,
+                  'framework_fraction': framework_time / self.total_time if self.total_time > 0 else np.nan}
+        return report
+
+
+def _record_lean_executions(indexes, pars_folds, metrics_values, elapsed, statuses, leaderboard, results_store):
+    # Write the results of a batch of executions (given as arrays aligned with indexes) into pars_folds at once.
+    if len(indexes) == 0:
+        return
+    for metric, values in metrics_values.items():
+        if metric not in pars_folds.columns:
+            pars_folds[metric] = np.nan
+        pars_folds.loc[indexes, metric] = values
+    if elapsed_key not in pars_folds.columns:
+        pars_folds[elapsed_key] = np.nan
+    pars_folds.loc[indexes, elapsed_key] = elapsed
+    if any(status is not None for status in statuses):
+        if status_key not in pars_folds.columns:
+            pars_folds[status_key] = None
+        pars_folds.loc[indexes, status_key] = statuses
+    pars_folds.loc[indexes, default_pars.executed_key] = True
+    if leaderboard is not None:
+        leaderboard.update_from_results(pars_folds.loc[indexes])
+    if results_store is not None:
+        results_store.add_results(pars_folds.loc[indexes])
+
+
+def _run_lean(indexes, pars_folds, payload, leaderboard, results_store, results_file, save_every, progress_interval,
+              overhead_report, deadline):
+    # Run executions with as little bookkeeping per execution as possible: parameters are read once as lists, results
+    # are written to preallocated arrays, and they are copied into pars_folds (and to leaderboard, store and progress
+    # bar) in batches, every 'progress_interval' seconds (or every 'save_every' executions, if results are saved).
+    n_points = len(indexes)
+    folds = pars_folds.loc[indexes, fold_key].tolist()
+    approaches = pars_folds.loc[indexes, approach_key].tolist()
+    pars = pars_folds.loc[indexes, pars_key].tolist()
+    keys = pars_folds.loc[indexes, key_key].tolist()
+    executed = np.zeros(n_points, dtype=bool)
+    elapsed = np.full(n_points, np.nan)
+    statuses = [None] * n_points
+    metrics_values = {}
+    start = last_update = time.perf_counter()
+    framework_start = _framework_time_in_executions
+    n_recorded = 0
+    n_saved = 0
+    with tqdm_auto.tqdm(total=n_points, mininterval=progress_interval) as progress:
+        for j in range(n_points):
+            stop = _is_past(deadline)
+            # If results are stored in a shared store, skip executions that other workers have claimed (or executed).
+            if not stop and (results_store is None or results_store.claim(keys[j])):
+                evaluation_results, elapsed[j], statuses[j] = run_execution(payload, folds[j], approaches[j], pars[j])
+                executed[j] = True
+                if evaluation_results is not None:
+                    for metric, value in evaluation_results.items():
+                        if metric not in metrics_values:
+                            metrics_values[metric] = np.full(n_points, np.nan)
+                        metrics_values[metric][j] = value
+            now = time.perf_counter()
+            if not stop and (now - last_update < progress_interval) and (j + 1 - n_recorded < save_every) and \
+                    (j + 1 < n_points):
+                continue
+            batch = slice(n_recorded, j + 1)
+            selected = executed[batch]
+            _record_lean_executions(indexes[batch][selected], pars_folds,
+                                    {metric: values[batch][selected] for metric, values in metrics_values.items()},
+                                    elapsed[batch][selected], [status for status, is_executed in
+                                                               zip(statuses[batch], selected) if is_executed],
+                                    leaderboard, results_store)
+            progress.update(j + 1 - n_recorded)
+            n_recorded = j + 1
+            last_update = now
+            # Optionally save temporary results to file.
+            if results_file is not None and (n_recorded - n_saved >= save_every):
+                pars_folds.to_csv(results_file, index=False)
+                n_saved = n_recorded
+            if stop:
+                logging.warning("Time budget exhausted with %i executions left.", n_points - j)
+                break
+    if overhead_report is not None:
+        model_time = float(np.nansum(elapsed)) - (_framework_time_in_executions - framework_start)
+        overhead_report.add(executed.sum(), time.perf_counter() - start, model_time)
+
+
+async def _create_sessions(approaches_function, approach_names):
+    # Session of each approach that provides one (e.g. a connection to a model server), shared by all its executions.
+    sessions = {}
+    for approach_name in approach_names:
+        create_session = getattr(approaches_function[approach_name], 'create_session', None)
+        if create_session is not None:
+            sessions[approach_name] = await _await_if_needed(create_session())
+    return sessions
+
+
+async def _close_sessions(sessions):
+    for session in sessions.values():
+        close = getattr(session, 'aclose', None) or getattr(session, 'close', None)
+        if close is not None:
+            await _await_if_needed(close())
+
+
+async def _run_execution_async(payload, fold, approach_name, approach_pars, session):
+    # Run an execution of an asynchronous approach (see run_execution); a timeout (if any) is applied without using a
+    # separate process. As in execute_with_limits, if there are limits, errors are recorded as a status (instead of
+    # being raised).
+    arguments = _get_execution_arguments(payload, fold, approach_name, approach_pars)
+    has_limits = payload.get('timeout') is not None or payload.get('memory_limit') is not None
+    # As in run_execution, the status of successful executions is 'ok' only if there are limits.
+    status = default_pars.status_ok if has_limits else None
+    start = time.perf_counter()
+    try:
+        evaluation_results = await asyncio.wait_for(execute_and_evaluate_async(*arguments, session=session),
+                                                    timeout=payload.get('timeout'))
+    except asyncio.TimeoutError:
+        evaluation_results, status = None, default_pars.status_timeout
+    except Exception:
+        if not has_limits:
+            raise
+        logging.exception("Execution of approach %s on fold %s failed.", approach_name, fold)
+        evaluation_results, status = None, default_pars.status_error
+    elapsed = time.perf_counter() - start
+    if status not in (None, default_pars.status_ok):
+        logging.warning("Execution finished with status '%s' after %.3g s.", status, elapsed)
+    return evaluation_results, elapsed, status
+
+
+async def _run_async(points, pars_folds, payload, async_approaches, concurrency, leaderboard, results_store,
+                     results_file, save_every, deadline):
+    # Keep up to 'concurrency' executions in flight: while an asynchronous approach waits (e.g. for a response of a
+    # model server), other executions run. Executions of other approaches run (and block) one at a time.
+    if payload.get('memory_limit') is not None:
+        logging.warning("Memory limits do not apply to executions of asynchronous approaches.")
+    sessions = await _create_sessions(payload['approaches_function'], async_approaches)
+    pending = iter(points)
+    n_finished = 0
+
+    async def run_pending(progress):
+        nonlocal n_finished
+        for i, row in pending:
+            if _is_past(deadline):
+                break
+            # If results are stored in a shared store, skip executions that other workers have claimed.
+            if results_store is not None and not results_store.claim(row[key_key]):
+                progress.update()
+                continue
+            if row[approach_key] in async_approaches:
+                evaluation_results, elapsed, status = await _run_execution_async(
+                    payload, row[fold_key], row[approach_key], row[pars_key], sessions.get(row[approach_key]))
+            else:
+                evaluation_results, elapsed, status = run_execution(payload, row[fold_key], row[approach_key],
+                                                                    row[pars_key])
+            _record_execution(i, pars_folds, evaluation_results, elapsed, status, leaderboard, results_store)
+            progress.update()
+            n_finished += 1
+            # Optionally save temporary results to file.
+            if results_file is not None and (n_finished % save_every == 0):
+                pars_folds.to_csv(results_file, index=False)
+
+    try:
+        with tqdm_auto.tqdm(total=len(points)) as progress:
+            # An error (if not recorded as a status) stops only one of the coroutines; the rest keep running pending
+            # executions, and the error is raised once they finish (and their results are saved).
+            outcomes = await asyncio.gather(*[run_pending(progress) for _ in range(min(concurrency, len(points)))],
+                                            return_exceptions=True)
+    finally:
+        await _close_sessions(sessions)
+        if results_file is not None:
+            pars_folds.to_csv(results_file, index=False)
+    errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    if len(errors) > 0:
+        raise errors[0]
+    if _is_past(deadline):
+        n_left = len(points) - int(pars_folds.loc[[i for i, _ in points], default_pars.executed_key].sum())
+        logging.warning("Time budget exhausted with %i executions left.", n_left)
+
+
+def _run_until_complete(coroutine):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # An event loop is already running in this thread (e.g. in a notebook), so run a new one in another thread.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as thread:
+        return thread.submit(asyncio.run, coroutine).result()
+
+
 def run_experiment(data, train_indexes, test_indexes, execution_function, execution_pars, evaluation_function,
                    evaluation_pars, exploration_function, approaches_function, approaches_pars, results_file=None,
-                   save_every=default_pars.save_every, reload=False):
+                   save_every=default_pars.save_every, reload=False, leaderboard=None, split_hash=None,
+                   reuse_results_files=None, results_store=None, executor=None,
+                   n_jobs=default_pars.scheduling_pars_n_jobs, cost_hints=None,
+                   timeout=default_pars.execution_pars_timeout, memory_limit=default_pars.execution_pars_memory_limit,
+                   lean=default_pars.execution_pars_lean,
+                   progress_interval=default_pars.execution_pars_progress_interval, overhead_report=None, pool=None,
+                   pool_payload_name=None, deadline=None, preprocessor=None, approaches_columns=None,
+                   async_concurrency=default_pars.execution_pars_async_concurrency):
     # Get list of folds to execute.
     folds = list(test_indexes)
 
     # Optionally (if an existing results_file is given) load results from file; if reload is True, ignore that file.
+    # Results from other files (e.g. of other experiments) can also be reused.
+    previous_results = []
+    pars_folds = None
     if (results_file is not None) and os.path.isfile(results_file) and not reload:
         pars_folds = pd.read_csv(results_file)
-        pars_folds[default_pars.pars_key] = [eval(row) for row in pars_folds[default_pars.pars_key]]
-    else:
-        pars_folds = None
+        if key_key in pars_folds.columns:
+            previous_results.append(pars_folds)
+            pars_folds = None
+        else:
+            # Results saved without execution keys can only be matched to the grid by their order. Ensure that saved
+            # results were computed on the same split of data.
+            saved_split_hash = caching.load_results_metadata(results_file).get(default_pars.split_hash_key)
+            if None not in [split_hash, saved_split_hash] and split_hash != saved_split_hash:
+                raise ValueError(f"Results in {results_file} were computed on a different split of data. Use "
+                                 f"reload=True to ignore them, or use a different results file.")
+            pars_folds[pars_key] = [ast.literal_eval(row) for row in pars_folds[pars_key]]
+    if reuse_results_files is not None and not reload:
+        for reuse_results_file in reuse_results_files:
+            if os.path.isfile(reuse_results_file):
+                previous_results.append(pd.read_csv(reuse_results_file))
+
+    if results_file is not None and split_hash is not None:
+        caching.save_results_metadata(results_file, {default_pars.split_hash_key: split_hash})
 
     # Initialise parameter space explorer.
     explorer = exploration_function(approaches_pars, folds, pars_folds)
     pars_folds = explorer.initialise_results()
-    n_iterations = explorer.select_executions_left()
 
-    for iteration in tqdm(range(n_iterations)):
-        i, row = explorer.get_next_point()
-        # Extract all necessary info from this row.
-        fold = row[fold_key]
-        approach_name = row[approach_key]
-        approach_pars = row[pars_key]
-        approach_function = approaches_function[approach_name]
-        model = approach_function(**approach_pars)
-
-        # TODO: In test_mode, repeat playground so that train and test sets always have the same number of keys. Then
-        #  remove the following condition.
-        if len(train_indexes) == 1:
-            fold_train_indexes = train_indexes[0]
+    # Identify each execution by a hash of everything that determines its results, and reuse previous results of
+    # executions with the same key.
+    settings = [execution_function, execution_pars, evaluation_function, evaluation_pars]
+    if preprocessor is not None:
+        settings.append(preprocessor.get_description())
+    # Columns declared in approaches inputs (unlike those declared by the approach itself) are part of the identity
+    # of executions, as are parameters.
+    declared_columns = {name: columns for name, columns in (approaches_columns or {}).items()
+                        if columns != common.get_required_columns(approaches_function[name])}
+    if len(declared_columns) > 0:
+        settings.append(declared_columns)
+    pars_folds[key_key] = caching.get_execution_keys(pars_folds, approaches_function,
+                                                     caching.get_fold_hashes(train_indexes, test_indexes), settings)
+    if results_store is not None:
+        if reload:
+            # Results in the store are ignored (and overwritten) in the same way as results in results_file.
+            results_store.reset(pars_folds[key_key].tolist())
         else:
-            fold_train_indexes = train_indexes[fold]
-        fold_test_indexes = test_indexes[fold]
+            # Reuse results of the same executions stored by any experiment (or by other workers of this experiment).
+            previous_results.append(results_store.read(keys=pars_folds[key_key].tolist(), executed_only=True,
+                                                       all_experiments=True))
+    _reuse_previous_results(pars_folds, previous_results)
+    # Executions run in parallel if there are several jobs, or if a pool of processes (e.g. shared by several
+    # experiments, whose processes have already received the payload of this experiment) is given.
+    parallel = n_jobs > 1 or pool is not None
+    if parallel or executor is not None:
+        # Estimate the cost of each execution, to run the most costly ones first.
+        pars_folds[predicted_cost_key] = scheduling.estimate_costs(pars_folds, history=pars_folds,
+                                                                   cost_hints=cost_hints)
+    if results_store is not None:
+        # Add executions of the grid to the store (as pending, unless they were already executed).
+        results_store.add_results(pars_folds)
+    n_iterations = explorer.select_executions_left()
+    if executor is not None:
+        if results_store is None:
+            raise ValueError("An executor can only be used together with a results store.")
+        # Let the executor (e.g. workers of a queue) run pending executions; their results are read from the store.
+        executor(pars_folds[key_key].tolist())
+        n_iterations = 0
 
-        # Fit and predict with approach.
-        execution_results = execution_function(
-            model, data, fold_train_indexes, fold_test_indexes, **execution_pars)
+    # Optionally keep running aggregates of results (including those loaded from file), to be able to rank models
+    # while the experiment is running.
+    if leaderboard is not None:
+        leaderboard.update_from_results(pars_folds)
 
-        # Evaluate predictions.
-        evaluation_results = evaluation_function(execution_results, **evaluation_pars)
+    payload = {'data': data, 'train_indexes': train_indexes, 'test_indexes': test_indexes,
+               'execution_function': execution_function, 'execution_pars': execution_pars,
+               'evaluation_function': evaluation_function, 'evaluation_pars': evaluation_pars,
+               'approaches_function': approaches_function, 'timeout': timeout, 'memory_limit': memory_limit,
+               'preprocessor': preprocessor, 'approaches_columns': approaches_columns or {}}
+    async_approaches = [name for name in approaches_function if is_async_approach(approaches_function[name])]
+    if len(async_approaches) > 0 and n_iterations > 0:
+        # Executions run concurrently in an event loop in the current process (even if there are several jobs).
+        points = [explorer.get_next_point() for _ in range(n_iterations)]
+        _run_until_complete(_run_async(points, pars_folds, payload, async_approaches, async_concurrency, leaderboard,
+                                       results_store, results_file, save_every, deadline))
+        n_iterations = 0
 
-        # Ensure metrics columns exist in pars_folds and write results for these parameters and fold.
-        _add_metrics_to_pars_folds(i, pars_folds, evaluation_results)
+    if parallel and n_iterations > 0:
+        points = [explorer.get_next_point() for _ in range(n_iterations)]
+        _run_in_parallel(points, pars_folds, n_jobs, payload, cost_hints, leaderboard, results_store, results_file,
+                         save_every, pool=pool, payload_name=pool_payload_name, deadline=deadline)
+        n_iterations = 0
 
-        # Mark current row as executed.
-        pars_folds.loc[i, default_pars.executed_key] = True
+    if lean and n_iterations > 0:
+        if hasattr(explorer, 'get_indexes_left'):
+            indexes = explorer.get_indexes_left()
+        else:
+            indexes = np.array([explorer.get_next_point()[0] for _ in range(n_iterations)])
+        _run_lean(indexes, pars_folds, payload, leaderboard, results_store, results_file, save_every,
+                  progress_interval, overhead_report, deadline)
+        n_iterations = 0
+
+    start = time.perf_counter()
+    framework_start = _framework_time_in_executions
+    model_time = 0.0
+    n_executed = 0
+    # If all executions were run by other paths (lean, parallel or asynchronous), no progress bar is shown.
+    for iteration in tqdm_auto.tqdm(range(n_iterations)) if n_iterations > 0 else []:
+        if _is_past(deadline):
+            logging.warning("Time budget exhausted with %i executions left.", n_iterations - iteration)
+            break
+        i, row = explorer.get_next_point()
+        # If results are stored in a shared store, skip executions that other workers have claimed (or executed).
+        if results_store is not None and not results_store.claim(row[key_key]):
+            continue
+        # Fit and predict with approach, and evaluate predictions (in a separate process, if there are limits of
+        # time or memory).
+        evaluation_results, elapsed, status = run_execution(payload, row[fold_key], row[approach_key], row[pars_key])
+        _record_execution(i, pars_folds, evaluation_results, elapsed, status, leaderboard, results_store)
+        model_time += elapsed
+        n_executed += 1
 
         # Optionally save temporary results to file.
         if results_file is not None and ((iteration + 1) % save_every == 0):
             pars_folds.to_csv(results_file, index=False)
+    if overhead_report is not None and n_executed > 0:
+        model_time -= _framework_time_in_executions - framework_start
+        overhead_report.add(n_executed, time.perf_counter() - start, model_time)
+    if preprocessor is not None:
+        logging.info("Preprocessing (in the current process): %s", preprocessor.get_stats())
+
+    # Gather results written to the store by other workers.
+    if results_store is not None:
+        reused = _reuse_previous_results(pars_folds, [results_store.read(keys=pars_folds[key_key].tolist(),
+                                                                         executed_only=True)])
+        if leaderboard is not None:
+            leaderboard.update_from_results(pars_folds[reused])
+
+    # Report how good the predictions of the costs of executions were (to be able to improve them).
+    if predicted_cost_key in pars_folds.columns:
+        report = scheduling.get_cost_report(pars_folds)
+        if report.loc['all', 'n_executions'] > 0:
+            logging.info("Actual cost of executions: %.3g s (predicted: %.3g s; median error of log cost: %.2f).",
+                         report.loc['all', 'actual'], report.loc['all', 'predicted'],
+                         report.loc['all', 'median_log_error'])
 
     # Optionally save finished results to file.
     if results_file is not None:
@@ -90,7 +868,33 @@ def run_experiment(data, train_indexes, test_indexes, execution_function, execut
     return pars_folds
 
 
-def execute_model(model, data, fold_train_indexes, fold_test_indexes, target, **_kwargs):
+def _select_batch(data_set, start, end):
+    # Rows from start to end (positions) of a dataframe, array or sparse matrix.
+    return data_set.iloc[start:end] if hasattr(data_set, 'iloc') else data_set[start:end]
+
+
+def _get_fold_sets(data, fold_train_indexes, fold_test_indexes, target, fold_data, columns):
+    if fold_data is not None:
+        # Data has already been preprocessed (and split into train and test sets) for this fold.
+        return fold_data
+    start = time.perf_counter()
+    # Select only the columns required by the approach (if declared), to avoid copying the rest.
+    data_columns = None if columns is None else [column for column in columns if column != target] + [target]
+    train_x, train_y = common.separate_predictors_and_target(
+        common.select_rows(data, fold_train_indexes, data_columns), target)
+    test_x, test_y = common.separate_predictors_and_target(
+        common.select_rows(data, fold_test_indexes, data_columns), target)
+    _add_framework_time(start)
+    return train_x, train_y, test_x, test_y
+
+
+async def _await_if_needed(value):
+    # Result of a method that can be either synchronous or asynchronous.
+    return (await value) if inspect.isawaitable(value) else value
+
+
+def execute_model(model, data, fold_train_indexes, fold_test_indexes, target, fold_data=None, columns=None,
+                  predict_batch_size=default_pars.execution_pars_predict_batch_size, metrics=None, **_kwargs):
     """Execution method (including training and prediction) for an approach.
 
     This function takes an approach 'approach_function' with parameters 'approach_pars', a train set (with predictors
@@ -105,36 +909,162 @@ def execute_model(model, data, fold_train_indexes, fold_test_indexes, target, **
         set) and a 'predict' method (to predict on the test set).
     data : pd.DataFrame
         Data, as returned by load inputs function.
-    fold_train_indexes : np.array
-        Indexes of train set (or playground set) for current fold.
-    fold_test_indexes : np.array
-        Indexes of dev set (or test set) for current fold.
+    fold_train_indexes : np.array or common.Positions
+        Indexes of train set (or playground set) for current fold (either labels of the data index, or integer
+        positions of rows).
+    fold_test_indexes : np.array or common.Positions
+        Indexes of dev set (or test set) for current fold (either labels of the data index, or integer positions of
+        rows).
     target : str
         Name of target column in both train_set and test_set.
+    fold_data : tuple or None
+        Preprocessed train and test sets of the current fold (train_x, train_y, test_x, test_y), as returned by
+        preprocessing.FoldPreprocessor.get_fold_data, which are used instead of selecting rows from data; None if there
+        is no preprocessing.
+    columns : list or None
+        Columns (predictors) required by the approach; only those (and the target) are selected from data. None to
+        give all columns (except the target) to the approach.
+    predict_batch_size : int or None
+        Number of examples of the test set to predict at a time (whose predictions are evaluated as they are made, so
+        that predictions of the whole test set are never kept in memory); None to predict the whole test set at once.
+    metrics : list or None
+        Metrics that will be evaluated (only relevant if predict_batch_size is given, to know whether predictions are
+        labels or scores, see evaluation.MetricsAccumulator); None if unknown.
 
     Returns
     -------
     execution_results : dict
-        Execution results. It contains:
+        Execution results. It contains either:
         * 'truth': np.array of true values of the target in the dev (or test) set.
         * 'prediction': np.array of predicted values of the target in the dev (or test) set.
+        or, if predict_batch_size is given:
+        * 'metrics_accumulator': evaluation.MetricsAccumulator with statistics of true and predicted values of the
+        target in the dev (or test) set.
 
     """
-    # A preprocessing method of the model could be applied here:
-    # model.preprocess(data)
-    # That method could select columns to be used as predictors for train x.
+    train_x, train_y, test_x, test_y = _get_fold_sets(data, fold_train_indexes, fold_test_indexes, target, fold_data,
+                                                      columns)
 
-    # Select train set and fit model.
-    train_set = data.loc[fold_train_indexes]
-    train_x, train_y = common.separate_predictors_and_target(train_set, target)
+    # Fit model on train set, and predict on test set.
     model.fit(train_x, train_y)
-
-    # Select test set and predict with model.
-    test_set = data.loc[fold_test_indexes]
-    test_x, test_y = common.separate_predictors_and_target(test_set, target)
+    if predict_batch_size is not None:
+        # Predict (and evaluate predictions) in batches.
+        accumulator = evaluation.MetricsAccumulator(metrics)
+        for start in range(0, len(test_y), predict_batch_size):
+            batch_x = _select_batch(test_x, start, start + predict_batch_size)
+            accumulator.update(test_y[start:start + predict_batch_size], model.predict(batch_x))
+        return {default_pars.metrics_accumulator_key: accumulator}
     prediction = model.predict(test_x)
 
     # Prepare execution results (other metrics like timing could also be included here).
     execution_results = {default_pars.truth_key: test_y, default_pars.prediction_key: prediction}
 
     return execution_results
+
+
+async def execute_model_async(model, data, fold_train_indexes, fold_test_indexes, target, fold_data=None, columns=None,
+                              predict_batch_size=default_pars.execution_pars_predict_batch_size, metrics=None,
+                              **_kwargs):
+    """Asynchronous version of execute_model, for approaches whose 'fit' or 'predict' methods are asynchronous (e.g.
+    clients of remote model servers).
+
+    See documentation of execute_model for all parameters and returned values.
+
+    """
+    train_x, train_y, test_x, test_y = _get_fold_sets(data, fold_train_indexes, fold_test_indexes, target, fold_data,
+                                                      columns)
+
+    # Fit model on train set, and predict on test set (while waiting, other executions can run).
+    await _await_if_needed(model.fit(train_x, train_y))
+    if predict_batch_size is not None:
+        # Predict (and evaluate predictions) in batches.
+        accumulator = evaluation.MetricsAccumulator(metrics)
+        for start in range(0, len(test_y), predict_batch_size):
+            batch_x = _select_batch(test_x, start, start + predict_batch_size)
+            prediction = await _await_if_needed(model.predict(batch_x))
+            accumulator.update(test_y[start:start + predict_batch_size], prediction)
+        return {default_pars.metrics_accumulator_key: accumulator}
+    prediction = await _await_if_needed(model.predict(test_x))
+
+    execution_results = {default_pars.truth_key: test_y, default_pars.prediction_key: prediction}
+
+    return execution_results
+
+
+def _select_chunk_rows(chunk, sorted_positions):
+    # Rows of a chunk (whose index contains positions of rows in the data) whose positions are in sorted_positions.
+    start = chunk.index[0] if len(chunk) > 0 else 0
+    first, last = np.searchsorted(sorted_positions, [start, start + len(chunk)])
+    return chunk.iloc[sorted_positions[first:last] - start]
+
+
+def execute_model_out_of_core(model, data, fold_train_indexes, fold_test_indexes, target, columns=None, classes=None,
+                              n_epochs=default_pars.execution_pars_n_epochs, metrics=None, **_kwargs):
+    """Execution method for an approach that can be fitted incrementally, on data that is read in chunks (e.g.
+    because it does not fit in memory).
+
+    The approach is fitted on the rows of the train set of each chunk (with 'partial_fit'), and then it predicts on the
+    rows of the test set of each chunk, whose predictions are evaluated as they are made. Hence, the memory used is
+    bounded by the size of the chunks (and the folds are the same as when the data is in memory).
+    Note: Here, 'test' refers to either a dev or a test set indistinctly.
+
+    Parameters
+    ----------
+    model : model object
+        Approach (already initialised with approach parameters) that contains a 'partial_fit' method (to fit approach
+        on a chunk of the train set) and a 'predict' method (to predict on a chunk of the test set).
+    data : etl.ChunkedData
+        Data, as returned by load inputs function (e.g. etl.ChunkedData).
+    fold_train_indexes : np.array or common.Positions
+        Positions of rows of train set (or playground set) for current fold.
+    fold_test_indexes : np.array or common.Positions
+        Positions of rows of dev set (or test set) for current fold.
+    target : str
+        Name of target column.
+    columns : list or None
+        Columns (predictors) required by the approach; only those (and the target) are read. None to read all columns.
+    classes : list or None
+        All possible values of the target (that the 'partial_fit' method of classifiers may need, e.g. in sklearn);
+        None to get them from the data (only if 'partial_fit' accepts argument 'classes').
+    n_epochs : int
+        Number of passes over the train set.
+    metrics : list or None
+        Metrics that will be evaluated (to know whether predictions are labels or scores, see
+        evaluation.MetricsAccumulator); None if unknown.
+
+    Returns
+    -------
+    execution_results : dict
+        Execution results. It contains:
+        * 'metrics_accumulator': evaluation.MetricsAccumulator with the counts of true and predicted values of the
+        target in the dev (or test) set.
+
+    """
+    if not isinstance(data, etl.ChunkedData):
+        raise ValueError("Data must be an etl.ChunkedData to be executed out of core.")
+    data_columns = None if columns is None else [column for column in columns if column != target] + [target]
+    train_positions = np.sort(np.asarray(fold_train_indexes))
+    test_positions = np.sort(np.asarray(fold_test_indexes))
+    fit_kwargs = {}
+    if utils.function_accepts_argument(model.partial_fit, 'classes'):
+        fit_kwargs['classes'] = data.get_unique(target) if classes is None else classes
+
+    # Fit model on the train set, chunk by chunk.
+    for _ in range(n_epochs):
+        for chunk in data.iter_chunks(data_columns):
+            train_chunk = _select_chunk_rows(chunk, train_positions)
+            if len(train_chunk) > 0:
+                train_x, train_y = common.separate_predictors_and_target(train_chunk, target)
+                model.partial_fit(train_x, train_y, **fit_kwargs)
+
+    # Predict on the test set, chunk by chunk, and accumulate the counts of true and predicted values.
+    accumulator = evaluation.MetricsAccumulator(metrics)
+    for chunk in data.iter_chunks(data_columns):
+        test_chunk = _select_chunk_rows(chunk, test_positions)
+        if len(test_chunk) > 0:
+            test_x, test_y = common.separate_predictors_and_target(test_chunk, target)
+            accumulator.update(test_y, model.predict(test_x))
+
+    execution_results = {default_pars.metrics_accumulator_key: accumulator}
+
+    return execution_results
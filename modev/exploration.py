@@ -85,6 +85,10 @@ class GridSearch:
         n_iterations = len(self.selection_to_execute[self.selection_to_execute])
         return n_iterations
 
+    def get_indexes_left(self):
+        # Indexes of all rows left to execute (a faster alternative to calling get_next_point repeatedly).
+        return self.pars_folds.index[self.selection_to_execute].to_numpy()
+
     def _next_point_finder(self):
         for i, row in self.pars_folds[self.selection_to_execute].iterrows():
             yield i, row
@@ -0,0 +1,326 @@
+"""Functions related to conditions (e.g. selections of rows) written as expressions on the columns of a dataframe.
+
+A condition is a string like "(df['height'] > 3) & (df['width'] < 2)" (or, equivalently, "(height > 3) & (width < 2)").
+Instead of running eval() on it, the condition is parsed once (only comparisons, boolean and arithmetic operations,
+literals and references to columns are allowed), translated into an expression that pandas can evaluate in a
+vectorised way (using numexpr, if installed), and cached, so that using the same condition again costs nothing.
+
+"""
+import ast
+import functools
+import sys
+
+# Names that can be used in conditions to refer to the dataframe itself (e.g. "df['height'] > 3").
+frame_names = ('df', 'data')
+
+_comparison_operators = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=',
+                         ast.In: 'in', ast.NotIn: 'not in'}
+_binary_operators = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.FloorDiv: '//', ast.Mod: '%',
+                     ast.Pow: '**', ast.BitAnd: '&', ast.BitOr: '|'}
+_boolean_operators = {ast.And: '&', ast.Or: '|'}
+_unary_operators = {ast.Not: '~', ast.Invert: '~', ast.USub: '-', ast.UAdd: '+'}
+# Nodes of literals (in python < 3.8, literals are parsed as ast.Num, ast.Str and ast.NameConstant nodes).
+_literal_nodes = (ast.Constant,) if sys.version_info >= (3, 8) else (ast.Num, ast.Str, ast.NameConstant)
+
+
+def _get_literal_value(node):
+    # The value of a literal node is its first field ('value' for ast.Constant, 'n' for ast.Num and 's' for ast.Str).
+    return getattr(node, node._fields[0])
+
+
+class CompiledCondition:
+    def __init__(self, condition, expression, columns):
+        """Condition that has been parsed and translated into an expression that pandas can evaluate.
+
+        Parameters
+        ----------
+        condition : str
+            Original condition.
+        expression : str
+            Equivalent expression, to be evaluated with pd.DataFrame.eval.
+        columns : frozenset
+            Names of columns (or index levels) used in the condition.
+
+        Methods
+        -------
+        evaluate
+            Evaluate condition on a dataframe and return a boolean array.
+
+        """
+        self.condition = condition
+        self.expression = expression
+        self.columns = columns
+
+    def __repr__(self):
+        return f"CompiledCondition({self.condition!r})"
+
+    def check_columns(self, df):
+        available = set(df.columns) | set(name for name in df.index.names if name is not None)
+        missing = sorted(self.columns - available, key=str)
+        if len(missing) > 0:
+            raise KeyError(f"Columns {missing} used in condition {self.condition!r} not found in dataframe.")
+
+    def evaluate(self, df):
+        self.check_columns(df)
+        selection = df.eval(self.expression)
+        if not hasattr(selection, '__len__'):
+            # A condition that does not depend on any column (e.g. "True") applies to all rows.
+            selection = [bool(selection)] * len(df)
+        return selection
+
+
+class _Translator(ast.NodeVisitor):
+    def __init__(self, condition):
+        self.condition = condition
+        self.columns = set()
+
+    def _error(self, node):
+        return ValueError(f"Condition {self.condition!r} contains an unsupported expression: "
+                          f"{ast.dump(node, annotate_fields=False)[:60]}")
+
+    def _column(self, name):
+        if not isinstance(name, str) or '`' in name:
+            raise ValueError(f"Invalid column name {name!r} in condition {self.condition!r}.")
+        self.columns.add(name)
+        return f'`{name}`'
+
+    def _is_column(self, node):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id in frame_names:
+            return True
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id in frame_names:
+            return True
+        return False
+
+    def generic_visit(self, node):
+        raise self._error(node)
+
+    def visit_Expression(self, node):
+        return self.visit(node.body)
+
+    def visit_Constant(self, node):
+        value = _get_literal_value(node)
+        if not isinstance(value, (bool, int, float, str)):
+            raise self._error(node)
+        return repr(value)
+
+    visit_Num = visit_Str = visit_NameConstant = visit_Constant
+
+    def visit_Name(self, node):
+        if node.id in frame_names:
+            raise self._error(node)
+        if node.id in ('True', 'False'):
+            return node.id
+        # A bare name refers to a column (as in pd.DataFrame.eval).
+        return self._column(node.id)
+
+    def visit_Subscript(self, node):
+        if not self._is_column(node):
+            raise self._error(node)
+        key = node.slice
+        # In python < 3.9, the key of a subscript is wrapped in an ast.Index node.
+        if hasattr(ast, 'Index') and isinstance(key, ast.Index):
+            key = key.value
+        if not isinstance(key, _literal_nodes):
+            raise self._error(node)
+        return self._column(_get_literal_value(key))
+
+    def visit_Attribute(self, node):
+        if not self._is_column(node):
+            raise self._error(node)
+        return self._column(node.attr)
+
+    def visit_List(self, node):
+        return '[' + ', '.join(self.visit(element) for element in node.elts) + ']'
+
+    visit_Tuple = visit_List
+
+    def visit_Compare(self, node):
+        terms = []
+        left = self.visit(node.left)
+        for operator, comparator in zip(node.ops, node.comparators):
+            if type(operator) not in _comparison_operators:
+                raise self._error(node)
+            right = self.visit(comparator)
+            terms.append(f'({left} {_comparison_operators[type(operator)]} {right})')
+            left = right
+        return '(' + ' & '.join(terms) + ')'
+
+    def visit_BoolOp(self, node):
+        operator = f' {_boolean_operators[type(node.op)]} '
+        return '(' + operator.join(self.visit(value) for value in node.values) + ')'
+
+    def visit_BinOp(self, node):
+        if type(node.op) not in _binary_operators:
+            raise self._error(node)
+        return f'({self.visit(node.left)} {_binary_operators[type(node.op)]} {self.visit(node.right)})'
+
+    def visit_UnaryOp(self, node):
+        return f'({_unary_operators[type(node.op)]}{self.visit(node.operand)})'
+
+    def visit_Call(self, node):
+        # Only a few common methods of columns are accepted, e.g. "df['color'].isin(['red', 'blue'])".
+        if not (isinstance(node.func, ast.Attribute) and len(node.keywords) == 0):
+            raise self._error(node)
+        column = self.visit(node.func.value)
+        method = node.func.attr
+        arguments = [self.visit(argument) for argument in node.args]
+        if method == 'isin' and len(arguments) == 1:
+            return f'({column} in {arguments[0]})'
+        elif method in ('isnull', 'isna') and len(arguments) == 0:
+            return f'({column} != {column})'
+        elif method in ('notnull', 'notna') and len(arguments) == 0:
+            return f'({column} == {column})'
+        elif method == 'between' and len(arguments) == 2:
+            return f'(({column} >= {arguments[0]}) & ({column} <= {arguments[1]}))'
+        raise self._error(node)
+
+
+class _SQLTranslator(_Translator):
+    # Translate conditions into SQL (e.g. to select rows of a table of results in a database).
+    _sql_comparison_operators = {ast.Eq: '=', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>',
+                                 ast.GtE: '>=', ast.In: 'IN', ast.NotIn: 'NOT IN'}
+    _sql_binary_operators = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.Mod: '%', ast.BitAnd: 'AND',
+                             ast.BitOr: 'OR'}
+
+    def _column(self, name):
+        if not isinstance(name, str):
+            raise ValueError(f"Invalid column name {name!r} in condition {self.condition!r}.")
+        self.columns.add(name)
+        return '"' + name.replace('"', '""') + '"'
+
+    def visit_Constant(self, node):
+        value = _get_literal_value(node)
+        if isinstance(value, bool):
+            return str(int(value))
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        return super().visit_Constant(node)
+
+    visit_Num = visit_Str = visit_NameConstant = visit_Constant
+
+    def visit_Name(self, node):
+        if node.id in ('True', 'False'):
+            return str(int(node.id == 'True'))
+        return super().visit_Name(node)
+
+    def visit_List(self, node):
+        return '(' + ', '.join(self.visit(element) for element in node.elts) + ')'
+
+    visit_Tuple = visit_List
+
+    def visit_Compare(self, node):
+        terms = []
+        left = self.visit(node.left)
+        for operator, comparator in zip(node.ops, node.comparators):
+            if type(operator) not in self._sql_comparison_operators:
+                raise self._error(node)
+            right = self.visit(comparator)
+            terms.append(f'({left} {self._sql_comparison_operators[type(operator)]} {right})')
+            left = right
+        return '(' + ' AND '.join(terms) + ')'
+
+    def visit_BoolOp(self, node):
+        operator = ' AND ' if isinstance(node.op, ast.And) else ' OR '
+        return '(' + operator.join(self.visit(value) for value in node.values) + ')'
+
+    def visit_BinOp(self, node):
+        if type(node.op) not in self._sql_binary_operators:
+            raise self._error(node)
+        return f'({self.visit(node.left)} {self._sql_binary_operators[type(node.op)]} {self.visit(node.right)})'
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, (ast.Not, ast.Invert)):
+            return f'(NOT {self.visit(node.operand)})'
+        return super().visit_UnaryOp(node)
+
+    def visit_Call(self, node):
+        if not (isinstance(node.func, ast.Attribute) and len(node.keywords) == 0):
+            raise self._error(node)
+        column = self.visit(node.func.value)
+        method = node.func.attr
+        arguments = [self.visit(argument) for argument in node.args]
+        if method == 'isin' and len(arguments) == 1:
+            return f'({column} IN {arguments[0]})'
+        elif method in ('isnull', 'isna') and len(arguments) == 0:
+            return f'({column} IS NULL)'
+        elif method in ('notnull', 'notna') and len(arguments) == 0:
+            return f'({column} IS NOT NULL)'
+        elif method == 'between' and len(arguments) == 2:
+            return f'({column} BETWEEN {arguments[0]} AND {arguments[1]})'
+        raise self._error(node)
+
+
+def _parse_condition(condition):
+    try:
+        tree = ast.parse(condition.strip(), mode='eval')
+    except SyntaxError as error:
+        raise ValueError(f"Condition {condition!r} is not a valid expression.") from error
+    return tree
+
+
+@functools.lru_cache(maxsize=256)
+def compile_condition(condition):
+    """Parse a condition and translate it into an expression that can be evaluated by pandas.
+
+    The result is cached, so compiling the same condition more than once costs nothing.
+
+    Parameters
+    ----------
+    condition : str
+        Condition, e.g. "(df['height'] > 3) & (df['width'] < 2)".
+
+    Returns
+    -------
+    compiled_condition : CompiledCondition
+        Compiled condition.
+
+    """
+    tree = _parse_condition(condition)
+    translator = _Translator(condition)
+    expression = translator.visit(tree)
+    compiled_condition = CompiledCondition(condition, expression, frozenset(translator.columns))
+    return compiled_condition
+
+
+def evaluate_condition(df, condition):
+    """Evaluate a condition on a dataframe.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Data on which condition will be evaluated.
+    condition : str or CompiledCondition
+        Condition (e.g. "(df['height'] > 3) & (df['width'] < 2)").
+
+    Returns
+    -------
+    selection : pd.Series
+        Boolean series that is True for rows that fulfil the condition.
+
+    """
+    if not isinstance(condition, CompiledCondition):
+        condition = compile_condition(condition)
+    selection = condition.evaluate(df)
+    return selection
+
+
+@functools.lru_cache(maxsize=256)
+def condition_to_sql(condition):
+    """Translate a condition into an SQL expression (to be used in a WHERE clause).
+
+    Parameters
+    ----------
+    condition : str
+        Condition, e.g. "(df['accuracy'] > 0.5) & (df['approach'] == 'dummy_predictor')".
+
+    Returns
+    -------
+    sql : str
+        Equivalent SQL expression.
+    columns : frozenset
+        Names of columns used in the condition.
+
+    """
+    translator = _SQLTranslator(condition)
+    sql = translator.visit(_parse_condition(condition))
+    return sql, frozenset(translator.columns)
@@ -2,17 +2,28 @@
 
 """
 import logging
+import os
+import time
 
+from modev import caching
 from modev import common
 from modev import default_pars
+from modev import distributed
+from modev import etl
 from modev import execution
 from modev import plotting
+from modev import preprocessing
+from modev import scheduling
+from modev import selection
+from modev import storage
 from modev import templates
+from modev import utils
 from modev import validation
 from modev.templates import default
 
 app_name_key = default_pars.approach_name_key
 function_key = default_pars.function_key
+required_columns_key = default_pars.required_columns_key
 
 logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.WARNING)
 
@@ -30,11 +41,32 @@ def _split_function_and_pars(inputs):
 
 def _split_approaches_function_and_pars(approaches):
     function = {app[app_name_key]: app[function_key] for app in approaches}
-    pars = {app[app_name_key]: {par: app[par] for par in app if par not in [function_key, app_name_key]}
+    pars = {app[app_name_key]: {par: app[par] for par in app
+                                if par not in [function_key, app_name_key, required_columns_key]}
             for app in approaches}
     return function, pars
 
 
+def _get_approaches_columns(approaches):
+    return {app[app_name_key]: common.get_required_columns(app[function_key], app) for app in approaches}
+
+
+def _project_load_columns(load_function, load_pars, approaches_columns, execution_pars, validation_pars):
+    # Return load parameters that only load the columns required by approaches, the target, and any column that may
+    # be named in validation inputs (e.g. a time column). Columns can only be projected if all approaches declare them.
+    if any(columns is None for columns in approaches_columns.values()):
+        logging.warning("Not all approaches declare their required columns; all columns will be loaded.")
+        return load_pars
+    if not utils.function_accepts_argument(load_function, 'columns') or 'usecols' in load_pars or \
+            load_pars.get('columns') is not None:
+        logging.warning("Columns cannot be projected by the load function; all columns will be loaded.")
+        return load_pars
+    columns = {column for app_columns in approaches_columns.values() for column in app_columns}
+    columns |= {value for value in list(execution_pars.values()) + list(validation_pars.values())
+                if isinstance(value, str)}
+    return dict(load_pars, columns=sorted(columns))
+
+
 def _override_default_inputs(given_inputs, default_inputs):
     # If function_key is not given in pars, default function will be used.
     # Therefore, ensure all required parameters are taken from default, except the ones explicitly given in pars.
@@ -49,6 +81,31 @@ def _override_default_inputs(given_inputs, default_inputs):
     return new_inputs
 
 
+def _get_preprocessor(preprocessing_inputs, execution_pars, memory_budget, cache_dir):
+    if preprocessing_inputs is None or len(preprocessing_inputs) == 0:
+        return None
+    if 'target' not in execution_pars:
+        raise ValueError("To use preprocessing, a 'target' must be given in execution_inputs.")
+    return preprocessing.FoldPreprocessor(preprocessing_inputs, execution_pars['target'], memory_budget=memory_budget,
+                                          cache_dir=cache_dir)
+
+
+def _get_data_to_split(data):
+    # Data that is read in chunks is split into folds using only the columns it keeps in memory.
+    return data.get_index_data() if isinstance(data, etl.ChunkedData) else data
+
+
+def _read_results_from_store(results_store, results, condition):
+    # Return None if the condition cannot be translated into SQL (so that it is evaluated on the dataframe instead).
+    try:
+        selected = results_store.read(condition=condition, keys=results[default_pars.key_key].tolist(),
+                                      executed_only=True)
+    except ValueError:
+        logging.info("Condition %r cannot be evaluated by the database.", condition)
+        return None
+    return selected
+
+
 class Pipeline:
     def __init__(self, *,
                  load_inputs=None,
@@ -58,8 +115,27 @@ class Pipeline:
                  exploration_inputs=None,
                  selection_inputs=None,
                  approaches_inputs=None,
+                 preprocessing_inputs=None,
                  results_file=None,
-                 save_every=10):
+                 save_every=10,
+                 leaderboard_callback=None,
+                 split_cache_dir=None,
+                 reuse_results_files=None,
+                 results_store=None,
+                 experiment_name=default_pars.storage_pars_experiment,
+                 executor=default_pars.executor,
+                 queue_inputs=None,
+                 n_jobs=default_pars.scheduling_pars_n_jobs,
+                 cost_hints=None,
+                 execution_timeout=default_pars.execution_pars_timeout,
+                 execution_memory_limit=default_pars.execution_pars_memory_limit,
+                 lean_execution=default_pars.execution_pars_lean,
+                 data_cache_dir=None,
+                 time_budget=None,
+                 preprocessing_memory_budget=default_pars.preprocessing_pars_memory_budget,
+                 preprocessing_cache_dir=default_pars.preprocessing_pars_cache_dir,
+                 project_columns=default_pars.etl_pars_project_columns,
+                 async_concurrency=default_pars.execution_pars_async_concurrency):
         """Model development pipeline.
 
         The arguments accepted by Pipeline refer to the usual ingredients in a data science project (data loading,
@@ -74,14 +150,15 @@ class Pipeline:
         ----------
         load_inputs : dict
             Inputs related to data loading.
-            See documentation of etl.load_local_file.
+            See documentation of etl.load_local_file (or etl.ChunkedData, for data that does not fit in memory).
         validation_inputs : dict
             Inputs related to validation method (e.g. k-fold or temporal-fold cross-validation).
             See documentation of validation.k_fold_playground_n_tests_split.
         execution_inputs : dict
             Inputs related to the execution of approaches (by default, an approach consists of a class with a 'fit' and
             a 'predict' method).
-            See documentation of execution.execute_model.
+            See documentation of execution.execute_model (or execution.execute_model_out_of_core, for data that does not
+            fit in memory).
         evaluation_inputs : dict
             Inputs related to evaluation metrics.
             See documentation of evaluation.evaluate_predictions.
@@ -96,13 +173,96 @@ class Pipeline:
             List of approaches to be used. Each element in the list is a dictionary with at least two keys:
             * 'approach_name': Name of the approach (str).
             * 'function': Actual approach (usually, a class with 'fit' and 'predict' methods).
+            * 'required_columns' (optional): List of columns (predictors) that the approach reads (if not given, they
+            are taken from attribute 'required_columns' of the approach, if it exists); only those columns are
+            selected from data in each execution. If not declared, the approach receives all columns.
             * Any other given key will be assumed to be arguments of the approach.
             See documentation of default approaches (approaches.DummyPredictor and approaches.RandomChoicePredictor).
+        preprocessing_inputs : list of dicts or None
+            Preprocessing steps applied (in order) to the data of each fold before approaches. Each element in the list
+            is a dictionary with a 'function' key, whose value is a class with 'fit' and 'transform' methods (e.g.
+            sklearn.preprocessing.StandardScaler), and any other key will be assumed to be an argument of that class.
+            Steps are fitted once per fold on its train set, and the preprocessed train and dev (or test) sets are
+            cached and given to all approaches (so the execution function must accept argument 'fold_data', like
+            execution.execute_model). None to not preprocess data.
+            See documentation of preprocessing.FoldPreprocessor.
         results_file : str or None
             Optional path to local file where to store (temporary or finished) results.
         save_every : int
             Save temporary results to file every save_every consecutive iterations. Only relevant if results_file is
             not None.
+        leaderboard_callback : function or None
+            Function to call (with the leaderboard of running results as its only argument) every time an execution
+            finishes; None to not use a callback.
+        split_cache_dir : str or None
+            Optional path to local folder where to store splits of data into train/dev/test sets, so that they are not
+            recomputed for the same data and validation inputs (and so that results loaded from 'results_file' are
+            guaranteed to have been computed on the same split); None to not cache splits.
+        reuse_results_files : list or None
+            Optional paths to results files of other experiments, whose results will be reused for executions with
+            identical approach, parameters, fold indexes, and execution and evaluation inputs; None to not reuse them.
+            Note: Results loaded from 'results_file' are reused in the same way, even if the grid of parameters changes.
+        results_store : str or storage.SQLiteResultsStore or None
+            Optional path to a SQLite database (or a results store) where results are stored, so that several processes
+            (running the same or different experiments) can safely share it; None to not use a database.
+            Processes running the same experiment split the executions between them, and results of other experiments
+            are reused for identical executions. Conditions on results (given in selection_inputs) are evaluated by the
+            database.
+        experiment_name : str
+            Name of the experiment in results_store (only relevant if results_store is a path).
+        executor : str
+            Either 'local' (to run executions in the current process) or 'queue' (to publish pending executions in
+            results_store, and wait for workers, started separately with "modev worker <results_store>", to run them).
+        queue_inputs : dict or None
+            Inputs related to the queue of executions (only relevant if executor is 'queue').
+            See documentation of distributed.QueueExecutor.
+        n_jobs : int
+            Number of executions to run in parallel (in separate processes) if executor is 'local'.
+        cost_hints : dict or None
+            Cost hint for each approach name (a number, or a function of the parameters of the approach), proportional
+            to the time it takes to execute it; None to not use hints. When executions run in parallel (or in a queue),
+            the most costly ones (estimated from timings of previous executions or, if there are none, from hints) are
+            run first.
+            See documentation of scheduling.estimate_costs.
+        execution_timeout : float or None
+            Maximum number of seconds each execution can run; None for no limit.
+        execution_memory_limit : int or None
+            Maximum memory (in bytes) each execution can allocate (on top of the memory used by data and libraries);
+            None for no limit.
+            If any of these limits is given, each execution runs in a separate process, and executions that exceed a
+            limit (or raise an error) are recorded in the results with a 'status' (and their 'elapsed' time) instead
+            of metrics, while the rest of executions keep running.
+            See documentation of execution.execute_with_limits.
+        lean_execution : bool
+            True to minimise the time spent by modev on each execution (useful for large grids of fast approaches,
+            e.g. baselines or linear models), by writing results (and updating progress, leaderboard and results_store)
+            in batches; False to record each execution as soon as it finishes. It only applies to executions run
+            sequentially in the current process. In either case, get_overhead_report compares the time spent by modev
+            with the time spent running executions.
+        data_cache_dir : str or None
+            Optional path to local folder where to store loaded data (in a format that is fast to load), so that it is
+            not loaded again with the same load inputs (unless files given in load inputs change); None to not cache
+            data.
+        time_budget : float or None
+            Maximum number of seconds to spend running executions (counted from the moment get_results is called);
+            executions left when the budget is exhausted are not run (and they can be run later, e.g. by running the
+            pipeline again with the same results_file or results_store); None for no limit.
+        preprocessing_memory_budget : int or None
+            Maximum memory (in bytes) used by cached preprocessed folds (only relevant if preprocessing_inputs is
+            given); when exceeded, the least recently used folds are spilled to disk. None for no limit.
+        preprocessing_cache_dir : str or None
+            Folder where preprocessed folds are spilled; None to use a temporary folder.
+        project_columns : bool
+            True to load only the columns required by approaches (see 'required_columns' in approaches_inputs), the
+            target, and columns named in execution and validation inputs (e.g. a time column); this requires that all
+            approaches declare their required columns, and that the load function accepts argument 'columns' (like
+            etl.load_local_file). False to load all columns.
+        async_concurrency : int
+            Maximum number of executions in flight at the same time, if any approach has asynchronous (defined with
+            'async def') 'fit' or 'predict' methods (e.g. clients of remote model servers). In that case, executions
+            run concurrently in an event loop in the current process, and approaches that have a 'create_session'
+            method receive (as argument 'session') a session created once and shared by all their executions (e.g. to
+            reuse connections). See documentation of execution.execute_model_async.
 
         Examples
         --------
@@ -120,6 +280,8 @@ class Pipeline:
         >>> pipe.plot_results()
         To get the final ranking of best approaches (after combining results of different folds):
         >>> pipe.get_selected_models()
+        To get the ranking of approaches at any time while results are being computed (e.g. from another thread):
+        >>> pipe.get_leaderboard()
 
         To initialise pipeline with a template experiment (a dictionary with 'load_inputs', 'validation_inputs', etc.):
         >>> experiment = templates.experiment_01.experiment
@@ -146,6 +308,12 @@ class Pipeline:
         self.exploration_function, self.exploration_pars = _split_function_and_pars(exploration_inputs)
         self.selection_function, self.selection_pars = _split_function_and_pars(selection_inputs)
         self.approaches_function, self.approaches_pars = _split_approaches_function_and_pars(approaches_inputs)
+        self.approaches_columns = _get_approaches_columns(approaches_inputs)
+        if project_columns:
+            self.load_pars = _project_load_columns(self.load_function, self.load_pars, self.approaches_columns,
+                                                   self.execution_pars, self.validation_pars)
+        self.preprocessor = _get_preprocessor(preprocessing_inputs, self.execution_pars, preprocessing_memory_budget,
+                                              preprocessing_cache_dir)
         # Initialise other attributes.
         self.data = None
         self.train_indexes = None
@@ -154,6 +322,29 @@ class Pipeline:
         self.ranking = None
         self.results_file = results_file
         self.save_every = save_every
+        self.leaderboard_callback = leaderboard_callback
+        self.leaderboard = None
+        self.split_cache_dir = split_cache_dir
+        self.reuse_results_files = reuse_results_files
+        self.split_hash = None
+        if isinstance(results_store, str):
+            results_store = storage.SQLiteResultsStore(results_store, experiment=experiment_name)
+        self.results_store = results_store
+        if executor not in ['local', 'queue']:
+            raise ValueError(f"Unknown executor {executor!r}; it should be either 'local' or 'queue'.")
+        if executor == 'queue' and results_store is None:
+            raise ValueError("A results_store is required to use a queue of executions.")
+        self.executor = executor
+        self.queue_inputs = {} if queue_inputs is None else queue_inputs
+        self.n_jobs = n_jobs
+        self.cost_hints = cost_hints
+        self.execution_timeout = execution_timeout
+        self.execution_memory_limit = execution_memory_limit
+        self.lean_execution = lean_execution
+        self.data_cache_dir = data_cache_dir
+        self.time_budget = time_budget
+        self.async_concurrency = async_concurrency
+        self.overhead_report = None
 
     requirements_error_message = "Methods have to be executed in the following order:" \
                                  "(1) get_data()" \
@@ -164,29 +355,123 @@ class Pipeline:
     def get_data(self, reload=False):
         _check_requirements([], self.requirements_error_message)
         if self.data is None or reload:
-            self.data = self.load_function(**self.load_pars)
+            data_cache_file = None
+            if self.data_cache_dir is not None:
+                data_cache_file = caching.get_data_cache_file(self.data_cache_dir, self.load_function, self.load_pars)
+            if data_cache_file is not None and os.path.isfile(data_cache_file) and not reload:
+                logging.info("Loading data from cache file %s", data_cache_file)
+                self.data = caching.load_data(data_cache_file)
+            else:
+                self.data = self.load_function(**self.load_pars)
+                if data_cache_file is not None:
+                    caching.save_data(data_cache_file, self.data)
         return self.data
 
     def get_indexes(self, reload=False):
         _check_requirements([self.data], self.requirements_error_message)
         if (self.train_indexes is None and self.test_indexes is None) or reload:
-            self.train_indexes, self.test_indexes = self.validation_function(self.data, **self.validation_pars)
+            data_to_split = _get_data_to_split(self.data)
+            split_cache_file = None
+            if self.split_cache_dir is not None:
+                split_cache_file = caching.get_split_cache_file(self.split_cache_dir, data_to_split,
+                                                                self.validation_function, self.validation_pars)
+            if split_cache_file is not None and os.path.isfile(split_cache_file) and not reload:
+                logging.info("Loading split from cache file %s", split_cache_file)
+                self.train_indexes, self.test_indexes = caching.load_split(split_cache_file)
+            else:
+                self.train_indexes, self.test_indexes = self.validation_function(data_to_split, **self.validation_pars)
+                if split_cache_file is not None:
+                    caching.save_split(split_cache_file, self.train_indexes, self.test_indexes)
+            self.split_hash = caching.get_indexes_hash(self.train_indexes, self.test_indexes)
+            if self.preprocessor is not None:
+                # Preprocessed folds of a previous split are no longer valid.
+                self.preprocessor.clear()
         return self.train_indexes, self.test_indexes
 
-    def get_results(self, reload=False):
+    def get_execution_payload(self):
+        # Everything needed to run executions of this experiment in another process (see execution.run_execution).
+        _check_requirements([self.data, self.train_indexes, self.test_indexes], self.requirements_error_message)
+        payload = {'data': self.data, 'train_indexes': self.train_indexes, 'test_indexes': self.test_indexes,
+                   'execution_function': self.execution_function, 'execution_pars': self.execution_pars,
+                   'evaluation_function': self.evaluation_function, 'evaluation_pars': self.evaluation_pars,
+                   'approaches_function': self.approaches_function, 'timeout': self.execution_timeout,
+                   'memory_limit': self.execution_memory_limit, 'preprocessor': self.preprocessor,
+                   'approaches_columns': self.approaches_columns}
+        return payload
+
+    def get_results(self, reload=False, pool=None, pool_payload_name=None, deadline=None):
         _check_requirements([self.data, self.train_indexes, self.test_indexes], self.requirements_error_message)
 
         if self.results is None or reload:
+            self.leaderboard = selection.Leaderboard(callback=self.leaderboard_callback)
+            self.overhead_report = execution.OverheadReport()
+            if deadline is None and self.time_budget is not None:
+                deadline = time.time() + self.time_budget
+            executor = None
+            if self.executor == 'queue':
+                queue_inputs = dict(self.queue_inputs)
+                if deadline is not None:
+                    # Stop waiting for workers when the time budget is exhausted.
+                    timeout = queue_inputs.get('timeout', default_pars.distributed_pars_timeout)
+                    queue_inputs['timeout'] = max(0.0, deadline - time.time()) if timeout is None else \
+                        min(timeout, max(0.0, deadline - time.time()))
+                executor = distributed.QueueExecutor(self.results_store, self.get_execution_payload(), **queue_inputs)
             self.results = execution.run_experiment(
                 self.data, self.train_indexes, self.test_indexes, self.execution_function, self.execution_pars,
                 self.evaluation_function, self.evaluation_pars, self.exploration_function, self.approaches_function,
-                self.approaches_pars, results_file=self.results_file, save_every=self.save_every, reload=reload)
+                self.approaches_pars, results_file=self.results_file, save_every=self.save_every, reload=reload,
+                leaderboard=self.leaderboard, split_hash=self.split_hash,
+                reuse_results_files=self.reuse_results_files, results_store=self.results_store, executor=executor,
+                n_jobs=self.n_jobs, cost_hints=self.cost_hints, timeout=self.execution_timeout,
+                memory_limit=self.execution_memory_limit, lean=self.lean_execution,
+                overhead_report=self.overhead_report, pool=pool, pool_payload_name=pool_payload_name,
+                deadline=deadline, preprocessor=self.preprocessor, approaches_columns=self.approaches_columns,
+                async_concurrency=self.async_concurrency)
         return self.results
 
+    def get_leaderboard(self, main_metric=None, aggregation_method=None):
+        _check_requirements([self.leaderboard], self.requirements_error_message)
+        if main_metric is None:
+            main_metric = self.selection_pars['main_metric']
+        if aggregation_method is None:
+            aggregation_method = self.selection_pars.get('aggregation_method',
+                                                         default_pars.selection_pars_aggregation_method)
+        return self.leaderboard.rank(main_metric, aggregation_method=aggregation_method)
+
+    def get_cost_report(self):
+        """Compare predicted and actual cost of executions (only available if executions were run in parallel or in a
+        queue), see scheduling.get_cost_report.
+
+        """
+        _check_requirements([self.results], self.requirements_error_message)
+        return scheduling.get_cost_report(self.results)
+
+    def get_overhead_report(self):
+        """Compare the time spent by modev (bookkeeping of executions) with the time spent running executions
+        sequentially in the current process, see execution.OverheadReport.
+
+        """
+        _check_requirements([self.results], self.requirements_error_message)
+        return self.overhead_report.get_report()
+
     def get_selected_models(self, reload=False):
         _check_requirements([self.results], self.requirements_error_message)
         if self.ranking is None or reload:
-            self.ranking = self.selection_function(self.results, **self.selection_pars)
+            results = self.results
+            selection_pars = self.selection_pars
+            results_condition = selection_pars.get('results_condition')
+            if self.results_store is not None and results_condition is not None:
+                # Let the database select results (of the executions of this pipeline) that fulfil the condition.
+                results = _read_results_from_store(self.results_store, self.results, results_condition)
+                if results is None:
+                    results = self.results
+                else:
+                    selection_pars = dict(selection_pars, results_condition=None)
+            # If possible (and if results have not already been selected), let the selection function combine results
+            # from the running aggregates.
+            if utils.function_accepts_argument(self.selection_function, 'leaderboard') and results is self.results:
+                selection_pars = dict(selection_pars, leaderboard=self.leaderboard)
+            self.ranking = self.selection_function(results, **selection_pars)
         return self.ranking
 
     def run(self, reload=False):
@@ -202,9 +487,31 @@ class Pipeline:
 
         return self.ranking
 
-    def plot_results(self, metrics=None):
+    def plot_results(self, metrics=None, mode=default_pars.plotting_pars_mode, **kwargs):
+        """Plot evaluation results per fold.
+
+        Parameters
+        ----------
+        metrics : list or None
+            Metrics to plot; None to plot all metrics.
+        mode : str
+            Either 'lines' (one figure per metric, with one line per model, see plotting.metric_vs_folds) or 'webgl'
+            (one figure for all metrics, that scales to thousands of models, see plotting.metrics_vs_folds).
+        kwargs
+            Additional arguments for the plotting function. In 'lines' mode with several metrics, the figure of each
+            metric is saved in its own file (e.g. 'plot_file' 'results.html' becomes 'results_accuracy.html').
+
+        """
         _check_requirements([self.results], self.requirements_error_message)
         if metrics is None:
             metrics = common.get_metrics_from_results(self.results)
-        for metric in metrics:
-            plotting.metric_vs_folds(self.results, metric)
+        if mode == 'webgl':
+            plotting.metrics_vs_folds(self.results, metrics, **kwargs)
+        else:
+            plot_file = kwargs.pop('plot_file', default_pars.plotting_pars_plot_file)
+            for metric in metrics:
+                metric_plot_file = plot_file
+                if plot_file is not None and len(metrics) > 1:
+                    root, extension = os.path.splitext(plot_file)
+                    metric_plot_file = f'{root}_{metric}{extension}'
+                plotting.metric_vs_folds(self.results, metric, plot_file=metric_plot_file, **kwargs)
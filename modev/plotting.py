@@ -1,11 +1,15 @@
 """Functions related to plotting.
 
 """
-import plotly
-import plotly.express as px
+import numpy as np
 
 from modev import default_pars
+from modev import utils
 
+plotly = utils.lazy_import('plotly')
+px = utils.lazy_import('plotly.express')
+go = utils.lazy_import('plotly.graph_objects')
+subplots = utils.lazy_import('plotly.subplots')
 
 approach_key = default_pars.approach_key
 id_key = default_pars.id_key
@@ -16,7 +20,7 @@ def metric_vs_folds(results, metric, plot_file=default_pars.plotting_pars_plot_f
                     added_cols_hover=default_pars.plotting_pars_added_cols_hover,
                     title=default_pars.plotting_pars_title, show=default_pars.plotting_pars_show,
                     width=default_pars.plotting_pars_width, height=default_pars.plotting_pars_height):
-    data_plot = results.copy()
+    data_plot = results
     cols_hover = [id_key, approach_key]
     if added_cols_hover is not None:
         cols_hover += added_cols_hover
@@ -32,3 +36,115 @@ def metric_vs_folds(results, metric, plot_file=default_pars.plotting_pars_plot_f
     if show:
         fig1.show()
     return fig1
+
+
+def _get_lines_separated_by_gaps(results, metric):
+    # Sort results by model id and fold, and insert a missing value after the last fold of each model id, so that all
+    # models can be drawn as a single trace (with one line per model).
+    data_plot = results[[id_key, fold_key, metric]].sort_values([id_key, fold_key])
+    ids = data_plot[id_key].to_numpy()
+    n_points = len(data_plot)
+    is_last = np.ones(n_points, dtype=bool)
+    is_last[:-1] = ids[1:] != ids[:-1]
+    # Position of each point in the new arrays, after adding one gap after each model id.
+    positions = np.arange(n_points) + np.concatenate([[0], np.cumsum(is_last)[:-1]])
+    n_total = n_points + int(is_last.sum())
+    x = np.full(n_total, np.nan)
+    y = np.full(n_total, np.nan)
+    model_ids = np.full(n_total, np.nan)
+    x[positions] = data_plot[fold_key].to_numpy(dtype=float)
+    y[positions] = data_plot[metric].to_numpy(dtype=float)
+    model_ids[positions] = ids
+    return x, y, model_ids
+
+
+def metrics_vs_folds(results, metrics, top_n=default_pars.plotting_pars_top_n,
+                     quantiles=default_pars.plotting_pars_quantiles, show_all=default_pars.plotting_pars_show_all,
+                     plot_file=default_pars.plotting_pars_plot_file, title=default_pars.plotting_pars_title,
+                     show=default_pars.plotting_pars_show, width=default_pars.plotting_pars_width,
+                     height_per_metric=default_pars.plotting_pars_height_per_metric):
+    """Plot results of many models for several metrics (one panel per metric) in a single figure.
+
+    Unlike metric_vs_folds (which creates one trace per model), this function scales to thousands of models:
+    * All models are drawn (using WebGL) as a single trace per metric, where lines of different models are separated
+    by gaps.
+    * Optionally, only a summary is shown, namely the 'top_n' models (with the highest mean of each metric) and bands
+    of quantiles of all models on each fold.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        Evaluations of the performance of approaches on different data folds.
+    metrics : list
+        Metrics to plot (one panel per metric).
+    top_n : int or None
+        Number of models with the highest mean of each metric to highlight; None to not highlight any model.
+    quantiles : list or None
+        Quantiles of the results of all models on each fold to show; the outer quantiles are shown as a band, and any
+        other quantile as a line; None to not show quantiles.
+    show_all : bool
+        True to draw all models (as a single trace per metric); False to show only top models and quantiles.
+    plot_file : str or None
+        Path to (html) file where the figure will be saved; None to not save it.
+    title : str or None
+        Title of the figure.
+    show : bool
+        True to show the figure.
+    width : int
+        Width of the figure.
+    height_per_metric : int
+        Height of each of the panels of the figure.
+
+    Returns
+    -------
+    fig : plotly.graph_objects.Figure
+        Figure.
+
+    """
+    fig = subplots.make_subplots(rows=len(metrics), cols=1, shared_xaxes=True, vertical_spacing=0.03,
+                                 subplot_titles=[metric.title() for metric in metrics])
+    # Top models are shown in the legend only once (even if they are among the top models of several metrics).
+    legend_ids = set()
+    for row, metric in enumerate(metrics, start=1):
+        showlegend = row == 1
+        if show_all:
+            x, y, model_ids = _get_lines_separated_by_gaps(results, metric)
+            fig.add_trace(go.Scattergl(x=x, y=y, customdata=model_ids, mode='lines', name='All models',
+                                       legendgroup='all', showlegend=showlegend,
+                                       line=dict(color='rgba(120, 120, 120, 0.3)', width=1),
+                                       hovertemplate="Model ID: %{customdata}<br>Fold: %{x}<br>%{y}<extra></extra>"),
+                          row=row, col=1)
+        if quantiles is not None and len(quantiles) > 0:
+            fold_quantiles = results.groupby(fold_key)[metric].quantile(sorted(quantiles)).unstack()
+            lower, upper = fold_quantiles.columns[0], fold_quantiles.columns[-1]
+            fig.add_trace(go.Scatter(x=fold_quantiles.index, y=fold_quantiles[upper], mode='lines', line=dict(width=0),
+                                     name=f'Quantile {upper}', legendgroup='quantiles', showlegend=False),
+                          row=row, col=1)
+            fig.add_trace(go.Scatter(x=fold_quantiles.index, y=fold_quantiles[lower], mode='lines', line=dict(width=0),
+                                     fill='tonexty', fillcolor='rgba(31, 119, 180, 0.2)', legendgroup='quantiles',
+                                     name=f'Quantiles {lower}-{upper}', showlegend=showlegend),
+                          row=row, col=1)
+            for quantile in fold_quantiles.columns[1:-1]:
+                fig.add_trace(go.Scatter(x=fold_quantiles.index, y=fold_quantiles[quantile], mode='lines',
+                                         line=dict(color='rgb(31, 119, 180)', dash='dash'), legendgroup='quantiles',
+                                         name=f'Quantile {quantile}', showlegend=showlegend),
+                              row=row, col=1)
+        if top_n is not None and top_n > 0:
+            top_ids = results.groupby(id_key)[metric].mean().nlargest(top_n).index
+            top_results = results[results[id_key].isin(top_ids)]
+            for model_id, model_results in top_results.sort_values(fold_key).groupby(id_key):
+                approach = model_results[approach_key].iloc[0]
+                fig.add_trace(go.Scattergl(x=model_results[fold_key], y=model_results[metric], mode='lines+markers',
+                                           name=f'{model_id} ({approach})', legendgroup=str(model_id),
+                                           showlegend=model_id not in legend_ids),
+                              row=row, col=1)
+                legend_ids.add(model_id)
+        fig.update_yaxes(title_text=metric.title(), row=row, col=1)
+    fig.update_xaxes(tickvals=sorted(results[fold_key].unique()))
+    fig.update_xaxes(title_text="Fold", row=len(metrics), col=1)
+    fig.update_layout(title=title, width=width, height=height_per_metric * len(metrics), legend_title="Model ID")
+    if plot_file is not None:
+        plotly.offline.plot(fig, filename=plot_file, auto_open=False)
+    if show:
+        fig.show()
+    return fig
@@ -0,0 +1,211 @@
+"""Functions related to the preprocessing stage, which runs before approaches (e.g. scaling, encoding or feature
+engineering).
+
+Preprocessing steps are declared in the experiment, and they are fitted once per fold on its train set. The transformed
+train and dev (or test) sets of each fold are cached, so that all approaches (and all their parameters) use them without
+repeating the preprocessing. If a memory budget is given, the least recently used folds are spilled to disk when the
+cache exceeds it.
+
+"""
+import collections
+import logging
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from modev import common
+from modev import default_pars
+
+
+def _get_size(value):
+    # Approximate size in memory (in bytes) of dataframes, arrays (also sparse) and tuples of them.
+    if isinstance(value, (tuple, list)):
+        return sum(_get_size(element) for element in value)
+    elif isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    elif isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    elif all(hasattr(value, attribute) for attribute in ['data', 'indices', 'indptr']):
+        # Sparse matrix (e.g. as returned by sklearn's OneHotEncoder).
+        return int(value.data.nbytes + value.indices.nbytes + value.indptr.nbytes)
+    elif hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def _protect(value):
+    # Return cached dataframes, arrays (also sparse) and tuples of them so that approaches cannot modify the cache:
+    # arrays as read-only views, dataframes as shallow copies (so that adding, removing or renaming columns does not
+    # affect the cache), and sparse matrices as copies.
+    if isinstance(value, (tuple, list)):
+        return type(value)(_protect(element) for element in value)
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    elif isinstance(value, np.ndarray):
+        view = value.view()
+        view.setflags(write=False)
+        return view
+    elif all(hasattr(value, attribute) for attribute in ['data', 'indices', 'indptr', 'copy']):
+        return value.copy()
+    return value
+
+
+class FoldPreprocessor:
+    def __init__(self, steps, target, memory_budget=default_pars.preprocessing_pars_memory_budget,
+                 cache_dir=default_pars.preprocessing_pars_cache_dir):
+        """Preprocessing of the data of each fold, fitted on its train set, and cached.
+
+        Parameters
+        ----------
+        steps : list
+            Preprocessing steps, applied in order. Each step is a dictionary with a 'function' key, whose value is a
+            class with 'fit' and 'transform' methods (e.g. sklearn.preprocessing.StandardScaler), and, optionally, any
+            other key, which is assumed to be an argument of that class.
+            Each step is fitted (with fit(train_x, train_y)) on the output of the previous step on the train set, and
+            then it transforms both the train and the dev (or test) set.
+        target : str
+            Name of target column (that is separated from predictors before preprocessing).
+        memory_budget : int or None
+            Maximum memory (in bytes) used by cached folds; when exceeded, the least recently used folds are spilled to
+            disk (and loaded again when they are needed). None for no limit.
+        cache_dir : str or None
+            Folder where folds are spilled; None to use a temporary folder (that is removed afterwards).
+
+        Methods
+        -------
+        clear
+            Remove all cached folds (e.g. after the data or its split changed).
+        get_fold_data
+            Return the preprocessed train and dev (or test) sets of a fold.
+        get_description
+            Return a description of the preprocessing steps (that is part of the identity of executions).
+        get_stats
+            Return the number of folds fitted, cache hits, and folds spilled to and loaded from disk.
+
+        """
+        self.steps = steps
+        self.target = target
+        self.memory_budget = memory_budget
+        self.cache_dir = cache_dir
+        self._initialise_cache()
+
+    def _initialise_cache(self):
+        self._memory = collections.OrderedDict()
+        self._sizes = {}
+        self._spilled = {}
+        self._temporary_dir = None
+        self._stats = {'fitted': 0, 'hits': 0, 'spilled': 0, 'loaded': 0}
+
+    def __getstate__(self):
+        # Cached folds are not copied to other processes (e.g. to workers), where they are recomputed when needed.
+        state = {'steps': self.steps, 'target': self.target, 'memory_budget': self.memory_budget,
+                 'cache_dir': self.cache_dir}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._initialise_cache()
+
+    def clear(self):
+        if self._temporary_dir is not None:
+            shutil.rmtree(self._temporary_dir, ignore_errors=True)
+        else:
+            for spill_file in self._spilled.values():
+                if os.path.isfile(spill_file):
+                    os.remove(spill_file)
+        self._initialise_cache()
+
+    def get_description(self):
+        return [{par: step[par] for par in step} for step in self.steps]
+
+    def get_stats(self):
+        return dict(self._stats)
+
+    def _fit_and_transform(self, data, fold_train_indexes, fold_test_indexes):
+        train_x, train_y = common.separate_predictors_and_target(common.select_rows(data, fold_train_indexes),
+                                                                 self.target)
+        test_x, test_y = common.separate_predictors_and_target(common.select_rows(data, fold_test_indexes),
+                                                               self.target)
+        for step in self.steps:
+            transformer = step[default_pars.function_key](**{par: step[par] for par in step
+                                                             if par != default_pars.function_key})
+            transformer.fit(train_x, train_y)
+            train_x = transformer.transform(train_x)
+            test_x = transformer.transform(test_x)
+        return train_x, train_y, test_x, test_y
+
+    def _get_spill_file(self, fold):
+        cache_dir = self.cache_dir
+        if cache_dir is None:
+            if self._temporary_dir is None:
+                self._temporary_dir = tempfile.mkdtemp(prefix='modev_preprocessing_')
+                weakref.finalize(self, shutil.rmtree, self._temporary_dir, ignore_errors=True)
+            cache_dir = self._temporary_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        return os.path.join(cache_dir, f'fold_{os.getpid()}_{id(self)}_{fold}.pkl')
+
+    def _spill(self, fold, fold_data):
+        if fold not in self._spilled:
+            spill_file = self._get_spill_file(fold)
+            with open(spill_file, 'wb') as output:
+                pickle.dump(fold_data, output, protocol=pickle.HIGHEST_PROTOCOL)
+            self._spilled[fold] = spill_file
+            self._stats['spilled'] += 1
+
+    def _store(self, fold, fold_data):
+        size = _get_size(fold_data)
+        if self.memory_budget is not None:
+            # Spill least recently used folds until the new fold fits in the budget.
+            while len(self._memory) > 0 and sum(self._sizes.values()) + size > self.memory_budget:
+                spilled_fold, spilled_data = self._memory.popitem(last=False)
+                self._sizes.pop(spilled_fold)
+                self._spill(spilled_fold, spilled_data)
+            if size > self.memory_budget:
+                logging.warning("Preprocessed fold %s (%i bytes) does not fit in the memory budget.", fold, size)
+                self._spill(fold, fold_data)
+                return
+        self._memory[fold] = fold_data
+        self._sizes[fold] = size
+
+    def get_fold_data(self, fold, data, fold_train_indexes, fold_test_indexes):
+        """Return the preprocessed train and dev (or test) sets of a fold (fitting preprocessing steps, if they have not
+        been fitted on this fold yet).
+
+        Parameters
+        ----------
+        fold : int
+            Fold.
+        data : pd.DataFrame
+            Data, as returned by load inputs function.
+        fold_train_indexes : np.array or common.Positions
+            Indexes of train set (or playground set) for current fold.
+        fold_test_indexes : np.array or common.Positions
+            Indexes of dev set (or test set) for current fold.
+
+        Returns
+        -------
+        fold_data : tuple
+            Preprocessed predictors of the train set, targets of the train set, preprocessed predictors of the dev (or
+            test) set, and targets of the dev (or test) set. Since they are shared by all executions of the fold, arrays
+            are read-only, and dataframes are shallow copies (whose values should not be modified in place).
+
+        """
+        if fold in self._memory:
+            self._memory.move_to_end(fold)
+            self._stats['hits'] += 1
+            return _protect(self._memory[fold])
+        if fold in self._spilled:
+            with open(self._spilled[fold], 'rb') as input_file:
+                fold_data = pickle.load(input_file)
+            self._stats['loaded'] += 1
+        else:
+            fold_data = self._fit_and_transform(data, fold_train_indexes, fold_test_indexes)
+            self._stats['fitted'] += 1
+        self._store(fold, fold_data)
+        return _protect(fold_data)
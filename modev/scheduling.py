@@ -0,0 +1,215 @@
+"""Functions related to the scheduling of executions (when they are run in parallel, or by workers of a queue).
+
+The cost of each execution is estimated from recorded timings of executions of the same approach with similar
+parameters (or, if there are none, from cost hints given by the user), and executions are dispatched from the longest to
+the shortest (longest processing time first), so that short executions fill the gaps left by long ones, and no worker is
+left running a long execution at the end while the others are idle.
+
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from modev import caching
+from modev import default_pars
+
+approach_key = default_pars.approach_key
+elapsed_key = default_pars.elapsed_key
+executed_key = default_pars.executed_key
+pars_key = default_pars.pars_key
+predicted_cost_key = default_pars.predicted_cost_key
+
+
+def _is_positive_number(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)) and \
+        value > 0
+
+
+def _get_timed_executions(history):
+    if history is None or len(history) == 0 or elapsed_key not in history.columns:
+        return pd.DataFrame(columns=[approach_key, pars_key, elapsed_key])
+    elapsed = pd.to_numeric(history[elapsed_key], errors='coerce')
+    timed = history[history[executed_key].astype(bool) & (elapsed > 0)]
+    return timed[[approach_key, pars_key, elapsed_key]]
+
+
+class _ApproachCostModel:
+    def __init__(self, pars, elapsed):
+        # Additive model of the logarithm of the cost: the mean over all executions of the approach, plus the effect of
+        # each parameter value (the difference between the mean for that value and the overall mean). For numerical
+        # parameters with several recorded values, the effect is interpolated (or extrapolated) linearly in log-log
+        # scale, so that unseen values (e.g. a larger number of estimators) are also estimated.
+        log_elapsed = np.log(np.asarray(elapsed, dtype=float))
+        self.mean = log_elapsed.mean()
+        self.exact = pd.Series(log_elapsed).groupby([caching.get_canonical_representation(p) for p in pars]).mean()
+        self.effects = {}
+        self.slopes = {}
+        names = set(name for p in pars for name in p)
+        for name in names:
+            values = [p.get(name) for p in pars]
+            effects = pd.Series(log_elapsed).groupby([repr(value) for value in values]).mean() - self.mean
+            self.effects[name] = effects.to_dict()
+            numbers = pd.Series(log_elapsed)[[_is_positive_number(value) for value in values]]
+            if len(numbers) > 0:
+                log_values = np.log([float(values[i]) for i in numbers.index])
+                means = numbers.groupby(log_values).mean()
+                if len(means) > 1:
+                    slope, intercept = np.polyfit(means.index.to_numpy(), means.to_numpy(), 1)
+                    self.slopes[name] = (slope, intercept)
+
+    def predict(self, pars):
+        representation = caching.get_canonical_representation(pars)
+        if representation in self.exact.index:
+            return np.exp(self.exact[representation])
+        log_cost = self.mean
+        for name, value in pars.items():
+            effects = self.effects.get(name, {})
+            if repr(value) in effects:
+                log_cost += effects[repr(value)]
+            elif name in self.slopes and _is_positive_number(value):
+                slope, intercept = self.slopes[name]
+                log_cost += slope * np.log(float(value)) + intercept - self.mean
+        return np.exp(log_cost)
+
+
+def _get_hint(cost_hints, approach, pars):
+    if cost_hints is None or approach not in cost_hints:
+        return None
+    hint = cost_hints[approach]
+    if callable(hint):
+        hint = hint(pars)
+    return float(hint)
+
+
+def estimate_costs(pars_folds, history=None, cost_hints=None, default_cost=default_pars.scheduling_pars_default_cost):
+    """Estimate the cost of each execution.
+
+    The cost of an execution is estimated from recorded timings (column 'elapsed') of executed rows of the history:
+    * If executions of the same approach with the same parameters were timed (e.g. on other folds), their (geometric)
+      mean is used.
+    * Otherwise, if executions of the same approach were timed, the effects of each of the parameter values (or, for
+      numerical parameters, the trend with the value of the parameter) are combined.
+    * Otherwise, if there is a cost hint for the approach, it is used (rescaled to seconds, if possible, by comparing
+      hints and timings of other approaches).
+    * Otherwise, the median of all timings (or default_cost, if there are none) is used.
+
+    Parameters
+    ----------
+    pars_folds : pd.DataFrame
+        Executions (with at least columns 'approach' and 'pars').
+    history : pd.DataFrame or None
+        Previous results with recorded timings (e.g. loaded from a results file); None if there are none.
+    cost_hints : dict or None
+        Cost hint for each approach name: either a number, or a function that takes the parameters of the approach
+        (as a dictionary) and returns a number (e.g. lambda pars: pars['n_estimators'] * pars['max_depth']). Hints
+        only need to be proportional to the actual cost. None to not use hints.
+    default_cost : float
+        Cost assigned to executions when there is no information to estimate it.
+
+    Returns
+    -------
+    costs : np.array
+        Estimated cost of each execution (in seconds, if there are recorded timings).
+
+    """
+    timed = _get_timed_executions(history)
+    models = {approach: _ApproachCostModel(group[pars_key].tolist(), group[elapsed_key].tolist())
+              for approach, group in timed.groupby(approach_key)}
+    # Factor to convert hints into seconds, given by timings of approaches that have hints.
+    hint_scale = 1.0
+    hinted = [(_get_hint(cost_hints, approach, pars), elapsed)
+              for approach, pars, elapsed in zip(timed[approach_key], timed[pars_key], timed[elapsed_key])]
+    ratios = [elapsed / hint for hint, elapsed in hinted if hint is not None and hint > 0]
+    if len(ratios) > 0:
+        hint_scale = float(np.median(ratios))
+    fallback_cost = float(np.median(timed[elapsed_key])) if len(timed) > 0 else default_cost
+
+    costs = np.empty(len(pars_folds))
+    for i, (approach, pars) in enumerate(zip(pars_folds[approach_key], pars_folds[pars_key])):
+        hint = _get_hint(cost_hints, approach, pars)
+        if approach in models:
+            costs[i] = models[approach].predict(pars)
+        elif hint is not None:
+            costs[i] = hint * hint_scale
+        else:
+            costs[i] = fallback_cost
+    return costs
+
+
+def get_schedule(costs):
+    """Get the order in which executions should be dispatched to workers (longest processing time first).
+
+    Parameters
+    ----------
+    costs : np.array
+        Estimated cost of each execution.
+
+    Returns
+    -------
+    order : np.array
+        Positions of executions, from the most to the least costly (ties keep their original order).
+
+    """
+    return np.argsort(-np.asarray(costs, dtype=float), kind='stable')
+
+
+def simulate_makespan(costs, n_workers, order=None):
+    """Simulate the time needed to run all executions, when each of them is dispatched (in a certain order) to the
+    first worker that becomes idle.
+
+    Parameters
+    ----------
+    costs : np.array
+        Cost of each execution.
+    n_workers : int
+        Number of workers.
+    order : np.array or None
+        Order in which executions are dispatched; None to dispatch them in their original order.
+
+    Returns
+    -------
+    makespan : float
+        Time until the last execution is finished.
+
+    """
+    costs = np.asarray(costs, dtype=float)
+    if order is not None:
+        costs = costs[order]
+    loads = [0.0] * max(1, min(n_workers, len(costs)))
+    for cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+    return max(loads)
+
+
+def get_cost_report(results):
+    """Compare the predicted cost of executions with their actual cost (elapsed time).
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        Results of an experiment, with columns 'predicted_cost' and 'elapsed'.
+
+    Returns
+    -------
+    report : pd.DataFrame
+        For each approach (and for all approaches, in row 'all'): number of timed executions, total predicted and actual
+        cost, ratio of actual to predicted cost, and median absolute error of the logarithm of the cost (e.g. 0.69 means
+        that predictions are typically off by a factor of 2).
+
+    """
+    columns = ['n_executions', 'predicted', 'actual', 'ratio', 'median_log_error']
+    if predicted_cost_key not in results.columns or elapsed_key not in results.columns:
+        return pd.DataFrame(columns=columns)
+    timed = results[results[elapsed_key].notnull() & results[predicted_cost_key].notnull()]
+    timed = timed[(timed[elapsed_key] > 0) & (timed[predicted_cost_key] > 0)]
+    groups = list(timed.groupby(approach_key)) + [('all', timed)]
+    rows = []
+    for approach, group in groups:
+        predicted = group[predicted_cost_key].sum()
+        actual = group[elapsed_key].sum()
+        log_error = np.abs(np.log(group[elapsed_key]) - np.log(group[predicted_cost_key]))
+        rows.append([approach, len(group), predicted, actual, actual / predicted if predicted > 0 else np.nan,
+                     log_error.median() if len(group) > 0 else np.nan])
+    report = pd.DataFrame(rows, columns=[approach_key] + columns).set_index(approach_key)
+    return report
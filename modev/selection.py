@@ -1,14 +1,170 @@
 """Functions related to model selection.
 
 """
+import bisect
+import math
+import threading
+
 import numpy as np
+import pandas as pd
 
 from modev import common
 from modev import default_pars
+from modev import expressions
+from modev import utils
+
+stats = utils.lazy_import('scipy.stats')
 
 approach_key = default_pars.approach_key
+fold_key = default_pars.fold_key
 id_key = default_pars.id_key
 pars_key = default_pars.pars_key
+crowding_distance_key = default_pars.selection_crowding_distance_key
+front_key = default_pars.selection_front_key
+rank_key = default_pars.selection_rank_key
+dominated_key = default_pars.selection_dominated_key
+p_value_key = default_pars.selection_p_value_key
+p_value_adjusted_key = default_pars.selection_p_value_adjusted_key
+
+# Aggregation methods that can be computed from running aggregates (count, sum, sum of squares, min and max).
+leaderboard_aggregation_methods = ['count', 'sum', 'mean', 'min', 'max', 'std', 'var']
+
+
+class Leaderboard:
+    def __init__(self, callback=None):
+        """Running aggregates of the evaluation of each model on the folds executed so far.
+
+        For each model (identified by its id) and metric, it keeps the count, sum, sum of squares, min and max of the
+        results of the executed folds. These aggregates are updated in O(1) as soon as an execution finishes, so that a
+        ranking of models can be queried at any time (e.g. from another thread or from a callback) while an experiment
+        is still running.
+
+        Parameters
+        ----------
+        callback : function or None
+            Function to call (with the leaderboard as its only argument) after every update; None to not use a
+            callback.
+
+        Methods
+        -------
+        update
+            Add the evaluation of one model on one fold to the running aggregates.
+        update_from_results
+            Add all executed rows of a results dataframe to the running aggregates.
+        get_combined_results
+            Combine results of different folds for each model (equivalent to selection.combine_fold_results).
+        rank
+            Return current ranking of models, sorted in descending value of a metric.
+
+        """
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._approaches = {}
+        self._pars = {}
+        self._aggregates = {}
+        self._metrics = []
+
+    def update(self, model_id, approach, pars, evaluation_results):
+        with self._lock:
+            if model_id not in self._aggregates:
+                self._approaches[model_id] = approach
+                self._pars[model_id] = pars
+                self._aggregates[model_id] = {}
+            model_aggregates = self._aggregates[model_id]
+            for metric, value in evaluation_results.items():
+                if metric not in self._metrics:
+                    self._metrics.append(metric)
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    continue
+                if metric not in model_aggregates:
+                    # Aggregates are stored as [count, sum, sum of squares, min, max].
+                    model_aggregates[metric] = [1, value, value * value, value, value]
+                else:
+                    aggregates = model_aggregates[metric]
+                    aggregates[0] += 1
+                    aggregates[1] += value
+                    aggregates[2] += value * value
+                    aggregates[3] = min(aggregates[3], value)
+                    aggregates[4] = max(aggregates[4], value)
+        if self.callback is not None:
+            self.callback(self)
+
+    def update_from_results(self, results):
+        metrics = common.get_metrics_from_results(results)
+        executed = results[results[default_pars.executed_key].astype(bool)]
+        for model_id, approach, pars, *values in zip(executed[id_key], executed[approach_key], executed[pars_key],
+                                                     *[executed[metric] for metric in metrics]):
+            self.update(model_id, approach, pars, dict(zip(metrics, values)))
+
+    @staticmethod
+    def _aggregate(aggregates, aggregation_method):
+        if aggregates is None:
+            return 0 if aggregation_method == 'count' else np.nan
+        count, total, total_squares, minimum, maximum = aggregates
+        if aggregation_method == 'count':
+            return count
+        elif aggregation_method == 'sum':
+            return total
+        elif aggregation_method == 'mean':
+            return total / count
+        elif aggregation_method == 'min':
+            return minimum
+        elif aggregation_method == 'max':
+            return maximum
+        # Sample variance (with one degree of freedom), as in pandas.
+        if count < 2:
+            return np.nan
+        variance = max(total_squares - total * total / count, 0) / (count - 1)
+        if aggregation_method == 'var':
+            return variance
+        return math.sqrt(variance)
+
+    def get_combined_results(self, aggregation_method=default_pars.selection_pars_aggregation_method):
+        """Combine results of different folds for each model, using the running aggregates.
+
+        Parameters
+        ----------
+        aggregation_method : str
+            Aggregation method to use to combine evaluations of different folds (one of 'count', 'sum', 'mean', 'min',
+            'max', 'std' or 'var').
+
+        Returns
+        -------
+        combined_results : pd.DataFrame
+            Combined results (with the same structure as the output of selection.combine_fold_results).
+
+        """
+        if aggregation_method not in leaderboard_aggregation_methods:
+            raise ValueError(f"Aggregation method '{aggregation_method}' cannot be computed from running aggregates. "
+                             f"Use one of {leaderboard_aggregation_methods}.")
+        # Take a consistent snapshot of the aggregates, so that updates can continue while results are combined.
+        with self._lock:
+            model_ids = list(self._aggregates)
+            metrics = list(self._metrics)
+            combined = {metric: [self._aggregate(self._aggregates[model_id].get(metric), aggregation_method)
+                                 for model_id in model_ids] for metric in metrics}
+            combined[approach_key] = [self._approaches[model_id] for model_id in model_ids]
+            combined[pars_key] = [self._pars[model_id] for model_id in model_ids]
+        combined_results = pd.DataFrame(combined, index=pd.Index(model_ids, name=id_key))
+        return combined_results
+
+    def rank(self, main_metric, aggregation_method=default_pars.selection_pars_aggregation_method):
+        """Return current ranking of models.
+
+        Parameters
+        ----------
+        main_metric : str
+            Name of the main metric (the one that has to be maximized).
+        aggregation_method : str
+            Aggregation method to use to combine evaluations of different folds (e.g. 'mean').
+
+        Returns
+        -------
+        sorted_results : pd.DataFrame
+            Combined results of models executed so far, sorted in descending value of 'main_metric'.
+
+        """
+        return rank_models(self.get_combined_results(aggregation_method=aggregation_method), main_metric)
 
 
 def combine_fold_results(results, aggregation_method=default_pars.selection_pars_aggregation_method):
@@ -16,13 +172,12 @@ def combine_fold_results(results, aggregation_method=default_pars.selection_pars
     metrics = common.get_metrics_from_results(results)
 
     # Combine results for all folds using a certain aggregation method (e.g. mean).
-    metrics_agg = {col: aggregation_method for col in metrics}
+    combined_results = results.groupby(id_key)[metrics].agg(aggregation_method)
 
     # For columns that do not need to be combined, simply take first (since they are identical for all folds).
     other_columns = [approach_key, pars_key]
-    other_columns_agg = {col: 'first' for col in other_columns}
-    metrics_agg.update(other_columns_agg)
-    combined_results = results.groupby(id_key).agg(metrics_agg)
+    first_rows = results.drop_duplicates(subset=id_key).set_index(id_key)[other_columns]
+    combined_results = combined_results.join(first_rows)
     return combined_results
 
 
@@ -34,14 +189,28 @@ def rank_models(combined_results, main_metric):
 def apply_condition_to_dataframe(df, condition=default_pars.selection_pars_condition):
     selection = np.ones(len(df), dtype=bool)
     if condition is not None:
-        selection = eval(condition)
+        selection = expressions.evaluate_condition(df, condition)
     df_selected = df[selection].copy()
     return df_selected
 
 
+def _combine_selected_results(results, aggregation_method, results_condition, leaderboard):
+    if (leaderboard is not None) and (results_condition is None) and \
+            (aggregation_method in leaderboard_aggregation_methods):
+        # Combine results of different folds from the running aggregates.
+        combined_results = leaderboard.get_combined_results(aggregation_method=aggregation_method)
+    else:
+        # Apply conditions to results of individual folds.
+        results_selected = apply_condition_to_dataframe(results, results_condition)
+        # Combine results of different folds.
+        combined_results = combine_fold_results(results_selected, aggregation_method=aggregation_method)
+    return combined_results
+
+
 def model_selection(results, main_metric, aggregation_method=default_pars.selection_pars_aggregation_method,
                     results_condition=default_pars.selection_pars_results_condition,
-                    combined_results_condition=default_pars.selection_pars_combined_results_condition):
+                    combined_results_condition=default_pars.selection_pars_combined_results_condition,
+                    leaderboard=None):
     """Model selection.
 
     Take the evaluation of approaches on some folds, and select the best model.
@@ -58,6 +227,9 @@ def model_selection(results, main_metric, aggregation_method=default_pars.select
         Condition to be applied to results dataframe before combining results from different folds.
     combined_results_condition : str
         Condition to be applied to results dataframe after combining results from different folds.
+    leaderboard : Leaderboard or None
+        Running aggregates of results. If given (and if there is no 'results_condition'), results of different folds
+        are combined from the running aggregates instead of grouping the full results dataframe.
 
     Returns
     -------
@@ -66,12 +238,461 @@ def model_selection(results, main_metric, aggregation_method=default_pars.select
         conditions.
 
     """
-    # Apply conditions to results of individual folds.
-    results_selected = apply_condition_to_dataframe(results, results_condition)
-    # Combine results of different folds.
-    combined_results = combine_fold_results(results_selected, aggregation_method=aggregation_method)
+    combined_results = _combine_selected_results(results, aggregation_method=aggregation_method,
+                                                 results_condition=results_condition, leaderboard=leaderboard)
     # Apply conditions to combined results.
     combined_results_selected = apply_condition_to_dataframe(combined_results, combined_results_condition)
     # Create ranking.
     combined_results_sorted = rank_models(combined_results_selected, main_metric=main_metric)
     return combined_results_sorted
+
+
+def _get_objectives(combined_results, metrics, directions):
+    if directions is None:
+        directions = ['max'] * len(metrics)
+    elif isinstance(directions, dict):
+        directions = [directions.get(metric, 'max') for metric in metrics]
+    if len(directions) != len(metrics):
+        raise ValueError("There must be one direction ('max' or 'min') per metric.")
+    objectives = np.empty((len(combined_results), len(metrics)))
+    for j, (metric, direction) in enumerate(zip(metrics, directions)):
+        if direction not in ['max', 'min']:
+            raise ValueError(f"Unknown direction '{direction}' for metric '{metric}' (use 'max' or 'min').")
+        values = combined_results[metric].to_numpy(dtype=float)
+        if direction == 'min':
+            values = -values
+        # Missing values are considered worse than any other value.
+        objectives[:, j] = np.where(np.isnan(values), -np.inf, values)
+    return objectives
+
+
+def _non_dominated_sort_two_objectives(objectives, order):
+    # Points are visited in descending order of the first objective (and then of the second), so a point can only be
+    # dominated by points already assigned to a front. Within a front, the second objective increases as points are
+    # added, so the last point added to a front dominates a new point if and only if any point of that front does.
+    fronts = np.empty(len(objectives), dtype=int)
+    # Negated second objective of the last point added to each front, sorted in ascending order.
+    last_points = []
+    for i in order:
+        key = -objectives[i, 1]
+        # The first front whose last point does not dominate the current point.
+        front = bisect.bisect_right(last_points, key)
+        if front == len(last_points):
+            last_points.append(key)
+        else:
+            last_points[front] = key
+        fronts[i] = front
+    return fronts
+
+
+def _non_dominated_sort_three_objectives(objectives, order):
+    # Points are visited in descending order of the first objective, so a point is dominated by a front if any member
+    # of that front is better or equal in the second and third objectives (a 2D dominance query). For each front, keep
+    # the "staircase" of its members projected onto the second and third objectives (sorted by ascending second
+    # objective, and hence descending third objective), so that queries and insertions are binary searches.
+    fronts = np.empty(len(objectives), dtype=int)
+    staircases_second = []
+    staircases_third = []
+
+    def front_dominates(front, second, third):
+        position = bisect.bisect_left(staircases_second[front], second)
+        return position < len(staircases_second[front]) and staircases_third[front][position] >= third
+
+    for i in order:
+        _, second, third = objectives[i]
+        front = _first_non_dominating_front(len(staircases_second), lambda k: front_dominates(k, second, third))
+        if front == len(staircases_second):
+            staircases_second.append([])
+            staircases_third.append([])
+        # Insert point in the staircase of its front, removing the points that it dominates in the projection.
+        front_second = staircases_second[front]
+        front_third = staircases_third[front]
+        end = bisect.bisect_right(front_second, second)
+        start = end
+        while start > 0 and front_third[start - 1] <= third:
+            start -= 1
+        front_second[start:end] = [second]
+        front_third[start:end] = [third]
+        fronts[i] = front
+    return fronts
+
+
+def _non_dominated_sort_many_objectives(objectives, order):
+    # Points are visited in descending order of the first objective, so a point is dominated by a front if any member
+    # of that front is better or equal in all the other objectives. Dominance of a point by all members of a front is
+    # checked at once, storing members column-wise.
+    fronts = np.empty(len(objectives), dtype=int)
+    other_objectives = np.ascontiguousarray(objectives[:, 1:].T)
+    members = []
+    sizes = []
+
+    def front_dominates(front, point):
+        front_members = members[front][:, :sizes[front]]
+        dominates = front_members[0] >= point[0]
+        for j in range(1, len(point)):
+            dominates &= front_members[j] >= point[j]
+        return dominates.any()
+
+    for i in order:
+        point = other_objectives[:, i]
+        front = _first_non_dominating_front(len(members), lambda k: front_dominates(k, point))
+        if front == len(members):
+            members.append(np.empty((len(point), 16)))
+            sizes.append(0)
+        if sizes[front] == members[front].shape[1]:
+            # Double the capacity of the front.
+            members[front] = np.concatenate([members[front], np.empty_like(members[front])], axis=1)
+        members[front][:, sizes[front]] = point
+        sizes[front] += 1
+        fronts[i] = front
+    return fronts
+
+
+def _first_non_dominating_front(n_fronts, front_dominates):
+    # If a front does not dominate a point, neither does any later front; hence a binary search can be used.
+    low, high = 0, n_fronts
+    while low < high:
+        middle = (low + high) // 2
+        if front_dominates(middle):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def non_dominated_sort(objectives):
+    """Assign each point to a pareto front (where all objectives are to be maximized).
+
+    The first front (front 0) contains all points that are not dominated by any other point. The second front contains
+    the points that are only dominated by points in the first front, and so on. A point dominates another if it is
+    better or equal in all objectives, and strictly better in at least one of them.
+    Points are sorted once and then assigned to fronts with binary searches (efficient non-dominated sort), so that
+    hundreds of thousands of points can be sorted in seconds.
+    Points with any missing (NaN) objective (e.g. of failed executions) do not dominate and are not dominated by other
+    points; they are all assigned to a final front, after the fronts of the other points.
+
+    Parameters
+    ----------
+    objectives : np.array
+        Values of the objectives, with one row per point and one column per objective.
+
+    Returns
+    -------
+    fronts : np.array
+        Front of each of the points.
+
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    if len(objectives) == 0:
+        return np.array([], dtype=int)
+    is_missing = np.isnan(objectives).any(axis=1)
+    if is_missing.any():
+        fronts = np.empty(len(objectives), dtype=int)
+        fronts[~is_missing] = non_dominated_sort(objectives[~is_missing])
+        fronts[is_missing] = fronts[~is_missing].max() + 1 if (~is_missing).any() else 0
+        return fronts
+    # Identical points do not dominate each other, so they belong to the same front. Sort only unique points.
+    unique_objectives, inverse = np.unique(objectives, axis=0, return_inverse=True)
+    # Sort points lexicographically in descending order (np.lexsort uses the last key as the primary one).
+    order = np.lexsort(-unique_objectives[:, ::-1].T)
+    n_objectives = objectives.shape[1]
+    if n_objectives == 1:
+        # With only one objective, each distinct value is a front.
+        unique_fronts = np.empty(len(order), dtype=int)
+        unique_fronts[order] = np.arange(len(order))
+    elif n_objectives == 2:
+        unique_fronts = _non_dominated_sort_two_objectives(unique_objectives, order)
+    elif n_objectives == 3:
+        unique_fronts = _non_dominated_sort_three_objectives(unique_objectives, order)
+    else:
+        unique_fronts = _non_dominated_sort_many_objectives(unique_objectives, order)
+    fronts = unique_fronts[inverse.reshape(-1)]
+    return fronts
+
+
+def crowding_distance(objectives, fronts):
+    """Crowding distance of each point within its front.
+
+    The crowding distance measures how isolated a point is from other points of the same front (the larger, the more
+    isolated). Extreme points of each front have infinite crowding distance. Points with any missing (NaN) objective
+    have crowding distance 0.
+
+    Parameters
+    ----------
+    objectives : np.array
+        Values of the objectives, with one row per point and one column per objective.
+    fronts : np.array
+        Front of each of the points (as returned by non_dominated_sort).
+
+    Returns
+    -------
+    distances : np.array
+        Crowding distance of each of the points.
+
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    fronts = np.asarray(fronts)
+    distances = np.zeros(len(objectives))
+    if len(objectives) == 0:
+        return distances
+    is_missing = np.isnan(objectives).any(axis=1)
+    if is_missing.any():
+        distances[~is_missing] = crowding_distance(objectives[~is_missing], fronts[~is_missing])
+        return distances
+    for j in range(objectives.shape[1]):
+        # Sort points by front and then by the value of the current objective.
+        order = np.lexsort((objectives[:, j], fronts))
+        values = objectives[order, j]
+        sorted_fronts = fronts[order]
+        front_change = sorted_fronts[1:] != sorted_fronts[:-1]
+        is_first = np.concatenate([[True], front_change])
+        is_last = np.concatenate([front_change, [True]])
+        starts = np.flatnonzero(is_first)
+        ends = np.flatnonzero(is_last)
+        # Range of values of the objective within each front.
+        spans = np.repeat(values[ends] - values[starts], ends - starts + 1)
+        gaps = np.zeros(len(values))
+        with np.errstate(invalid='ignore'):
+            gaps[1:-1] = values[2:] - values[:-2]
+            contributions = np.where(np.isfinite(spans) & (spans > 0), gaps / np.where(spans > 0, spans, 1), 0)
+        contributions[is_first | is_last] = np.inf
+        distances[order] += contributions
+    return distances
+
+
+def pareto_model_selection(results, metrics, directions=default_pars.selection_pars_directions,
+                           aggregation_method=default_pars.selection_pars_aggregation_method,
+                           results_condition=default_pars.selection_pars_results_condition,
+                           combined_results_condition=default_pars.selection_pars_combined_results_condition,
+                           leaderboard=None):
+    """Multi-objective model selection, based on pareto fronts.
+
+    Take the evaluation of approaches on some folds, combine the results of different folds, and sort models by pareto
+    front (models in the first front are not dominated by any other model on the given metrics). Models within the
+    same front are sorted by crowding distance (so that models that represent more distinct trade-offs come first), and
+    then by the value of the first metric.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        Evaluations of the performance of approaches on different data folds.
+    metrics : list
+        Names of the metrics to optimize.
+    directions : list or dict or None
+        Direction of each metric, either 'max' (to be maximized) or 'min' (to be minimized), given as a list (with one
+        element per metric) or as a dictionary (metric: direction); None to maximize all metrics.
+    aggregation_method : str
+        Aggregation method to use to combine evaluations of different folds (e.g. 'mean').
+    results_condition : str
+        Condition to be applied to results dataframe before combining results from different folds.
+    combined_results_condition : str
+        Condition to be applied to results dataframe after combining results from different folds.
+    leaderboard : Leaderboard or None
+        Running aggregates of results. If given (and if there is no 'results_condition'), results of different folds
+        are combined from the running aggregates instead of grouping the full results dataframe.
+
+    Returns
+    -------
+    combine_results_sorted : pd.DataFrame
+        Ranking of results of approaches that fulfil the imposed conditions, with additional columns 'front' (pareto
+        front, starting from 0), 'crowding_distance' and 'rank' (position in the ranking, starting from 1).
+
+    """
+    combined_results = _combine_selected_results(results, aggregation_method=aggregation_method,
+                                                 results_condition=results_condition, leaderboard=leaderboard)
+    # Apply conditions to combined results.
+    combined_results_selected = apply_condition_to_dataframe(combined_results, combined_results_condition)
+    # Sort models by pareto front, then by crowding distance, and then by the first metric.
+    objectives = _get_objectives(combined_results_selected, metrics, directions)
+    fronts = non_dominated_sort(objectives)
+    distances = crowding_distance(objectives, fronts)
+    combined_results_selected[front_key] = fronts
+    combined_results_selected[crowding_distance_key] = distances
+    order = np.lexsort((-objectives[:, 0], -distances, fronts)) if len(objectives) > 0 else []
+    combined_results_sorted = combined_results_selected.iloc[order].copy()
+    combined_results_sorted[rank_key] = np.arange(1, len(combined_results_sorted) + 1)
+    return combined_results_sorted
+
+
+def adjust_p_values(p_values, correction=default_pars.selection_pars_correction):
+    """Adjust p-values for multiple comparisons.
+
+    Parameters
+    ----------
+    p_values : np.array
+        Raw p-values.
+    correction : str or None
+        Correction method, namely 'bonferroni', 'holm' (Holm-Bonferroni), or 'fdr_bh' (Benjamini-Hochberg false
+        discovery rate); None to not correct p-values.
+
+    Returns
+    -------
+    p_values_adjusted : np.array
+        Adjusted p-values.
+
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    n_tests = len(p_values)
+    if correction is None or n_tests == 0:
+        return p_values.copy()
+    if correction == 'bonferroni':
+        return np.minimum(p_values * n_tests, 1)
+    order = np.argsort(p_values)
+    sorted_p_values = p_values[order]
+    if correction == 'holm':
+        sorted_adjusted = np.maximum.accumulate(sorted_p_values * (n_tests - np.arange(n_tests)))
+    elif correction == 'fdr_bh':
+        sorted_adjusted = np.minimum.accumulate((sorted_p_values * n_tests / np.arange(1, n_tests + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f"Unknown correction method '{correction}' (use 'bonferroni', 'holm', 'fdr_bh' or None).")
+    p_values_adjusted = np.empty(n_tests)
+    p_values_adjusted[order] = np.minimum(sorted_adjusted, 1)
+    return p_values_adjusted
+
+
+def _paired_test(differences, test):
+    # One-sided paired tests of all rows at once, where the alternative hypothesis is that differences are positive.
+    # Missing differences (e.g. folds that have not been executed) are ignored.
+    n_folds = np.sum(~np.isnan(differences), axis=1)
+    p_values = np.ones(len(differences))
+    if test == 'ttest':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nanmean(differences, axis=1)
+            std = np.nanstd(differences, axis=1, ddof=1)
+            t_statistic = mean / (std / np.sqrt(n_folds))
+            valid = (n_folds > 1) & (std > 0)
+            p_values[valid] = stats.t.sf(t_statistic[valid], n_folds[valid] - 1)
+            # Differences that are all identical and positive are significant (with zero variance).
+            p_values[(n_folds > 1) & (std == 0) & (mean > 0)] = 0
+    elif test == 'wilcoxon':
+        # Rows whose differences are all zero cannot be tested (they are identical to the leader).
+        valid = np.nansum(np.abs(differences), axis=1) > 0
+        if valid.any():
+            p_values[valid] = stats.wilcoxon(differences[valid], axis=1, alternative='greater',
+                                             nan_policy='omit').pvalue
+    else:
+        raise ValueError(f"Unknown test '{test}' (use 'ttest' or 'wilcoxon').")
+    return np.where(np.isnan(p_values), 1, p_values)
+
+
+def significance_test(results, main_metric, test=default_pars.selection_pars_test,
+                      correction=default_pars.selection_pars_correction, alpha=default_pars.selection_pars_alpha,
+                      aggregation_method=default_pars.selection_pars_aggregation_method):
+    """Test which models perform significantly worse than the best model, using paired tests across folds.
+
+    The best model (the leader) is the one with the highest aggregated value of 'main_metric'. Every other model is
+    compared to the leader with a one-sided paired test on the results of the folds they have in common, and p-values
+    are adjusted for multiple comparisons. All models are tested at once (vectorised), so this function can be used on
+    large grids, and also on partial results (e.g. as a racing criterion, to stop executing models that are already
+    significantly worse than the leader).
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        Evaluations of the performance of approaches on different data folds.
+    main_metric : str
+        Name of the main metric (the one that has to be maximized).
+    test : str
+        Paired test, namely 'ttest' (paired t-test) or 'wilcoxon' (Wilcoxon signed-rank test). Note that the
+        Wilcoxon test can only be significant if there are enough folds (e.g. at least 5 folds for alpha = 0.05).
+    correction : str or None
+        Correction method for multiple comparisons (see adjust_p_values).
+    alpha : float
+        Significance level.
+    aggregation_method : str
+        Aggregation method used to find the leader (e.g. 'mean').
+
+    Returns
+    -------
+    tests : pd.DataFrame
+        For each model id, the raw p-value, the adjusted p-value, and whether it is significantly worse than the
+        leader ('dominated'). Models without any result of 'main_metric' are not included.
+
+    """
+    # Create a matrix of results, with one row per model id and one column per fold.
+    fold_results = results.pivot_table(index=id_key, columns=fold_key, values=main_metric, aggfunc='first')
+    if len(fold_results) == 0:
+        # There are no results of the main metric (e.g. all executions failed).
+        return pd.DataFrame({p_value_key: [], p_value_adjusted_key: [], dominated_key: []},
+                            index=fold_results.index).astype({dominated_key: bool})
+    values = fold_results.to_numpy(dtype=float)
+    aggregated = fold_results.agg(aggregation_method, axis=1).to_numpy(dtype=float)
+    leader = np.nanargmax(aggregated)
+    differences = values[leader] - values
+    p_values = _paired_test(differences, test)
+    # The leader is not compared with itself.
+    others = np.arange(len(values)) != leader
+    p_values_adjusted = np.ones(len(values))
+    p_values_adjusted[others] = adjust_p_values(p_values[others], correction=correction)
+    p_values[leader] = 1
+    tests = pd.DataFrame({p_value_key: p_values, p_value_adjusted_key: p_values_adjusted,
+                          dominated_key: p_values_adjusted < alpha}, index=fold_results.index)
+    return tests
+
+
+def significance_model_selection(results, main_metric, test=default_pars.selection_pars_test,
+                                 correction=default_pars.selection_pars_correction,
+                                 alpha=default_pars.selection_pars_alpha,
+                                 drop_dominated=default_pars.selection_pars_drop_dominated,
+                                 aggregation_method=default_pars.selection_pars_aggregation_method,
+                                 results_condition=default_pars.selection_pars_results_condition,
+                                 combined_results_condition=default_pars.selection_pars_combined_results_condition,
+                                 leaderboard=None):
+    """Model selection based on paired statistical tests across folds.
+
+    Take the evaluation of approaches on some folds, combine the results of different folds, and test which models
+    are significantly worse than the best one (see significance_test). Models that cannot be told apart from the best
+    one are ranked first (group 0), and models that are significantly worse (or that have no results of 'main_metric')
+    come next (group 1), or are dropped.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        Evaluations of the performance of approaches on different data folds.
+    main_metric : str
+        Name of the main metric (the one that has to be maximized).
+    test : str
+        Paired test, namely 'ttest' (paired t-test) or 'wilcoxon' (Wilcoxon signed-rank test).
+    correction : str or None
+        Correction method for multiple comparisons, namely 'bonferroni', 'holm', or 'fdr_bh'; None for no correction.
+    alpha : float
+        Significance level.
+    drop_dominated : bool
+        True to drop models that are significantly worse than the best one; False to keep them.
+    aggregation_method : str
+        Aggregation method to use to combine evaluations of different folds (e.g. 'mean').
+    results_condition : str
+        Condition to be applied to results dataframe before combining results from different folds.
+    combined_results_condition : str
+        Condition to be applied to results dataframe after combining results from different folds.
+    leaderboard : Leaderboard or None
+        Running aggregates of results. If given (and if there is no 'results_condition'), results of different folds
+        are combined from the running aggregates instead of grouping the full results dataframe.
+
+    Returns
+    -------
+    combine_results_sorted : pd.DataFrame
+        Ranking of results of approaches that fulfil the imposed conditions (sorted by group, and then in descending
+        value of 'main_metric'), with additional columns 'p_value', 'p_value_adjusted' and 'dominated'.
+
+    """
+    combined_results = _combine_selected_results(results, aggregation_method=aggregation_method,
+                                                 results_condition=results_condition, leaderboard=leaderboard)
+    # Apply conditions to combined results.
+    combined_results_selected = apply_condition_to_dataframe(combined_results, combined_results_condition)
+    # Test only the models that fulfil all conditions.
+    results_selected = apply_condition_to_dataframe(results, results_condition)
+    results_selected = results_selected[results_selected[id_key].isin(combined_results_selected.index)]
+    if len(results_selected) == 0:
+        return combined_results_selected
+    tests = significance_test(results_selected, main_metric, test=test, correction=correction, alpha=alpha,
+                              aggregation_method=aggregation_method)
+    combined_results_selected = combined_results_selected.join(tests)
+    # Models without any result of the main metric (e.g. whose executions all failed) are not tested, and they are
+    # considered worse than the best model.
+    combined_results_selected[dominated_key] = combined_results_selected[dominated_key].fillna(True).astype(bool)
+    if drop_dominated:
+        combined_results_selected = combined_results_selected[~combined_results_selected[dominated_key]]
+    combined_results_sorted = combined_results_selected.sort_values([dominated_key, main_metric],
+                                                                    ascending=[True, False])
+    return combined_results_sorted
@@ -0,0 +1,527 @@
+"""Functions related to the storage of results in a database, that can be shared by several processes (e.g. several
+workers of the same experiment, or different experiments).
+
+Results are stored in a SQLite database (in WAL mode, so that readers do not block writers), with one row per execution
+(i.e. per combination of approach, parameters and fold), identified by its execution key (see caching).
+
+"""
+import ast
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from modev import common
+from modev import default_pars
+from modev import expressions
+
+approach_key = default_pars.approach_key
+executed_key = default_pars.executed_key
+fold_key = default_pars.fold_key
+id_key = default_pars.id_key
+key_key = default_pars.key_key
+pars_key = default_pars.pars_key
+
+# Columns that are not metrics, and name of other internal columns of the table of results.
+_experiment_column = 'experiment'
+_worker_column = 'worker'
+_claimed_until_column = 'claimed_until'
+_fixed_columns = common.non_metrics_columns + [_experiment_column, _worker_column, _claimed_until_column]
+# Columns with information about executions (other than metrics) that are stored only if they exist in results.
+_execution_info_columns = [default_pars.elapsed_key, default_pars.predicted_cost_key, default_pars.status_key]
+_text_columns = [default_pars.status_key]
+# Suffix of the name of the table of information about experiments, and name of its column of information.
+_experiments_table_suffix = '_experiments'
+_info_column = 'info'
+# Maximum number of parameters in a single SQL statement (SQLite's limit is at least 999).
+_max_sql_parameters = 500
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _to_sql_value(value):
+    # Convert numpy scalars (and NaN) to values that SQLite understands.
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        value = None
+    return value
+
+
+def _to_literal(value):
+    # Convert numpy scalars (also inside containers) to Python literals.
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {_to_literal(key): _to_literal(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return type(value)(_to_literal(item) for item in value)
+    return value
+
+
+def _pars_to_sql(pars):
+    # Parameters are stored as a literal-only repr, that is parsed back with ast.literal_eval (and never evaluated).
+    text = repr(_to_literal(pars))
+    try:
+        ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        raise ValueError(f"Parameters {text} cannot be stored: only literals (numbers, strings, booleans, None, and "
+                         f"lists, tuples, sets and dicts of them) are supported.") from None
+    return text
+
+
+def _pars_from_sql(text):
+    return None if text is None else ast.literal_eval(text)
+
+
+def get_worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+class SQLiteResultsStore:
+    def __init__(self, path, experiment=default_pars.storage_pars_experiment, lease=default_pars.storage_pars_lease,
+                 timeout=default_pars.storage_pars_timeout, table=default_pars.storage_table):
+        """Results of experiments stored in a SQLite database, that can be written and queried concurrently by many
+        processes.
+
+        Each row of the table of results corresponds to one execution of an experiment. Processes add the executions
+        of their grid as pending rows, claim a row before executing it (so that no other process executes it at the
+        same time), and write its metrics (marking it as executed) in a transaction.
+
+        Parameters
+        ----------
+        path : str
+            Path to database file (it will be created if it does not exist).
+        experiment : str
+            Name of the experiment; several experiments can be stored in the same database.
+        lease : float or None
+            Seconds after which a claim of an execution expires (so that executions claimed by a process that crashed
+            can be claimed by another process); None for claims that never expire.
+        timeout : float
+            Seconds to wait for the database to be unlocked by other processes before raising an error.
+        table : str
+            Name of the table of results.
+
+        Methods
+        -------
+        add_results
+            Add executions (either pending or executed) to the table.
+        claim
+            Claim an execution, so that no other process executes it.
+        read
+            Read results (optionally only those that fulfil a condition, which is evaluated by the database).
+
+        """
+        self.path = path
+        self.experiment = experiment
+        self.lease = lease
+        self.timeout = timeout
+        self.table = table
+        # Connections cannot be shared between processes (or used by several threads at the same time), so each thread
+        # of each process opens its own connection.
+        self._connections = {}
+        self._columns = None
+
+    def __repr__(self):
+        return f"SQLiteResultsStore({self.path!r}, experiment={self.experiment!r})"
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connections'] = {}
+        return state
+
+    def _get_connection(self):
+        owner = (os.getpid(), threading.get_ident())
+        if owner not in self._connections:
+            # Transactions are handled explicitly (autocommit mode otherwise).
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+            table = _quote(self.table)
+            connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({_quote(_experiment_column)} TEXT NOT NULL, '
+                               f'{_quote(key_key)} TEXT NOT NULL, {_quote(pars_key)} TEXT, '
+                               f'{_quote(approach_key)} TEXT, {_quote(id_key)} INTEGER, {_quote(fold_key)} INTEGER, '
+                               f'{_quote(executed_key)} INTEGER NOT NULL DEFAULT 0, {_quote(_worker_column)} TEXT, '
+                               f'{_quote(_claimed_until_column)} REAL, '
+                               f'PRIMARY KEY ({_quote(_experiment_column)}, {_quote(key_key)}))')
+            connection.execute(f'CREATE TABLE IF NOT EXISTS {_quote(self.table + _experiments_table_suffix)} '
+                               f'({_quote(_experiment_column)} TEXT PRIMARY KEY, {_quote(_info_column)} TEXT)')
+            for column in [key_key, approach_key, id_key, fold_key, executed_key]:
+                self._create_index(connection, column)
+            self._connections[owner] = connection
+            self._columns = None
+        return self._connections[owner]
+
+    def _create_index(self, connection, column):
+        index = _quote(f'{self.table}_{column}_index')
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {_quote(self.table)} ({_quote(column)})')
+
+    def _get_columns(self, refresh=False):
+        if self._columns is None or refresh:
+            cursor = self._get_connection().execute(f'PRAGMA table_info({_quote(self.table)})')
+            self._columns = [row[1] for row in cursor.fetchall()]
+        return self._columns
+
+    def get_metrics(self):
+        return [column for column in self._get_columns(refresh=True) if column not in _fixed_columns]
+
+    def get_execution_info_columns(self):
+        return [column for column in _execution_info_columns if column in self._get_columns(refresh=True)]
+
+    def _add_columns(self, connection, columns):
+        # This must be called inside a write transaction, so that no other process adds the same columns meanwhile.
+        new_columns = [column for column in columns if column not in self._get_columns(refresh=True)]
+        for column in new_columns:
+            column_type = 'TEXT' if column in _text_columns else 'REAL'
+            connection.execute(f'ALTER TABLE {_quote(self.table)} ADD COLUMN {_quote(column)} {column_type}')
+            self._create_index(connection, column)
+        if len(new_columns) > 0:
+            self._get_columns(refresh=True)
+
+    def _transaction(self, function, *args):
+        connection = self._get_connection()
+        # Take the write lock from the start, to avoid deadlocks between processes that read and then write.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            output = function(connection, *args)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return output
+
+    def _add_results(self, connection, results):
+        metrics = common.get_metrics_from_results(results)
+        info_columns = [column for column in _execution_info_columns if column in results.columns]
+        self._add_columns(connection, metrics + info_columns)
+        columns = [key_key, pars_key, approach_key, id_key, fold_key, executed_key] + metrics + info_columns
+        placeholders = ', '.join(['?'] * (len(columns) + 1))
+        table = _quote(self.table)
+        columns_sql = ', '.join(_quote(column) for column in [_experiment_column] + columns)
+        # Pending executions are only added if they do not exist (except for their predicted cost, which is updated);
+        # executed ones also update existing pending rows.
+        updates = ', '.join(f'{_quote(column)} = excluded.{_quote(column)}'
+                            for column in [executed_key] + metrics + info_columns)
+        if default_pars.predicted_cost_key in info_columns:
+            pending_action = (f'DO UPDATE SET {_quote(default_pars.predicted_cost_key)} = '
+                              f'excluded.{_quote(default_pars.predicted_cost_key)} '
+                              f'WHERE {table}.{_quote(executed_key)} = 0')
+        else:
+            pending_action = 'DO NOTHING'
+        executed = results[executed_key].astype(bool).to_numpy()
+        rows = []
+        for values in zip(*[results[column].tolist() for column in columns]):
+            values = list(values)
+            values[1] = _pars_to_sql(values[1])
+            values[5] = int(bool(values[5]))
+            rows.append([self.experiment] + [_to_sql_value(value) for value in values])
+        connection.executemany(f'INSERT INTO {table} ({columns_sql}) VALUES ({placeholders}) '
+                               f'ON CONFLICT ({_quote(_experiment_column)}, {_quote(key_key)}) {pending_action}',
+                               [row for row, row_executed in zip(rows, executed) if not row_executed])
+        connection.executemany(f'INSERT INTO {table} ({columns_sql}) VALUES ({placeholders}) '
+                               f'ON CONFLICT ({_quote(_experiment_column)}, {_quote(key_key)}) DO UPDATE SET '
+                               f'{updates}, {_quote(_claimed_until_column)} = NULL '
+                               f'WHERE {table}.{_quote(executed_key)} = 0',
+                               [row for row, row_executed in zip(rows, executed) if row_executed])
+
+    def add_results(self, results):
+        """Add executions to the table of results, in a single transaction.
+
+        Executions that are not executed are added as pending (if they are not already in the table). Executions that
+        are executed are added with their metrics (or, if they are pending in the table, marked as executed).
+
+        Parameters
+        ----------
+        results : pd.DataFrame
+            Results, with the usual columns (pars, approach, id, fold, executed, metrics, and execution key). Parameters
+            must be literals (numbers, strings, booleans, None, and containers of them).
+
+        Raises
+        ------
+        ValueError
+            If some parameters are not literals.
+
+        """
+        self._transaction(self._add_results, results)
+
+    def _claim(self, connection, key, worker, now):
+        claimed_until = None if self.lease is None else now + self.lease
+        cursor = connection.execute(
+            f'UPDATE {_quote(self.table)} SET {_quote(_worker_column)} = ?, {_quote(_claimed_until_column)} = ? '
+            f'WHERE {_quote(_experiment_column)} = ? AND {_quote(key_key)} = ? AND {_quote(executed_key)} = 0 AND '
+            f'({_quote(_worker_column)} IS NULL OR {_quote(_worker_column)} = ? OR '
+            f'{_quote(_claimed_until_column)} < ?)', (worker, claimed_until, self.experiment, key, worker, now))
+        return cursor.rowcount == 1
+
+    def claim(self, key, worker=None):
+        """Claim an execution, so that no other process executes it (until it is executed or the claim expires).
+
+        Parameters
+        ----------
+        key : str
+            Execution key.
+        worker : str or None
+            Name of the worker claiming the execution; None to use a name based on host, process and thread.
+
+        Returns
+        -------
+        claimed : bool
+            True if the execution was claimed; False if it was already executed or claimed by another worker.
+
+        """
+        if worker is None:
+            worker = get_worker_name()
+        return self._transaction(self._claim, key, worker, time.time())
+
+    def _reset(self, connection, keys):
+        metrics = self.get_metrics()
+        resets = ', '.join(f'{_quote(column)} = NULL' for column in [_worker_column, _claimed_until_column] + metrics)
+        for start in range(0, len(keys), _max_sql_parameters):
+            chunk = keys[start:start + _max_sql_parameters]
+            connection.execute(f'UPDATE {_quote(self.table)} SET {_quote(executed_key)} = 0, {resets} '
+                               f'WHERE {_quote(_experiment_column)} = ? AND '
+                               f'{_quote(key_key)} IN ({", ".join(["?"] * len(chunk))})', [self.experiment] + chunk)
+
+    def reset(self, keys):
+        """Mark executions of the experiment as pending (removing their metrics), so that they are executed again.
+
+        Parameters
+        ----------
+        keys : list
+            Execution keys.
+
+        """
+        self._transaction(self._reset, list(keys))
+
+    def read(self, condition=None, keys=None, executed_only=False, all_experiments=False):
+        """Read results from the database.
+
+        Parameters
+        ----------
+        condition : str or None
+            Condition to select results (e.g. "(df['approach'] == 'dummy_predictor') & (df['accuracy'] > 0.5)"), that
+            is translated into SQL and evaluated by the database; None to read all results.
+        keys : list or None
+            Execution keys of results to read; None to read results of any key.
+        executed_only : bool
+            True to read only results that have been executed.
+        all_experiments : bool
+            True to read results of all experiments in the database (in which case, the same execution key may appear
+            more than once); False to read only results of the experiment of the store.
+
+        Returns
+        -------
+        results : pd.DataFrame
+            Results, with the usual columns (pars, approach, id, fold, executed, metrics, and execution key).
+
+        """
+        metrics = self.get_metrics()
+        info_columns = self.get_execution_info_columns()
+        columns = [pars_key, approach_key, id_key, fold_key, executed_key] + metrics + [key_key] + info_columns
+        filters = []
+        parameters = []
+        if not all_experiments:
+            filters.append(f'{_quote(_experiment_column)} = ?')
+            parameters.append(self.experiment)
+        if executed_only:
+            filters.append(f'{_quote(executed_key)} = 1')
+        if condition is not None:
+            sql, condition_columns = expressions.condition_to_sql(condition)
+            missing = sorted(condition_columns - set(columns), key=str)
+            if len(missing) > 0:
+                raise KeyError(f"Columns {missing} used in condition {condition!r} not found in results.")
+            filters.append(sql)
+        query = f'SELECT {", ".join(_quote(column) for column in columns)} FROM {_quote(self.table)}'
+        chunks = [None] if keys is None else [list(keys[start:start + _max_sql_parameters])
+                                             for start in range(0, len(keys), _max_sql_parameters)]
+        rows = []
+        connection = self._get_connection()
+        for chunk in chunks:
+            chunk_filters = filters.copy()
+            chunk_parameters = parameters.copy()
+            if chunk is not None:
+                chunk_filters.append(f'{_quote(key_key)} IN ({", ".join(["?"] * len(chunk))})')
+                chunk_parameters.extend(chunk)
+            chunk_query = query
+            if len(chunk_filters) > 0:
+                chunk_query += ' WHERE ' + ' AND '.join(chunk_filters)
+            rows.extend(connection.execute(chunk_query + ' ORDER BY rowid', chunk_parameters).fetchall())
+        results = pd.DataFrame(rows, columns=columns)
+        results[pars_key] = [_pars_from_sql(pars) for pars in results[pars_key]]
+        results[executed_key] = results[executed_key].astype(bool)
+        numeric_columns = metrics + [column for column in info_columns if column not in _text_columns]
+        results[numeric_columns] = results[numeric_columns].astype(float)
+        return results
+
+    def _claim_next(self, connection, worker, now, experiments):
+        table = _quote(self.table)
+        # Claim executions with the largest predicted cost first (if costs were predicted), to reduce the time until
+        # all executions are finished.
+        order = 'rowid'
+        if default_pars.predicted_cost_key in self._get_columns(refresh=True):
+            order = f'{_quote(default_pars.predicted_cost_key)} DESC, rowid'
+        claimed_until = None if self.lease is None else now + self.lease
+        row = connection.execute(
+            f'SELECT rowid, {_quote(_experiment_column)}, {_quote(key_key)} FROM {table} WHERE '
+            f'{_quote(_experiment_column)} IN ({", ".join(["?"] * len(experiments))}) AND {_quote(executed_key)} = 0 '
+            f'AND ({_quote(_worker_column)} IS NULL OR {_quote(_claimed_until_column)} < ?) ORDER BY {order} LIMIT 1',
+            list(experiments) + [now]).fetchone()
+        if row is None:
+            return None
+        connection.execute(f'UPDATE {table} SET {_quote(_worker_column)} = ?, {_quote(_claimed_until_column)} = ? '
+                           f'WHERE rowid = ?', (worker, claimed_until, row[0]))
+        return row[1], row[2]
+
+    def claim_next(self, worker=None, experiments=None):
+        """Claim the next pending execution (that is not claimed by another worker, or whose claim has expired).
+
+        Parameters
+        ----------
+        worker : str or None
+            Name of the worker claiming the execution; None to use a name based on host, process and thread.
+        experiments : list or None
+            Names of experiments whose executions can be claimed; None to claim only executions of the experiment of
+            the store.
+
+        Returns
+        -------
+        claimed : tuple or None
+            Experiment and execution key of the claimed execution; None if there are no pending executions.
+
+        """
+        if worker is None:
+            worker = get_worker_name()
+        if experiments is None:
+            experiments = [self.experiment]
+        if len(experiments) == 0:
+            return None
+        return self._transaction(self._claim_next, worker, time.time(), experiments)
+
+    def heartbeat(self, key, worker=None):
+        """Extend the claim of an execution (to be called periodically while executing it).
+
+        Parameters
+        ----------
+        key : str
+            Execution key.
+        worker : str or None
+            Name of the worker that claimed the execution; None to use a name based on host, process and thread.
+
+        Returns
+        -------
+        extended : bool
+            True if the claim was extended; False if the execution is not claimed by this worker anymore (e.g. if
+            the claim expired and another worker claimed it).
+
+        """
+        if worker is None:
+            worker = get_worker_name()
+        claimed_until = None if self.lease is None else time.time() + self.lease
+        cursor = self._get_connection().execute(
+            f'UPDATE {_quote(self.table)} SET {_quote(_claimed_until_column)} = ? '
+            f'WHERE {_quote(_experiment_column)} = ? AND {_quote(key_key)} = ? AND {_quote(_worker_column)} = ? '
+            f'AND {_quote(executed_key)} = 0',
+            (claimed_until, self.experiment, key, worker))
+        return cursor.rowcount == 1
+
+    def count_pending(self, keys=None):
+        """Count executions of the experiment that have not been executed yet.
+
+        Parameters
+        ----------
+        keys : list or None
+            Execution keys to consider; None to consider all executions of the experiment.
+
+        Returns
+        -------
+        n_pending : int
+            Number of pending executions.
+
+        """
+        pending = self.read(keys=keys, condition=f"{executed_key} == False")
+        return len(pending)
+
+    def _remove_pending(self, connection, keys):
+        table = _quote(self.table)
+        stored_keys = [row[0] for row in connection.execute(
+            f'SELECT {_quote(key_key)} FROM {table} WHERE {_quote(_experiment_column)} = ? AND '
+            f'{_quote(executed_key)} = 0', (self.experiment,)).fetchall()]
+        removed_keys = sorted(set(stored_keys) - set(keys))
+        for start in range(0, len(removed_keys), _max_sql_parameters):
+            chunk = removed_keys[start:start + _max_sql_parameters]
+            connection.execute(f'DELETE FROM {table} WHERE {_quote(_experiment_column)} = ? AND '
+                               f'{_quote(key_key)} IN ({", ".join(["?"] * len(chunk))})', [self.experiment] + chunk)
+        return len(removed_keys)
+
+    def remove_pending(self, keys):
+        """Remove pending executions of the experiment, except those with the given keys (e.g. executions of a
+        previous version of the grid, that should not be executed anymore).
+
+        Parameters
+        ----------
+        keys : list
+            Execution keys of pending executions to keep.
+
+        Returns
+        -------
+        n_removed : int
+            Number of removed executions.
+
+        """
+        return self._transaction(self._remove_pending, list(keys))
+
+    def set_experiment_info(self, info):
+        """Store information about the experiment (e.g. to be read by workers).
+
+        Parameters
+        ----------
+        info : dict
+            Information that can be serialised as json.
+
+        """
+        self._get_connection().execute(
+            f'INSERT OR REPLACE INTO {_quote(self.table + _experiments_table_suffix)} '
+            f'({_quote(_experiment_column)}, {_quote(_info_column)}) VALUES (?, ?)',
+            (self.experiment, json.dumps(info, sort_keys=True)))
+
+    def get_experiments_info(self):
+        rows = self._get_connection().execute(
+            f'SELECT {_quote(_experiment_column)}, {_quote(_info_column)} FROM '
+            f'{_quote(self.table + _experiments_table_suffix)}').fetchall()
+        return {experiment: json.loads(info) for experiment, info in rows}
+
+    def get_experiment_info(self):
+        row = self._get_connection().execute(
+            f'SELECT {_quote(_info_column)} FROM {_quote(self.table + _experiments_table_suffix)} '
+            f'WHERE {_quote(_experiment_column)} = ?', (self.experiment,)).fetchone()
+        return {} if row is None else json.loads(row[0])
+
+    def for_experiment(self, experiment):
+        """Get a store of the same database for another experiment.
+
+        Parameters
+        ----------
+        experiment : str
+            Name of the experiment.
+
+        Returns
+        -------
+        results_store : SQLiteResultsStore
+            Store for the given experiment.
+
+        """
+        return SQLiteResultsStore(self.path, experiment=experiment, lease=self.lease, timeout=self.timeout,
+                                  table=self.table)
+
+    def close(self):
+        connection = self._connections.pop((os.getpid(), threading.get_ident()), None)
+        if connection is not None:
+            connection.close()
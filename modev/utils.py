@@ -2,8 +2,11 @@
 
 """
 import importlib
+import inspect
 import logging
 import os
+import sys
+import types
 
 
 def get_usable_args_for_function(function, args, function_args=None):
@@ -19,6 +22,58 @@ def get_usable_args_for_function(function, args, function_args=None):
     return usable_args
 
 
+class LazyModule(types.ModuleType):
+    def __init__(self, name):
+        """Module that is imported on first attribute access (to avoid importing heavy modules until they are used).
+
+        Parameters
+        ----------
+        name : str
+            Full name of module (e.g. 'scipy.stats').
+
+        """
+        super().__init__(name)
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """Import a module lazily.
+
+    Parameters
+    ----------
+    name : str
+        Full name of module (e.g. 'scipy.stats').
+
+    Returns
+    -------
+    module : module or LazyModule
+        Module, if it was already imported; otherwise, a LazyModule that imports it on first attribute access.
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def function_accepts_argument(function, argument):
+    try:
+        parameters = inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+    return argument in parameters
+
+
 def import_file_as_module(file_path, module_name=None):
     if module_name is None:
         module_name = os.path.basename(file_path).split('.')[0]
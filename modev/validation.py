@@ -1,10 +1,17 @@
 """Functions related to the validation process, e.g. k-fold or temporal-fold cross-validation.
 
 """
+import hashlib
+from collections.abc import Mapping
+
 import numpy as np
-from sklearn.model_selection import train_test_split, StratifiedKFold, KFold
+import pandas as pd
 
+from modev import common
 from modev import default_pars
+from modev import utils
+
+model_selection = utils.lazy_import('sklearn.model_selection')
 
 dev_key = default_pars.dev_key
 playground_key = default_pars.playground_key
@@ -50,9 +57,9 @@ def k_folds_split(raw_indexes, n_splits, labels=default_pars.validation_pars_lab
         random_state = None
     # Split a data set into n parts without overlap, and optionally stratified.
     if labels is None:
-        split_method = KFold
+        split_method = model_selection.KFold
     else:
-        split_method = StratifiedKFold
+        split_method = model_selection.StratifiedKFold
     parts = list(split_method(n_splits=n_splits, random_state=random_state, shuffle=shuffle).
                  split(raw_indexes_array, labels))
     if return_original_indexes:
@@ -145,8 +152,17 @@ def one_set_n_sets_split(data, test_fraction, test_n_sets, first_set_name, secon
     # The new train will be a fraction 1 - 'test_fraction' of the raw dataset.
     # If labels are given, the splitting will be stratified (otherwise random).
     if test_fraction > 0:
-        primary_split = train_test_split(indexes[first_set_name + '_0'], test_size=test_fraction, stratify=labels,
-                                         random_state=random_state, shuffle=shuffle)
+        test_labels = None
+        if labels is None:
+            primary_split = model_selection.train_test_split(indexes[first_set_name + '_0'], test_size=test_fraction,
+                                                             stratify=labels, random_state=random_state,
+                                                             shuffle=shuffle)
+        else:
+            # Split labels too, so that test sets can also be stratified.
+            primary_split = model_selection.train_test_split(indexes[first_set_name + '_0'], np.asarray(labels),
+                                                             test_size=test_fraction, stratify=labels,
+                                                             random_state=random_state, shuffle=shuffle)
+            test_labels = primary_split[3]
         indexes[f'{first_set_name}_0'] = primary_split[0]
         indexes[f'{second_set_name}_0'] = primary_split[1]
 
@@ -155,14 +171,71 @@ def one_set_n_sets_split(data, test_fraction, test_n_sets, first_set_name, secon
         # Again, if labels are given, the splitting will be stratified (otherwise random).
         # For convenience, use 'k_folds_split' for this task (and then ignore train parts).
         if test_n_sets > 1:
-            test_split = k_folds_split(indexes[f'{second_set_name}_0'], test_n_sets, labels=labels, shuffle=shuffle,
-                                       random_state=random_state)
+            test_split = k_folds_split(indexes[f'{second_set_name}_0'], test_n_sets, labels=test_labels,
+                                       shuffle=shuffle, random_state=random_state)
             # Disregard the zeroth part (which is meant for training), and keep the non-overlapping part.
             indexes.update({f'{second_set_name}_{i}': fold[1] for i, fold in enumerate(test_split)})
 
     return indexes
 
 
+def _get_positions(data_index, labels):
+    if isinstance(data_index, pd.RangeIndex) and data_index.start == 0 and data_index.step == 1:
+        # Labels coincide with positions, so there is no need to look them up.
+        return common.Positions(labels)
+    positions = data_index.get_indexer(labels)
+    if np.any(positions < 0):
+        raise KeyError("Some indexes were not found in the index of the data.")
+    return common.Positions(positions)
+
+
+def to_positional_indexes(data, train_indexes, test_indexes):
+    """Convert indexes (labels of the data index) of train and test sets into integer positions of rows.
+
+    Positions are stored as int32 arrays (when possible), so that rows can be selected with data.iloc, without looking
+    up labels in the index. Train sets that contain all examples of a common population (e.g. the playground) except
+    those in the test set of the same fold (as in k-fold cross-validation) are stored as the complement of that test set
+    in a bitmask shared by all folds. Hence, the memory taken by k train sets is about one bit per row of the data.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Indexed data (e.g. a dataframe whose index can be accessed with data.index).
+    train_indexes : dict
+        Indexes to use for training on the different k folds.
+    test_indexes : dict
+        Indexes to use for evaluating (either dev or test) on the different k folds.
+
+    Returns
+    -------
+    train_positions : dict
+        Positions (common.Positions or common.ComplementPositions) to use for training on the different k folds.
+    test_positions : dict
+        Positions (common.Positions) to use for evaluating (either dev or test) on the different k folds.
+
+    """
+    test_positions = {fold: _get_positions(data.index, test_indexes[fold]) for fold in test_indexes}
+    train_positions = {fold: _get_positions(data.index, train_indexes[fold]) for fold in train_indexes}
+    common_folds = [fold for fold in train_positions if fold in test_positions]
+    if len(common_folds) == 0:
+        return train_positions, test_positions
+
+    # The population is the union of train and test sets of the first fold.
+    first_fold = common_folds[0]
+    mask = np.zeros(len(data), dtype=bool)
+    mask[train_positions[first_fold].get_positions()] = True
+    mask[test_positions[first_fold].get_positions()] = True
+    population_size = int(mask.sum())
+    population_bits = np.packbits(mask)
+    for fold in common_folds:
+        train, test = train_positions[fold].get_positions(), test_positions[fold].get_positions()
+        # The train set is the complement of the test set if both together cover the population without overlapping.
+        if (len(train) + len(test) == population_size) and mask[train].all() and mask[test].all() and \
+                (len(np.unique(np.concatenate([train, test]))) == population_size):
+            train_positions[fold] = common.ComplementPositions(population_bits, population_size, test_positions[fold])
+    return train_positions, test_positions
+
+
 def _split_train_and_test_indexes(indexes, test_mode):
     if test_mode:
         train_indexes = {int(group.split('_')[-1]): indexes[group] for group in indexes
@@ -184,7 +257,8 @@ def k_fold_playground_n_tests_split(data, playground_n_folds=default_pars.valida
                                     labels=default_pars.validation_pars_labels,
                                     shuffle=default_pars.validation_pars_shuffle,
                                     random_state=default_pars.random_state,
-                                    test_mode=default_pars.validation_pars_test_mode):
+                                    test_mode=default_pars.validation_pars_test_mode,
+                                    positional=default_pars.validation_pars_positional):
     """Generate indexes that split data into a playground (with k folds) and n test sets.
 
     There is only one playground, which contains train and dev sets, and has no overlap with test sets.
@@ -210,6 +284,8 @@ def k_fold_playground_n_tests_split(data, playground_n_folds=default_pars.valida
         Random state for shuffling; Ignored if 'shuffle' is False (in which case, 'random_state' can be set to None).
     test_mode : bool
         True to return indexes of the test set; False to return indexes of the dev set.
+    positional : bool
+        True to return integer positions of rows (see to_positional_indexes); False to return labels of the data index.
 
     Returns
     -------
@@ -235,19 +311,230 @@ def k_fold_playground_n_tests_split(data, playground_n_folds=default_pars.valida
     indexes.update({f'{train_key}_{i}': part[0] for i, part in enumerate(playground_split)})
     indexes.update({f'{dev_key}_{i}': part[1] for i, part in enumerate(playground_split)})
 
-    assert validate_indexes(indexes)
+    _check_valid_indexes(indexes)
 
     train_indexes, test_indexes = _split_train_and_test_indexes(indexes, test_mode)
+    if positional:
+        train_indexes, test_indexes = to_positional_indexes(data, train_indexes, test_indexes)
 
     return train_indexes, test_indexes
 
 
+class RepeatedFoldsGenerator:
+    def __init__(self, playground, n_splits, n_repeats, dev_fraction=default_pars.validation_pars_dev_fraction,
+                 labels=default_pars.validation_pars_labels, random_state=default_pars.random_state,
+                 positional=default_pars.validation_pars_positional):
+        """Generator of folds of repeated k-fold (or Monte Carlo) cross-validation, that creates folds on demand.
+
+        Each fold is described by (seed, repeat, split), where fold = repeat * n_splits + split, and it is regenerated
+        deterministically from that description when needed, instead of being stored. Only the folds of the last repeat
+        used are kept in memory, so memory does not grow with the number of repeats.
+
+        Parameters
+        ----------
+        playground : np.array
+            Indexes of the playground (labels of the data index, or integer positions of rows if 'positional' is True).
+        n_splits : int
+            Number of folds in each repeat.
+        n_repeats : int
+            Number of repeats.
+        dev_fraction : float or None
+            If None, each repeat is a k-fold split (with 'n_splits' non-overlapping dev sets). Otherwise, each fold of
+            each repeat is an independent random split (Monte Carlo cross-validation), where a fraction 'dev_fraction'
+            of the playground is used as dev set.
+        labels : np.array or None
+            Labels of the playground examples, to stratify folds; None to not stratify.
+        random_state : int or None
+            Random state (seed) of all repeats.
+        positional : bool
+            True if 'playground' contains integer positions of rows (and then folds are returned as common.Positions).
+
+        Methods
+        -------
+        get_train
+            Return indexes of the train set of a fold.
+        get_dev
+            Return indexes of the dev set of a fold.
+
+        """
+        self.playground = playground
+        self.n_splits = n_splits
+        self.n_repeats = n_repeats
+        self.dev_fraction = dev_fraction
+        self.labels = labels
+        # If no random state is given, fix one, so that the same fold is always regenerated identically.
+        self.seed = np.random.SeedSequence(random_state).entropy
+        self.positional = positional
+        # Repeat whose dev sets are cached, and those dev sets, assigned together (so that threads that generate folds
+        # concurrently never see the dev sets of one repeat paired with another repeat).
+        self._cached = (None, None)
+
+    def get_description(self):
+        playground_hash = hashlib.sha1(pd.util.hash_array(np.asarray(self.playground)).view(np.uint8)).hexdigest()
+        labels_hash = None
+        if self.labels is not None:
+            labels_hash = hashlib.sha1(pd.util.hash_array(np.asarray(self.labels)).view(np.uint8)).hexdigest()
+        return f"{type(self).__name__}(seed={self.seed}, n_splits={self.n_splits}, n_repeats={self.n_repeats}, " \
+               f"dev_fraction={self.dev_fraction}, positional={self.positional}, playground={playground_hash}, " \
+               f"labels={labels_hash})"
+
+    @property
+    def n_folds(self):
+        return self.n_splits * self.n_repeats
+
+    def _generate_dev_parts(self, repeat):
+        # Positions (within the playground) of the dev sets of all folds of a repeat.
+        n_rows = len(self.playground)
+        rng = np.random.default_rng([self.seed, repeat])
+        if self.dev_fraction is not None:
+            n_dev = int(round(n_rows * self.dev_fraction))
+            if self.labels is None:
+                return [rng.permutation(n_rows)[:n_dev] for _ in range(self.n_splits)]
+            return [model_selection.train_test_split(np.arange(n_rows), test_size=n_dev, stratify=self.labels,
+                                                     random_state=int(rng.integers(np.iinfo(np.int32).max)))[1]
+                    for _ in range(self.n_splits)]
+        if self.labels is None:
+            return np.array_split(rng.permutation(n_rows), self.n_splits)
+        stratified_k_fold = model_selection.StratifiedKFold(n_splits=self.n_splits, shuffle=True,
+                                                            random_state=int(rng.integers(np.iinfo(np.int32).max)))
+        return [part[1] for part in stratified_k_fold.split(np.zeros(n_rows), self.labels)]
+
+    def _get_dev_positions(self, fold):
+        if not 0 <= fold < self.n_folds:
+            raise KeyError(fold)
+        repeat, split = divmod(fold, self.n_splits)
+        cached_repeat, dev_parts = self._cached
+        if repeat != cached_repeat:
+            dev_parts = self._generate_dev_parts(repeat)
+            self._cached = (repeat, dev_parts)
+        return dev_parts[split]
+
+    def _to_indexes(self, positions):
+        indexes = self.playground[positions]
+        return common.Positions(indexes) if self.positional else indexes
+
+    def get_train(self, fold):
+        mask = np.ones(len(self.playground), dtype=bool)
+        mask[self._get_dev_positions(fold)] = False
+        return self._to_indexes(np.flatnonzero(mask))
+
+    def get_dev(self, fold):
+        return self._to_indexes(np.sort(self._get_dev_positions(fold)))
+
+
+class LazyFolds(Mapping):
+    def __init__(self, n_folds, get_fold, description=None):
+        """Mapping of folds (e.g. {0: np.array([...]), 1: np.array([...])}) whose indexes are generated on demand.
+
+        Parameters
+        ----------
+        n_folds : int
+            Number of folds.
+        get_fold : function
+            Function that takes a fold and returns its indexes.
+        description : str or None
+            Description that uniquely identifies the content of all folds (e.g. to compare splits without generating
+            all folds); None if there is no such description.
+
+        """
+        self.n_folds = n_folds
+        self.get_fold = get_fold
+        self.description = description
+
+    def __getitem__(self, fold):
+        return self.get_fold(fold)
+
+    def __iter__(self):
+        return iter(range(self.n_folds))
+
+    def __len__(self):
+        return self.n_folds
+
+    def __repr__(self):
+        return f"LazyFolds(n_folds={self.n_folds})"
+
+
+def repeated_k_fold_playground_n_tests_split(data, playground_n_folds=default_pars.validation_pars_playground_n_folds,
+                                             n_repeats=default_pars.validation_pars_n_repeats,
+                                             dev_fraction=default_pars.validation_pars_dev_fraction,
+                                             test_fraction=default_pars.validation_pars_test_fraction,
+                                             test_n_sets=default_pars.validation_pars_test_n_sets,
+                                             labels=default_pars.validation_pars_labels,
+                                             random_state=default_pars.random_state,
+                                             test_mode=default_pars.validation_pars_test_mode,
+                                             positional=default_pars.validation_pars_positional):
+    """Generate indexes that split data into a playground (with repeated k folds) and n test sets.
+
+    There is only one playground, which has no overlap with test sets. The playground is split 'n_repeats' times into k
+    folds (with a different shuffling each time), so there are 'n_repeats' * k folds (e.g. for k = 4, folds 0 to 3
+    belong to the first repeat, folds 4 to 7 to the second, and so on). Alternatively, if 'dev_fraction' is given,
+    each fold is an independent random split of the playground (Monte Carlo cross-validation).
+    Folds are not stored: they are regenerated deterministically when they are accessed (see RepeatedFoldsGenerator).
+    Hence, memory and time spent by this function do not grow with the number of repeats.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Indexed data (e.g. a dataframe whose index can be accessed with data.index).
+    playground_n_folds : int
+        Number of folds in each repeat (also called 'k').
+    n_repeats : int
+        Number of repeats.
+    dev_fraction : float or None
+        Fraction of the playground to use as dev set in each fold of Monte Carlo cross-validation; None to use k-fold
+        cross-validation in each repeat.
+    test_fraction : float
+        Fraction of data to use for test sets.
+    test_n_sets : int
+        Number of test sets.
+    labels : list or None
+        Labels to stratify data according to their distribution; None to not stratify data.
+    random_state : int or None
+        Random state for shuffling.
+    test_mode : bool
+        True to return indexes of the test set; False to return indexes of the dev set.
+    positional : bool
+        True to return integer positions of rows (see to_positional_indexes); False to return labels of the data index.
+
+    Returns
+    -------
+    train_indexes : dict or LazyFolds
+        Indexes to use for training on the different folds.
+    test_indexes : dict or LazyFolds
+        Indexes to use for evaluating (either dev or test) on the different folds.
+
+    """
+    indexes = one_set_n_sets_split(data=data, test_fraction=test_fraction, test_n_sets=test_n_sets,
+                                   first_set_name=playground_key, second_set_name=test_key,
+                                   labels=labels, shuffle=True, random_state=random_state)
+    if test_mode:
+        train_indexes, test_indexes = _split_train_and_test_indexes(indexes, test_mode)
+        if positional:
+            train_indexes, test_indexes = to_positional_indexes(data, train_indexes, test_indexes)
+        return train_indexes, test_indexes
+
+    playground = indexes[playground_key + '_0']
+    playground_labels = None
+    if labels is not None:
+        playground_labels = pd.Series(np.asarray(labels), index=data.index).loc[playground].to_numpy()
+    if positional:
+        playground = _get_positions(data.index, playground).get_positions()
+    generator = RepeatedFoldsGenerator(playground, n_splits=playground_n_folds, n_repeats=n_repeats,
+                                       dev_fraction=dev_fraction, labels=playground_labels, random_state=random_state,
+                                       positional=positional)
+    description = generator.get_description()
+    train_indexes = LazyFolds(generator.n_folds, generator.get_train, description=f'train: {description}')
+    test_indexes = LazyFolds(generator.n_folds, generator.get_dev, description=f'dev: {description}')
+    return train_indexes, test_indexes
+
+
 def temporal_fold_playground_n_tests_split(data,
                                            min_n_train_examples=default_pars.validation_min_n_train_examples,
                                            dev_n_sets=default_pars.validation_dev_n_sets,
                                            test_fraction=default_pars.validation_pars_test_fraction,
                                            test_n_sets=default_pars.validation_pars_test_n_sets,
-                                           test_mode=default_pars.validation_pars_test_mode):
+                                           test_mode=default_pars.validation_pars_test_mode,
+                                           positional=default_pars.validation_pars_positional):
     """Generate indexes that split data into a playground (with temporal folds) and n test sets.
 
     There is only one playground, which contains train and dev sets, and has no overlap with test sets.
@@ -274,6 +561,8 @@ def temporal_fold_playground_n_tests_split(data,
         Number of test sets.
     test_mode : bool
         True to return indexes of the test set; False to return indexes of the dev set.
+    positional : bool
+        True to return integer positions of rows (see to_positional_indexes); False to return labels of the data index.
 
     Returns
     -------
@@ -296,16 +585,291 @@ def temporal_fold_playground_n_tests_split(data,
     indexes.update({f'{train_key}_{i}': part[0] for i, part in enumerate(playground_split)})
     indexes.update({f'{dev_key}_{i}': part[1] for i, part in enumerate(playground_split)})
 
-    assert validate_indexes(indexes)
+    _check_valid_indexes(indexes)
 
     train_indexes, test_indexes = _split_train_and_test_indexes(indexes, test_mode)
+    if positional:
+        train_indexes, test_indexes = to_positional_indexes(data, train_indexes, test_indexes)
+
+    return train_indexes, test_indexes
+
+
+def _to_time_delta(value, times):
+    if value is None:
+        return None
+    if np.issubdtype(times.dtype, np.datetime64):
+        # Time deltas can be given, e.g., as strings ('30D') or as pd.Timedelta.
+        return pd.Timedelta(value).to_timedelta64()
+    return value
+
+
+def temporal_window_folds_split(sorted_times, min_n_train_examples, dev_n_sets, n_rows=None,
+                                train_window=default_pars.validation_pars_train_window,
+                                gap=default_pars.validation_pars_gap):
+    """Find the boundaries of temporal folds on a sorted array of timestamps.
+
+    The first 'min_n_train_examples' examples (and any later example with the same timestamp as the last of them) are
+    reserved for the first train set. The remaining examples are split into 'dev_n_sets' consecutive dev sets of
+    approximately equal size (boundaries are moved so that examples with the same timestamp are never split between two
+    sets, and so that no dev set is empty). The train set of each fold contains the examples prior to its dev
+    set, optionally only within a sliding window of length 'train_window', and optionally excluding the examples within
+    a 'gap' (embargo) before the start of the dev set.
+    All boundaries are found at once with a binary search (np.searchsorted) on the timestamps.
+
+    Parameters
+    ----------
+    sorted_times : np.array
+        Timestamps (or any sortable numbers) of the examples, sorted in ascending order.
+    min_n_train_examples : int
+        Minimum number of examples in the first train set.
+    dev_n_sets : int
+        Number of temporal folds.
+    n_rows : int or None
+        Number of examples to split (the first 'n_rows' of 'sorted_times'); None to split all examples.
+    train_window : time delta or None
+        Length of the sliding window of each train set (e.g. '365D' if timestamps are dates); None to use all previous
+        examples (expanding window).
+    gap : time delta or None
+        Length of the gap between the end of each train set and the start of its dev set; None for no gap.
+
+    Returns
+    -------
+    parts : list
+        K different parts (folds). Each part contains a tuple with:
+        (slice of train set for this part, slice of dev set for this part)
+
+    Raises
+    ------
+    ValueError
+        If, because of repeated timestamps (or a sliding window or gap), fewer than 'dev_n_sets' folds have non-empty
+        train and dev sets.
 
+    """
+    if n_rows is None:
+        n_rows = len(sorted_times)
+    # Move the start of the first dev set forward, past all examples with the same timestamp as the last example of the
+    # first train set (so that the first train set has at least min_n_train_examples).
+    first_boundary = 0
+    if min_n_train_examples > 0:
+        first_boundary = int(np.searchsorted(sorted_times, sorted_times[min(min_n_train_examples, n_rows) - 1],
+                                             side='right'))
+    first_boundary = min(first_boundary, n_rows)
+    raw_boundaries = np.linspace(first_boundary, n_rows, dev_n_sets + 1).astype(int)
+    # Move the other boundaries back to the first example with the same timestamp, or forward (past all examples with
+    # that timestamp) if moving back would empty the previous dev set.
+    safe_boundaries = np.minimum(raw_boundaries, len(sorted_times) - 1)
+    lefts = np.minimum(np.searchsorted(sorted_times, sorted_times[safe_boundaries], side='left'), n_rows)
+    rights = np.minimum(np.searchsorted(sorted_times, sorted_times[safe_boundaries], side='right'), n_rows)
+    boundaries = [first_boundary]
+    for fold in range(1, dev_n_sets):
+        boundary = lefts[fold] if lefts[fold] > boundaries[-1] else rights[fold]
+        boundaries.append(max(boundary, boundaries[-1]))
+    boundaries.append(n_rows)
+    boundaries = np.array(boundaries)
+    dev_starts_times = sorted_times[np.minimum(boundaries[:-1], len(sorted_times) - 1)]
+    train_window = _to_time_delta(train_window, sorted_times)
+    gap = _to_time_delta(gap, sorted_times)
+    if gap is None:
+        train_ends = boundaries[:-1]
+    else:
+        train_ends = np.minimum(np.searchsorted(sorted_times, dev_starts_times - gap, side='left'), boundaries[:-1])
+    if train_window is None:
+        train_starts = np.zeros(dev_n_sets, dtype=int)
+    else:
+        train_window_starts = (dev_starts_times - gap if gap is not None else dev_starts_times) - train_window
+        train_starts = np.searchsorted(sorted_times, train_window_starts, side='left')
+    # Drop folds whose train or dev set is empty.
+    parts = [(slice(train_starts[fold], train_ends[fold]), slice(boundaries[fold], boundaries[fold + 1]))
+             for fold in range(dev_n_sets)
+             if train_ends[fold] > train_starts[fold] and boundaries[fold + 1] > boundaries[fold]]
+    if len(parts) < dev_n_sets:
+        raise ValueError(f"Only {len(parts)} of {dev_n_sets} temporal folds have non-empty train and dev sets (e.g. "
+                         f"because of repeated timestamps, or a short train window or long gap); use fewer folds.")
+    return parts
+
+
+def temporal_window_playground_n_tests_split(data, time_column,
+                                             min_n_train_examples=default_pars.validation_min_n_train_examples,
+                                             dev_n_sets=default_pars.validation_dev_n_sets,
+                                             train_window=default_pars.validation_pars_train_window,
+                                             gap=default_pars.validation_pars_gap,
+                                             test_fraction=default_pars.validation_pars_test_fraction,
+                                             test_n_sets=default_pars.validation_pars_test_n_sets,
+                                             test_mode=default_pars.validation_pars_test_mode,
+                                             positional=default_pars.validation_pars_positional):
+    """Generate indexes that split data (sorted by a time column) into a playground (with temporal folds) and n test
+    sets.
+
+    Data is sorted by 'time_column' (unless it is already sorted). The last 'test_fraction' of the examples are split
+    into 'test_n_sets' consecutive test sets, and the rest is the playground. The playground is split into 'dev_n_sets'
+    temporal folds (see temporal_window_folds_split), where train sets can have a sliding window and a gap before
+    their dev sets.
+    Boundaries of all sets are found with binary searches, and all sets are views (slices) of one array of sorted
+    indexes, so that even hundreds of folds are cheap to generate and store.
+    Note: Since sets are valid by construction (and, with a sliding window, the earliest examples may not belong to any
+    set), indexes are not checked with validate_indexes.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Indexed data (e.g. a dataframe whose index can be accessed with data.index).
+    time_column : str
+        Name of column with the timestamp of each example.
+    min_n_train_examples : int
+        Minimum number of examples in the first train set.
+    dev_n_sets : int
+        Number of temporal folds.
+    train_window : time delta or None
+        Length of the sliding window of each train set (e.g. '365D' if timestamps are dates); None to use all previous
+        examples (expanding window).
+    gap : time delta or None
+        Length of the gap (embargo) between the end of each train set and the start of its dev set; None for no gap.
+    test_fraction : float
+        Fraction of data to use for test sets.
+    test_n_sets : int
+        Number of test sets.
+    test_mode : bool
+        True to return indexes of the test set; False to return indexes of the dev set.
+    positional : bool
+        True to return integer positions of rows (see to_positional_indexes); False to return labels of the data index.
+
+    Returns
+    -------
+    train_indexes : dict
+        Indexes to use for training on the different k folds, e.g. for 10 folds:
+        {0: np.array([...]), 1: np.array([...]), ..., 10: np.array([...])}.
+    test_indexes : dict
+        Indexes to use for evaluating (either dev or test) on the different k folds, e.g. for 10 folds and if test_mode
+        is False:
+        {0: np.array([...]), 1: np.array([...]), ..., 10: np.array([...])}.
+
+    """
+    times = data[time_column].to_numpy()
+    if len(times) > 1 and np.all(times[1:] >= times[:-1]):
+        order = None
+        sorted_times = times
+    else:
+        order = np.argsort(times, kind='stable')
+        sorted_times = times[order]
+    if positional:
+        sorted_indexes = np.arange(len(data), dtype=np.int32) if order is None else order.astype(np.int32)
+    else:
+        sorted_indexes = data.index.to_numpy()
+        if order is not None:
+            sorted_indexes = sorted_indexes[order]
+
+    # The playground is made of the earliest examples, and test sets of the latest.
+    n_playground = len(times) - int(round(len(times) * test_fraction))
+    if 0 < n_playground < len(times):
+        n_playground = int(np.searchsorted(sorted_times, sorted_times[n_playground], side='left'))
+    test_boundaries = np.linspace(n_playground, len(times), test_n_sets + 1).astype(int)
+    test_parts = [slice(test_boundaries[i], test_boundaries[i + 1]) for i in range(test_n_sets)]
+
+    if test_mode:
+        playground_part = temporal_window_folds_split(sorted_times, n_playground, 1, n_rows=len(times),
+                                                      train_window=train_window, gap=gap)[0][0]
+        train_parts = {0: playground_part}
+        test_parts = dict(enumerate(test_parts))
+    else:
+        playground_split = temporal_window_folds_split(sorted_times, min_n_train_examples, dev_n_sets,
+                                                       n_rows=n_playground, train_window=train_window, gap=gap)
+        train_parts = {fold: part[0] for fold, part in enumerate(playground_split)}
+        test_parts = {fold: part[1] for fold, part in enumerate(playground_split)}
+
+    def get_indexes(part):
+        # Slicing returns a view of the array of sorted indexes (not a copy).
+        indexes = sorted_indexes[part]
+        return common.Positions(indexes) if positional else indexes
+
+    train_indexes = {fold: get_indexes(train_parts[fold]) for fold in train_parts}
+    test_indexes = {fold: get_indexes(test_parts[fold]) for fold in test_parts}
     return train_indexes, test_indexes
 
 
+def _collect_indexes(indexes, prefix):
+    return {int(key.split('_')[-1]): np.asarray(indexes[key]) for key in indexes if key.startswith(f'{prefix}_')}
+
+
+def _concatenate(arrays):
+    return np.concatenate(arrays) if len(arrays) > 0 else np.array([], dtype=int)
+
+
+def _count_rows_failing_checks_with_masks(playground, train, dev, test, lowest, size):
+    # Count how many times each index appears in each kind of set, using positions relative to the lowest index.
+    def count(arrays):
+        counts = np.zeros(size, dtype=np.int64)
+        for array in arrays:
+            counts += np.bincount(array - lowest, minlength=size)
+        return counts
+
+    in_playground = count([playground]) > 0
+    in_train = count(train.values()) > 0
+    dev_counts = count(dev.values())
+    test_counts = count(test.values())
+    n_train_dev_overlap = 0
+    for fold in dev:
+        if fold in train:
+            n_train_dev_overlap += int(np.count_nonzero(np.bincount(train[fold] - lowest, minlength=size)
+                                                        [dev[fold] - lowest]))
+    report = {'playground_coverage': int(np.count_nonzero(in_playground != (in_train | (dev_counts > 0)))),
+              'train_test_overlap': int(np.count_nonzero(in_train & (test_counts > 0))),
+              'train_dev_overlap': n_train_dev_overlap,
+              'dev_sets_overlap': int(np.sum(dev_counts[dev_counts > 1] - 1)),
+              'test_sets_overlap': int(np.sum(test_counts[test_counts > 1] - 1))}
+    return report
+
+
+def _sorted_unique(array):
+    sorted_array = np.sort(array)
+    if len(sorted_array) == 0:
+        return sorted_array
+    is_new = np.empty(len(sorted_array), dtype=bool)
+    is_new[0] = True
+    np.not_equal(sorted_array[1:], sorted_array[:-1], out=is_new[1:])
+    return sorted_array[is_new]
+
+
+def _is_in_sorted(values, sorted_unique):
+    if len(sorted_unique) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_unique, values), len(sorted_unique) - 1)
+    return sorted_unique[positions] == values
+
+
+def _count_rows_failing_checks_with_sorting(playground, train, dev, test):
+    # Compare sorted arrays of unique indexes (which works for indexes of any type).
+    playground_unique = _sorted_unique(playground)
+    train_unique = _sorted_unique(_concatenate(list(train.values())))
+    dev_all = _concatenate(list(dev.values()))
+    dev_unique = _sorted_unique(dev_all)
+    test_all = _concatenate(list(test.values()))
+    test_unique = _sorted_unique(test_all)
+    n_train_dev_overlap = 0
+    for fold in dev:
+        if fold in train:
+            n_train_dev_overlap += int(np.count_nonzero(_is_in_sorted(dev[fold], np.sort(train[fold]))))
+    union_unique = _sorted_unique(np.concatenate([train_unique, dev_unique]))
+    n_common = int(np.count_nonzero(_is_in_sorted(playground_unique, union_unique)))
+    report = {'playground_coverage': len(playground_unique) + len(union_unique) - 2 * n_common,
+              'train_test_overlap': int(np.count_nonzero(_is_in_sorted(test_unique, train_unique))),
+              'train_dev_overlap': n_train_dev_overlap,
+              'dev_sets_overlap': len(dev_all) - len(dev_unique),
+              'test_sets_overlap': len(test_all) - len(test_unique)}
+    return report
+
+
 def validate_indexes(indexes):
     """Check that indexes fulfil some criteria (e.g. that playground and test set do not overlap).
 
+    The checks are:
+    * 'playground_coverage': The set of playground examples coincides with the union of all train and dev sets.
+    * 'train_test_overlap': Train sets and test sets do not overlap.
+    * 'train_dev_overlap': For each of the folds in playground, train and dev sets do not overlap.
+    * 'dev_sets_overlap': There is no overlap among dev sets.
+    * 'test_sets_overlap': There is no overlap among test sets.
+    Checks are vectorised: integer indexes that span a compact range are counted with boolean masks, and any other
+    indexes are compared as sorted arrays. Hence this function can be used on tens of millions of rows.
+
     Parameters
     ----------
     indexes : dict
@@ -313,43 +877,28 @@ def validate_indexes(indexes):
 
     Returns
     -------
-    checks : bool
-        True if all checks are fulfilled; False otherwise.
+    report : dict
+        Number of rows that fail each of the checks (all of them are zero if indexes are valid).
 
     """
-    # For convenience, collect all indexes in lists.
-    train_indexes = []
-    dev_indexes = []
-    test_indexes = []
-    for key in indexes:
-        if key.startswith(f'{train_key}_'):
-            train_indexes.extend(indexes[key])
-        elif key.startswith(f'{dev_key}_'):
-            dev_indexes.extend(indexes[key])
-        elif key.startswith(f'{test_key}_'):
-            test_indexes.extend(indexes[key])
-
-    # Since there can be repetition among indexes in train sets, take unique.
-    train_indexes = np.unique(train_indexes)
-
-    # Validations that need to be passed:
-    checks = True
-
-    # The set of playground examples coincides with the union of all train and dev sets.
-    checks &= set(indexes[playground_key + '_0']) == (set(train_indexes) | set(dev_indexes))
-
-    # Train indexes and test indexes do not overlap.
-    checks &= (set(train_indexes) & set(test_indexes)) == set()
-
-    # For each of the folds in playground, train and dev do not overlap.
-    folds = [int(key.split('_')[-1]) for key in indexes if key.startswith(f'{dev_key}_')]
-    for fold in folds:
-        checks &= ((set(indexes[f'{train_key}_{fold}']) & set(indexes[f'{dev_key}_{fold}'])) == set())
-
-    # There is no overlap among dev sets.
-    checks &= len(dev_indexes) == len(np.unique(dev_indexes))
-
-    # There is no overlap among test sets.
-    checks &= len(test_indexes) == len(np.unique(test_indexes))
-
-    return checks
+    playground = np.asarray(indexes.get(playground_key + '_0', np.array([], dtype=int)))
+    train = _collect_indexes(indexes, train_key)
+    dev = _collect_indexes(indexes, dev_key)
+    test = _collect_indexes(indexes, test_key)
+
+    arrays = [playground] + list(train.values()) + list(dev.values()) + list(test.values())
+    non_empty_arrays = [array for array in arrays if len(array) > 0]
+    if len(non_empty_arrays) > 0 and all(np.issubdtype(array.dtype, np.integer) for array in non_empty_arrays):
+        lowest = int(min(array.min() for array in non_empty_arrays))
+        size = int(max(array.max() for array in non_empty_arrays)) - lowest + 1
+        # Use masks only if they are not much larger than the arrays of indexes themselves.
+        if size <= 4 * max(len(playground) + sum(len(array) for array in test.values()), 1):
+            return _count_rows_failing_checks_with_masks(playground, train, dev, test, lowest, size)
+    return _count_rows_failing_checks_with_sorting(playground, train, dev, test)
+
+
+def _check_valid_indexes(indexes):
+    report = validate_indexes(indexes)
+    failed_checks = {check: n_rows for check, n_rows in report.items() if n_rows > 0}
+    if len(failed_checks) > 0:
+        raise ValueError(f"Invalid indexes (number of rows failing each check): {failed_checks}")
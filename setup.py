@@ -25,8 +25,12 @@ setuptools.setup(
         'pandas',
         'plotly',
         'scikit-learn',
+        'scipy',
         'tqdm',
     ],
+    entry_points={
+        'console_scripts': ['modev=modev.cli:main'],
+    },
     include_package_data=True,
     package_data={'modev': ['data/*.csv']},
     python_requires='>=3.6',